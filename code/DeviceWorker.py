@@ -1,13 +1,17 @@
 from random import getrandbits
+from threading import Thread
 from time import sleep
 from traceback import format_exception
 from os import path
-from typing import Union
+from typing import Union, Tuple, Callable, Dict, List
 
 from model.TaskWorker import TaskWorker
-from utils.filesystem_config import FilesystemConfig
+from model.ITask import ITask
+from utils.apkutils import select_splits, get_incompatibility, ApkMetadata
+from utils.device_apk_cache import DeviceApkCache
 
-from utils.shellutils import adb_shell, shell, adb_pull, adb_logcat_dump, adb_logcat_clear
+from utils.shellutils import adb_shell, adb_exec_out, adb_logcat_dump, adb_logcat_clear, adb_install, \
+    adb_clear_app_data, adb_install_remote, adb_install_multiple, adb_getprop
 
 
 __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
@@ -19,9 +23,25 @@ class DeviceWorker(TaskWorker):
     EXT_STORAGE_DATA = '/storage/emulated/0/Android/data'
     LOGCAT_HEADER = 'LOGCAT DUMP:\n'
 
+    # device properties
+    PROP_ABI_LIST = 'ro.product.cpu.abilist'
+    PROP_ABI = 'ro.product.cpu.abi'
+    PROP_DENSITY = 'ro.sf.lcd_density'
+    PROP_DENSITY_EMULATOR = 'qemu.sf.lcd_density'
+    PROP_SDK = 'ro.build.version.sdk'
+
+    # streamed installs are supported since Android 7.0
+    MIN_SDK_STREAMING = 24
+    OPT_STREAMING = '--streaming'
+
+    # ways to bring an installed app back into a clean state
+    RESET_CLEAR_DATA = 'clear_data'
+    RESET_REINSTALL = 'reinstall'
+
     def __init__(self, group=None, target=None, name="DeviceProcess", args=(), kwargs={},
                  control_channel=None, queue=None, report_queue=None, device_id = None,
-                 artist_package='saarland.cispa.artist.artistgui', artist_activity='ArtistMainActivity'):
+                 artist_package='saarland.cispa.artist.artistgui', artist_activity='ArtistMainActivity',
+                 device_pool: Dict[str, Dict[str, str]]=None):
         super(DeviceWorker, self).__init__(group, target, name, args, kwargs,
                                            control_channel, queue, report_queue, device_id)
 
@@ -35,20 +55,48 @@ class DeviceWorker(TaskWorker):
         self.artist_package = artist_package
         self.artist_activity = artist_activity
 
-    # do not quit unless there are no more tasks
+        # system properties of all devices that process the same queue: device id -> properties.
+        # Used to hand tasks this device cannot process to another device
+        self.device_pool = device_pool if device_pool is not None else dict()
+        # system properties of the device, read on first use unless they are known from the pool
+        self.device_properties = self.device_pool.get(device_id)
+
+        # apks on the device, so they do not need to be transferred again for (re)installations. Created in run, since
+        # the cache holds a lock and the worker is pickled when processes are started with spawn or forkserver
+        self.apk_cache = None
+        # set to False once the adb client or the device rejected a streamed install
+        self.streaming_supported = True
+
+        self.staging_thread = None
+        # log entries of the staging thread, added to the regular log after the thread finished
+        self.staging_log = list()
+        # host path of the apk that staging pushed for the next task, until it is installed
+        self.staged_apk = None
+
+    def run(self) -> None:
+        self.set_apk_cache(DeviceApkCache(self.device_id))
+        super(DeviceWorker, self).run()
+
+    def set_apk_cache(self, apk_cache: DeviceApkCache) -> None:
+        self.apk_cache = apk_cache
+
+    # do not quit while tasks are outstanding, other workers might still hand tasks back to the queue
     def keepalive_condition(self) -> bool:
-        return not self.tasks.empty()
+        return not self.tasks.empty() or self.next_task is not None
 
     ### logcat dumping
 
     # clear logcat so a later dump only captures the relevant entries
-    def start_subtask(self, subtask: str) -> None:
+    def start_subtask(self, subtask: str, clear_logcat: bool=True) -> None:
+        # cleared before the subtask starts, so the duration of the subtask does not include it
+        if clear_logcat:
+            adb_logcat_clear(device=self.device_id)
         super(DeviceWorker, self).start_subtask(subtask)
-        adb_logcat_clear(device=self.device_id)
 
     # add logcat dumping
     def conclude_subtask(self, success, include_logcat=False) -> None:
-        # before concluding subtask, add logcat dump to the log
+        # the duration of the subtask is measured before dumping logcat to its log
+        super(DeviceWorker, self).conclude_subtask(success)
         if include_logcat:
             log = self.subtask_log[self.current_subtask]
             try:
@@ -63,7 +111,224 @@ class DeviceWorker(TaskWorker):
                 log.append(dump)
             else:
                 log.append('<could not dump logcat>')
-        super(DeviceWorker, self).conclude_subtask(success)
+
+    ### device properties
+
+    def get_device_properties(self) -> Dict[str, str]:
+        """
+        :return: all system properties of the device, obtained with a single getprop call and cached afterwards
+        """
+        if self.device_properties is None:
+            (success, properties) = adb_getprop(device=self.device_id)
+            if not success:
+                self.log('Could not read the device properties.')
+                # do not cache the failure
+                return properties
+            self.device_properties = properties
+        return self.device_properties
+
+    def get_abis(self) -> Union[List[str], None]:
+        """
+        :return: the ABIs supported by the device in order of preference, or None if unknown
+        """
+        return DeviceWorker.parse_abis(self.get_device_properties())
+
+    def get_sdk_level(self) -> Union[int, None]:
+        """
+        :return: the API level of the device, or None if unknown
+        """
+        return DeviceWorker.parse_sdk_level(self.get_device_properties())
+
+    def get_density(self) -> Union[int, None]:
+        """
+        :return: the screen density of the device in dpi, or None if unknown
+        """
+        properties = self.get_device_properties()
+        density = properties.get(DeviceWorker.PROP_DENSITY, properties.get(DeviceWorker.PROP_DENSITY_EMULATOR))
+        try:
+            return int(density) if density else None
+        except ValueError:
+            return None
+
+    @staticmethod
+    def parse_abis(properties: Dict[str, str]) -> Union[List[str], None]:
+        abi_list = properties.get(DeviceWorker.PROP_ABI_LIST, properties.get(DeviceWorker.PROP_ABI))
+        return [abi.strip() for abi in abi_list.split(',') if abi.strip()] if abi_list else None
+
+    @staticmethod
+    def parse_sdk_level(properties: Dict[str, str]) -> Union[int, None]:
+        try:
+            return int(properties.get(DeviceWorker.PROP_SDK))
+        except (TypeError, ValueError):
+            return None
+
+    ### device compatibility
+
+    def get_incompatibility(self, metadata: Union[ApkMetadata, None], device_id: Union[str, None]=None) \
+            -> Union[str, None]:
+        """
+        Checks an app against the properties of a device without touching the device.
+        :param metadata: the metadata of the app's (base) apk or None if unknown
+        :param device_id: a device of the pool or None for this worker's device
+        :return: the reason why the app cannot be installed on the device or None if it can (or if this is unknown)
+        """
+        if device_id is None or device_id == self.device_id:
+            properties = self.get_device_properties()
+        else:
+            properties = self.device_pool.get(device_id, dict())
+        return get_incompatibility(metadata, DeviceWorker.parse_abis(properties),
+                                   DeviceWorker.parse_sdk_level(properties))
+
+    def route_task(self, task: ITask, metadata: Union[ApkMetadata, None]) -> bool:
+        """
+        Hands a task this device cannot process to the other devices, if one of them can process it. Each device
+        hands a task back at most once, so tasks that are taken again by a device that rejected them before (e.g.,
+        because the compatible devices finished already) are not routed again.
+        :param task: the current task
+        :param metadata: the metadata of the app's (base) apk
+        :return: whether the task was handed back to the queue
+        """
+        if self.device_id in task.get_rejected_devices():
+            return False
+        compatible = [device_id for device_id in self.device_pool.keys()
+                      if device_id != self.device_id and device_id not in task.get_rejected_devices()
+                      and self.get_incompatibility(metadata, device_id) is None]
+        if len(compatible) == 0:
+            return False
+        self.log('Handing ' + task.get_package() + ' to a compatible device, e.g., ' + compatible[0])
+        task.reject(self.device_id)
+        self.defer_task(task)
+        return True
+
+    ### apk staging and installation
+
+    def stage_apk_async(self, resolve: Callable[[], Union[str, None]]) -> None:
+        """
+        Push an apk to the device apk cache in the background while the worker keeps using the device, so that a later
+        install_apk does not need to transfer the apk anymore.
+        :param resolve: provides the host path of the apk to stage (or None), invoked in the background as well
+        """
+        self.wait_for_staging()
+        self.staging_thread = Thread(target=self.stage_apk, args=(resolve,), daemon=True)
+        self.staging_thread.start()
+
+    def stage_apk(self, resolve: Callable[[], Union[str, None]]) -> bool:
+        """
+        Push an apk to the apk cache on the device.
+        :param resolve: provides the host path of the apk to stage (or None)
+        :return: whether the apk is staged
+        """
+        try:
+            app_path = resolve()
+            if app_path is None:
+                return False
+            if self.apk_cache.lookup(app_path) is not None:
+                self.staging_log.append('Apk ' + app_path + ' is cached on the device already.')
+                return True
+            (remote_path, cache_out) = self.apk_cache.add(app_path)
+            self.staging_log.append('Staging ' + app_path + ' ' + ('succeeded' if remote_path else 'failed') + ':')
+            self.staging_log.append(cache_out)
+            if remote_path is not None:
+                self.staged_apk = app_path
+            return remote_path is not None
+        except Exception as e:
+            self.staging_log.append('Encountered exception during apk staging: ')
+            self.staging_log.append(''.join(format_exception(None, e, e.__traceback__)))
+            return False
+
+    def wait_for_staging(self) -> None:
+        """
+        Block until the current staging thread (if any) finished and adopt its log.
+        """
+        if self.staging_thread is not None:
+            self.staging_thread.join()
+            self.staging_thread = None
+        for entry in self.staging_log:
+            self.log(entry)
+        self.staging_log = list()
+
+    def release_next_task(self) -> None:
+        super(DeviceWorker, self).release_next_task()
+        # the apk staged for the task would otherwise stay on the device until it is evicted from the cache
+        self.wait_for_staging()
+        if self.staged_apk is not None:
+            (removed, remove_out) = self.apk_cache.remove(self.staged_apk)
+            self.log('Removing the staged apk ' + self.staged_apk + ' ' + ('succeeded' if removed else 'failed') + ':')
+            self.log(remove_out)
+            self.staged_apk = None
+
+    def install_apk(self, app_path: str) -> Tuple[bool, str]:
+        """
+        Install an apk on the device. The apk is installed from the device apk cache and added to it if necessary, so
+        later (re)installations of the same apk do not need to transfer it again.
+        :param app_path: the host path of the apk
+        :return: a tuple of the success flag and the collected log output of the installation
+        """
+        self.wait_for_staging()
+        # the staged apk is used now
+        self.staged_apk = None
+        remote_path = self.apk_cache.lookup(app_path)
+        if remote_path is None:
+            (remote_path, cache_out) = self.apk_cache.add(app_path)
+            self.log(cache_out)
+        else:
+            self.log('Installing cached apk ' + remote_path)
+
+        if remote_path is not None:
+            # the install also records the use of the cached apk on the device
+            (installed, install_out) = adb_install_remote(remote_path, device=self.device_id, touch=True)
+            if installed:
+                return installed, install_out
+            self.log(install_out)
+            self.log('Installing the cached apk failed. Falling back to a regular installation.')
+        return self.install_from_host([app_path])
+
+    def install_from_host(self, app_paths: List[str]) -> Tuple[bool, str]:
+        """
+        Install one apk or several apks of an apk set directly from the host, streaming them to the package manager
+        where the adb client and device support it.
+        :param app_paths: the host paths of the apks, base apk first
+        :return: a tuple of the success flag and the collected log output of the installation
+        """
+        sdk = self.get_sdk_level()
+        streaming = self.streaming_supported and sdk is not None and sdk >= DeviceWorker.MIN_SDK_STREAMING
+        options = [DeviceWorker.OPT_STREAMING] if streaming else list()
+
+        (installed, install_out) = self.adb_install_apks(app_paths, options)
+        if not installed and streaming and DeviceWorker.is_option_rejected(install_out):
+            self.log(install_out)
+            self.log('Streamed installs are not supported. Falling back to regular installs.')
+            self.streaming_supported = False
+            (installed, install_out) = self.adb_install_apks(app_paths, list())
+        return installed, install_out
+
+    def adb_install_apks(self, app_paths: List[str], options: List[str]) -> Tuple[bool, str]:
+        if len(app_paths) == 1:
+            return adb_install(app_paths[0], device=self.device_id, options=options)
+        return adb_install_multiple(app_paths, device=self.device_id, options=options)
+
+    @staticmethod
+    def is_option_rejected(install_out: str) -> bool:
+        """
+        :param install_out: output of a failed installation
+        :return: whether the installation failed because adb or the device did not understand an install option
+        """
+        lowered = str(install_out).lower()
+        return 'unknown option' in lowered or 'unrecognized option' in lowered or 'not supported' in lowered
+
+    def install_apks(self, app_paths: List[str]) -> Tuple[bool, str]:
+        """
+        Install an app that consists of one apk or an apk set. From an apk set, only the splits required by the
+        device are installed.
+        :param app_paths: the host paths of the apks, base apk first
+        :return: a tuple of the success flag and the collected log output of the installation
+        """
+        if len(app_paths) > 1:
+            app_paths = select_splits(app_paths, self.get_abis(), self.get_density())
+            self.log('Selected apks for this device: ' + ', '.join(app_paths))
+        if len(app_paths) == 1:
+            return self.install_apk(app_paths[0])
+        return self.install_from_host(app_paths)
 
     ### on-device testing utils
 
@@ -101,6 +366,29 @@ class DeviceWorker(TaskWorker):
             self.log(''.join(format_exception(None, e, e.__traceback__)))
             return False
 
+    def reset_app(self, app: str, app_paths: List[str], clear_data: bool=True) -> Tuple[bool, str]:
+        """
+        Bring an installed app back into the state of a fresh installation.
+        Clearing the app data is tried first since it avoids transferring the apk to the device again. Reinstalling
+        the app is the fallback in case clearing fails.
+        :param app: the package of the installed app
+        :param app_paths: the apk files to use for reinstalling
+        :param clear_data: whether clearing the app data should be tried before reinstalling
+        :return: the success flag and the reset method that was used (RESET_CLEAR_DATA or RESET_REINSTALL)
+        """
+        if clear_data:
+            (cleared, clear_out) = adb_clear_app_data(app, device=self.device_id)
+            self.log(clear_out)
+            if cleared:
+                self.log('Reset ' + app + ' by clearing its data.')
+                return True, DeviceWorker.RESET_CLEAR_DATA
+            self.log('Clearing the data of ' + app + ' failed. Falling back to reinstallation.')
+
+        (installed, install_out) = self.install_apks(app_paths)
+        self.log(install_out)
+        self.log('Reset ' + app + ' by reinstalling it ' + ('succeeded' if installed else 'failed') + '.')
+        return installed, DeviceWorker.RESET_REINSTALL
+
     def instrument(self, app: str) -> bool:
         """
         Trigger on-device recompilation of an application using an installed ARTist version.
@@ -126,51 +414,34 @@ class DeviceWorker(TaskWorker):
         instrumentation_success = False
 
         # busy wait
-        self.log('Starting busy wait: checking ' + result_path + ' until results appear or timeout occurs.')
-        ls = 'ls ' + result_path
+        self.log('Starting busy wait: reading ' + result_path + ' until results appear or timeout occurs.')
+        # the result file is tiny, so it is read into memory directly instead of pulling it to a temporary file
+        cat = 'cat ' + result_path
         for i in range(0, wait_seconds):
-            # check if file exists
-            (exists, ls_out) = adb_shell(ls, device=self.device_id)
+            (read, result_out) = adb_exec_out(cat, device=self.device_id)
 
-            # not yet done
-            if (not exists) and 'No such file or directory' in ls_out:
+            # not yet done. Checked first since older adb versions do not forward the exit code
+            if 'No such file or directory' in result_out:
                 if i % 10 == 0:
                     self.log(str(i).zfill(4) + ' - ' + app + ' - waiting for instrumentation to finish.')
                 sleep(1)
             # unexpected error, should only occur during debugging (wrong permission etc)
-            elif not exists:
-                self.log('ls command failed. Abort.')
+            elif not read:
+                self.log('Reading the result file failed. Abort.')
                 instrumentation_success = False  # making it explicit
-                self.log(ls_out)
+                self.log(result_out)
                 break
             else:
                 self.log('Found instrumentation result file')
-
-                tmp_result = path.join(FilesystemConfig().get_tmp_dir(), 'ARTIST_RESULT')
-                # (pulled, pulled_out) = shell('adb pull ' + result_path + ' ' + tmp_result)
-                (pulled, pulled_out) = adb_pull(result_path, tmp_result, device=self.device_id)
-                self.log('Pulling instrumentation result file from device '
-                         + ('succeeded' if pulled else 'failed') + ':')
-                self.log(pulled_out)
-
-                if not pulled:
+                lines = result_out.strip().split('\n')
+                result_line = lines[0].strip()
+                self.log('Read "' + result_line + '" from result file.')
+                if result_line == 'true':
+                    self.log('Result file: compilation succeeded!')
+                    instrumentation_success = True
+                else:
+                    self.log('Result file: compilation failed!')
                     instrumentation_success = False
-                    break
-
-                with open(tmp_result, 'r') as result:
-                    result_line = result.readline().strip()
-                    self.log('Read "' + result_line + '" from result file.')
-                    if result_line == 'true':
-                        self.log('Result file: compilation succeeded!')
-                        instrumentation_success = True
-                    else:
-                        self.log('Result file: compilation failed!')
-                        instrumentation_success = False
-
-                # cleanup result file but do not abort if it does not work, just log
-                (cleanup, cleanup_out) = shell('rm ' + tmp_result)
-                self.log('Cleaning the result file ' + ('succeeded' if cleanup else 'failed') + '.')
-                self.log(cleanup_out)
                 break
 
         self.log('Stopping ARTistGUI')
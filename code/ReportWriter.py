@@ -1,13 +1,17 @@
 from multiprocessing import Queue, Value
 from csv import DictWriter
-from os import path
+from os import path, makedirs
 from datetime import datetime
 from typing import List, Tuple, Dict
 
+from analysis.CategoryIndex import CategoryIndex
+from analysis.SummaryReader import SummaryReader
 from model.IResultAnalyzer import IResultAnalyzer
 from model.ITask import ITask
+from model.TaskQueue import TaskQueue
 from model.TaskWorker import TaskWorker
 from utils.filesystem_config import FilesystemConfig
+from utils.progress_counters import ProgressCounters
 
 
 __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
@@ -16,7 +20,7 @@ __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
 class ReportTask(object):
     def __init__(self, completed_task: ITask, worker_log: List[str], success_dict: Dict[str, bool],
                  output_dict: Dict[str, str],
-                 timestamp: int, worker = None):
+                 timestamp: int, worker = None, durations: Dict[str, float] = None):
         super(ReportTask, self).__init__()
 
         self.completed_task = completed_task
@@ -25,6 +29,8 @@ class ReportTask(object):
         self.output_dict = output_dict
         self.timestamp = timestamp
         self.worker = worker
+        # mapping: subtask -> duration in seconds
+        self.durations = durations if durations is not None else dict()
 
 
 # noinspection PyRedeclaration
@@ -35,6 +41,7 @@ class ReportWriter(TaskWorker):
 
     # csv constants
     FILE_SUMMARY_SUFFIX = 'summary.csv'
+    FILE_TIMINGS_SUFFIX = 'timings.csv'
     KEY_PKG = 'Package'
     KEY_CATS = 'Categories'
     KEY_WORKER = 'Worker'
@@ -42,19 +49,28 @@ class ReportWriter(TaskWorker):
     KEY_TIMESTAMP = 'Timestamp'
 
     UNKNOWN_WORKER = 'Unknown Worker'
+    # every run starts with a line of this prefix and the start time of the run, which identifies the run
+    RUN_HEADER_PREFIX = '#' * 3
     CSV_IN_CELL_SEPARATOR = '::'
 
+    # mapping: result interpretation -> progress counter
+    PROGRESS_FIELDS = {IResultAnalyzer.OUT: ProgressCounters.OUTS,
+                       IResultAnalyzer.FAIL: ProgressCounters.FAILS,
+                       IResultAnalyzer.SUCCESS: ProgressCounters.SUCCESSES}
+
     def __init__(self, group=None, target=None, name: str = "DeviceProcess", args=(), kwargs={},  # process args
                  control_channel=None, known_subtasks: List[str] = list(),  # reporter specific args
                  analyzer: IResultAnalyzer = None, eval_name: str = '<Unknown Eval>'):
 
         # cache
         fsc = FilesystemConfig()
-        self.reports_dir = fsc.get_report_dir()
+        # several evaluations can share the out folder, every evaluation reports to its own folder
+        self.reports_dir = ReportWriter.get_reports_dir(eval_name)
         self.results_dir = fsc.get_result_dir()
+        makedirs(self.reports_dir, exist_ok=True)
 
         # this worker generates its own queue
-        queue = Queue(ReportWriter.queue_capacity)
+        queue = TaskQueue(ReportWriter.queue_capacity)
         super(ReportWriter, self).__init__(group, target, name, args, kwargs, control_channel, queue, None,
                                            "report_writer")
 
@@ -69,17 +85,35 @@ class ReportWriter(TaskWorker):
         # csv
         self.csv_keys = [ReportWriter.KEY_PKG, ReportWriter.KEY_CATS] + self.known_subtasks + [ReportWriter.KEY_SUCC] \
                         + [ReportWriter.KEY_WORKER] + [ReportWriter.KEY_TIMESTAMP]
+
+        # results are interpreted as compact records, the way the analyzer reads them back
+        self.record_layout = self.analyzer.get_record_layout()
+
+        # values for statistics, shared with the main process and monitoring tools through a memory-mapped file
+        self.progress = ProgressCounters(ProgressCounters.get_path(self.get_summary_path()), writable=True)
+        # the results of every category, and statistics per category
+        self.category_index = CategoryIndex(self.get_summary_path())
+        self.category_progress = dict()
+        self.seed_progress()
+
+        self.run_id = str(datetime.now().isoformat())
+        run_header = ReportWriter.RUN_HEADER_PREFIX + ' ' + self.run_id + '\n'
+        # the run indices let readers seek to single runs instead of parsing the whole files
+        for csv_path in [self.get_summary_path(), self.get_timings_path()]:
+            SummaryReader.add_run(csv_path, self.run_id, path.getsize(csv_path) if path.isfile(csv_path) else 0)
         with open(self.get_summary_path(), 'a+') as csv_summary:
-            csv_summary.write(('#' * 3) + ' ' + str(datetime.now().isoformat()) + '\n')  # log date
+            csv_summary.write(run_header)  # log date
             header_writer = DictWriter(csv_summary, self.csv_keys, delimiter=';', quotechar='"')
             header_writer.writeheader()
-
-        # values for statistics
-        tested, outs, failures, successes = self.analyzer.get_all()
-        self.tested = len(tested)
-        self.outs = len(outs)
-        self.fails = len(failures)
-        self.successes = len(successes)
+        # subtask durations use the same layout, with seconds instead of success flags and the total duration in the
+        # overall success column
+        with open(self.get_timings_path(), 'a+') as csv_timings:
+            csv_timings.write(run_header)
+            header_writer = DictWriter(csv_timings, self.csv_keys, delimiter=';', quotechar='"')
+            header_writer.writeheader()
+        summary_bytes = path.getsize(self.get_summary_path())
+        self.progress.add(dict(), summary_bytes=summary_bytes)
+        self.category_index.save_counts(self.category_progress, summary_bytes)
 
     # extending the message handling
     def handle_single_message(self, msg: str) -> None:
@@ -117,22 +151,60 @@ class ReportWriter(TaskWorker):
 
         self.write_report(task, overall_success, results, dump=True)
 
+        row_offset = path.getsize(self.get_summary_path())
         result_row = self.update_result(task, overall_success, results)
 
-        interpretation = self.analyzer.interpret(result_row)
-        self.tested += 1
-        if interpretation == IResultAnalyzer.OUT:
-            self.outs += 1
-        elif interpretation == IResultAnalyzer.FAIL:
-            self.fails += 1
-        elif interpretation == IResultAnalyzer.SUCCESS:
-            self.successes += 1
-        else:
-            raise AssertionError('Unknown result interpretation: ' + interpretation)
-        self.print_state()
+        record = self.record_layout.from_dict(self.run_id, result_row)
+        interpretation = self.analyzer.interpret(record)
+        if interpretation not in ReportWriter.PROGRESS_FIELDS:
+            raise AssertionError('Unknown result interpretation: ' + str(interpretation))
+        # categories as read back from the summary
+        categories = record.get_category_names()
+        self.category_index.add(record.package, categories, row_offset, interpretation)
+        for category in categories:
+            CategoryIndex.count_result(self.category_progress, category, interpretation)
+        summary_bytes = path.getsize(self.get_summary_path())
+        self.progress.add({ProgressCounters.TESTED: 1, ReportWriter.PROGRESS_FIELDS[interpretation]: 1},
+                          summary_bytes=summary_bytes)
+        self.category_index.save_counts(self.category_progress, summary_bytes)
+        self.print_state(categories)
 
     ### helper methods
 
+    def seed_progress(self) -> None:
+        """
+        Makes sure the progress counters, the category index and the statistics per category reflect the summary csv.
+        The results are only counted if the counters do not match the csv, e.g., because they were written by an older
+        version or the writer crashed during an update.
+        """
+        summary_path = self.get_summary_path()
+        summary_bytes = path.getsize(summary_path) if path.isfile(summary_path) else 0
+        counters = self.progress.read()
+        if counters is not None and counters[ProgressCounters.SUMMARY_BYTES] == summary_bytes \
+                and self.category_index.exists():
+            category_progress = self.category_index.load_counts(summary_bytes)
+            if category_progress is None:
+                # the writer stopped between updating the counters and saving the statistics per category
+                self.log('Category statistics are out of date, counting the category index.')
+                category_progress = self.category_index.count()
+            self.category_progress = category_progress
+            return
+        self.log('Progress counters are out of date, counting the results.')
+        # the index is complete before the counters are, as for every report
+        counters, self.category_progress = self.category_index.rebuild(
+            SummaryReader(summary_path, self.csv_keys, ReportWriter.RUN_HEADER_PREFIX, self.record_layout),
+            self.analyzer.interpret)
+        counters[ProgressCounters.SUMMARY_BYTES] = summary_bytes
+        self.progress.write(counters)
+
+    @staticmethod
+    def get_reports_dir(eval_name: str) -> str:
+        """
+        :param eval_name: the id of the evaluation
+        :return: the folder of the per-app reports of the evaluation
+        """
+        return path.join(FilesystemConfig().get_report_dir(), eval_name)
+
     def report_file(self, name: str = None) -> str:
         return path.join(self.reports_dir, str(name) if name is not None else '')
 
@@ -230,13 +302,37 @@ class ReportWriter(TaskWorker):
         with open(self.get_summary_path(), 'a') as result_csv:
             result_writer = DictWriter(result_csv, self.csv_keys, delimiter=';', quotechar='"')
             result_writer.writerow(row_dict)
+
+        timings_dict = dict((key, row_dict[key]) for key in [ReportWriter.KEY_PKG, ReportWriter.KEY_CATS,
+                                                             ReportWriter.KEY_WORKER, ReportWriter.KEY_TIMESTAMP])
+        for (subtask, duration) in task.durations.items():
+            if subtask in self.known_subtasks:
+                timings_dict[subtask] = '%.3f' % duration
+        total = sum(task.durations.values())
+        timings_dict[ReportWriter.KEY_SUCC] = '%.3f' % total
+        with open(self.get_timings_path(), 'a') as timings_csv:
+            timings_writer = DictWriter(timings_csv, self.csv_keys, delimiter=';', quotechar='"')
+            timings_writer.writerow(timings_dict)
         return row_dict
 
     def get_summary_path(self) -> str:
         return path.join(self.results_dir, self.eval + '_' + ReportWriter.FILE_SUMMARY_SUFFIX)
 
-    # TODO use result analyzer
-    def print_state(self) -> None:
-        included = self.tested - self.outs
-        print('tested: ' + str(self.tested) + ', out: ' + str(self.outs) + ', success: ' + str(self.successes) + '/'
-              + str(included) + ': ' + (str(self.successes / included) if included > 0 else 0)) + '%'
+    def get_timings_path(self) -> str:
+        return path.join(self.results_dir, self.eval + '_' + ReportWriter.FILE_TIMINGS_SUFFIX)
+
+    def print_state(self, categories: List[str]=list()) -> None:
+        """
+        Prints the overall statistics and those of the given categories.
+        """
+        print(ReportWriter.format_progress(self.progress.read_unchecked()))
+        for category in categories:
+            print('  ' + category + ': ' + ReportWriter.format_progress(self.category_progress[category]))
+
+    @staticmethod
+    def format_progress(counters: Dict[str, int]) -> str:
+        included = counters[ProgressCounters.TESTED] - counters[ProgressCounters.OUTS]
+        successes = counters[ProgressCounters.SUCCESSES]
+        return 'tested: ' + str(counters[ProgressCounters.TESTED]) + ', out: ' + str(counters[ProgressCounters.OUTS]) \
+               + ', success: ' + str(successes) + '/' + str(included) + ': ' \
+               + (str(successes / included * 100) if included > 0 else '0') + '%'
@@ -0,0 +1,194 @@
+from collections import OrderedDict
+from csv import reader as csv_reader, writer as csv_writer
+from json import dump, load
+from os import path, replace, getpid
+from typing import List, Dict, Tuple, Union, Iterator
+
+from analysis.SummaryReader import SummaryReader
+from model.IResultAnalyzer import IResultAnalyzer
+from utils.progress_counters import ProgressCounters
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class CategoryIndex(object):
+    """
+    Inverted index of the summary csv: for every category, the packages of the app rows in this category, the
+    positions of the rows in the summary and their interpretation. It is appended to by the report writer for every
+    result, so per-category statistics and the apps of a category are available without parsing the summary.
+    The index is up to date if the progress counters are, since the report writer extends the index right before it
+    updates the counters (see ProgressCounters.SUMMARY_BYTES).
+    The statistics per category are saved next to the index after every result, so they are available without reading
+    the index.
+    """
+
+    FILE_SUFFIX = '.categories'
+    COUNTS_SUFFIX = '.progress'
+
+    # fields of the saved statistics
+    KEY_SUMMARY_BYTES = 'summary_bytes'
+    KEY_COUNTS = 'counts'
+
+    # mapping: interpretation -> progress counter
+    COUNTERS = {IResultAnalyzer.OUT: ProgressCounters.OUTS,
+                IResultAnalyzer.FAIL: ProgressCounters.FAILS,
+                IResultAnalyzer.SUCCESS: ProgressCounters.SUCCESSES}
+
+    def __init__(self, summary_path: str):
+        """
+        :param summary_path: the summary csv of an evaluation
+        """
+        self.summary_path = summary_path
+        self.index_path = CategoryIndex.get_path(summary_path)
+        self.counts_path = CategoryIndex.get_counts_path(summary_path)
+
+    @staticmethod
+    def get_path(summary_path: str) -> str:
+        return summary_path + CategoryIndex.FILE_SUFFIX
+
+    @staticmethod
+    def get_counts_path(summary_path: str) -> str:
+        return CategoryIndex.get_path(summary_path) + CategoryIndex.COUNTS_SUFFIX
+
+    def exists(self) -> bool:
+        return path.isfile(self.index_path)
+
+    def is_up_to_date(self) -> bool:
+        """
+        :return: whether the index covers all results of the summary
+        """
+        if not self.exists():
+            return False
+        progress = ProgressCounters.open_for_summary(self.summary_path)
+        if progress is None:
+            return False
+        counters = progress.read()
+        progress.close()
+        summary_bytes = path.getsize(self.summary_path) if path.isfile(self.summary_path) else 0
+        return counters is not None and counters[ProgressCounters.SUMMARY_BYTES] == summary_bytes
+
+    ### writing
+
+    def add(self, package: str, categories: List[str], offset: int, interpretation: str) -> None:
+        """
+        Adds an app row of the summary to the index.
+        :param package: the package of the app
+        :param categories: the categories of the app
+        :param offset: the position of the row in the summary csv
+        :param interpretation: the interpretation of the result
+        """
+        with open(self.index_path, 'a', newline='') as index_file:
+            writer = csv_writer(index_file, delimiter=';', quotechar='"')
+            for category in categories:
+                writer.writerow([category, package, offset, interpretation])
+
+    def rebuild(self, reader: SummaryReader, interpret) -> Tuple[Dict[str, int], Dict[str, Dict[str, int]]]:
+        """
+        Replaces the index with one built from the summary. The results are counted in the same pass.
+        :param reader: reader of the summary that returns ResultRecords
+        :param interpret: function mapping records to their interpretation
+        :return: the statistics of all results and those per category, with the fields of the progress counters
+        """
+        totals = dict((field, 0) for field in ProgressCounters.FIELDS)
+        counts = dict()
+        # write to a temporary file first, readers never see a partially written index
+        tmp_path = self.index_path + '.' + str(getpid()) + '.tmp'
+        with open(tmp_path, 'w', newline='') as index_file:
+            writer = csv_writer(index_file, delimiter=';', quotechar='"')
+            for offset, record in reader.iter_indexed():
+                interpretation = interpret(record)
+                CategoryIndex.count_interpretation(totals, interpretation)
+                for category in record.get_category_names():
+                    writer.writerow([category, record.package, offset, interpretation])
+                    CategoryIndex.count_result(counts, category, interpretation)
+        replace(tmp_path, self.index_path)
+        return totals, counts
+
+    def save_counts(self, counts: Dict[str, Dict[str, int]], summary_bytes: int) -> None:
+        """
+        Saves the statistics per category.
+        :param counts: the statistics per category
+        :param summary_bytes: the size of the summary csv that the statistics reflect
+        """
+        tmp_path = self.counts_path + '.' + str(getpid()) + '.tmp'
+        with open(tmp_path, 'w') as counts_file:
+            dump({CategoryIndex.KEY_SUMMARY_BYTES: summary_bytes, CategoryIndex.KEY_COUNTS: counts}, counts_file)
+        replace(tmp_path, self.counts_path)
+
+    ### reading
+
+    def iter_entries(self) -> Iterator[Tuple[str, str, int, str]]:
+        """
+        :return: iterator over the entries of the index: category, package, position in the summary and interpretation
+        """
+        if not self.exists():
+            return
+        with open(self.index_path, 'r', newline='') as index_file:
+            for entry in csv_reader(index_file, delimiter=';', quotechar='"'):
+                if len(entry) == 4 and entry[2].isdigit():
+                    yield entry[0], entry[1], int(entry[2]), entry[3]
+
+    def read(self, categories: Union[List[str], None]=None) -> Dict[str, List[Tuple[str, int, str]]]:
+        """
+        :param categories: the categories to read, None for all
+        :return: ordered mapping from categories to the package, summary position and interpretation of their results
+        """
+        index = OrderedDict()
+        for category, package, offset, interpretation in self.iter_entries():
+            if categories is None or category in categories:
+                index.setdefault(category, list()).append((package, offset, interpretation))
+        return index
+
+    def get_packages(self) -> List[str]:
+        """
+        :return: the packages of all results, in the order they were written and without duplicates
+        """
+        packages = OrderedDict()
+        for category, package, offset, interpretation in self.iter_entries():
+            packages[package] = True
+        return list(packages.keys())
+
+    def count(self, categories: Union[List[str], None]=None) -> Dict[str, Dict[str, int]]:
+        """
+        :param categories: the categories to count, None for all
+        :return: mapping from categories to their statistics, with the fields of the progress counters
+        """
+        counts = dict()
+        for category, package, offset, interpretation in self.iter_entries():
+            if categories is None or category in categories:
+                CategoryIndex.count_result(counts, category, interpretation)
+        return counts
+
+    def load_counts(self, summary_bytes: int) -> Union[Dict[str, Dict[str, int]], None]:
+        """
+        :param summary_bytes: the current size of the summary csv
+        :return: the saved statistics per category or None if there are none for this state of the summary
+        """
+        if not path.isfile(self.counts_path):
+            return None
+        try:
+            with open(self.counts_path, 'r') as counts_file:
+                saved = load(counts_file)
+        except ValueError as invalid_counts:
+            return None
+        if saved.get(CategoryIndex.KEY_SUMMARY_BYTES) != summary_bytes:
+            return None
+        return saved.get(CategoryIndex.KEY_COUNTS)
+
+    @staticmethod
+    def count_result(counts: Dict[str, Dict[str, int]], category: str, interpretation: str) -> None:
+        """
+        Adds a result to per-category statistics.
+        """
+        counters = counts.get(category)
+        if counters is None:
+            counters = dict((field, 0) for field in ProgressCounters.FIELDS)
+            counts[category] = counters
+        CategoryIndex.count_interpretation(counters, interpretation)
+
+    @staticmethod
+    def count_interpretation(counters: Dict[str, int], interpretation: str) -> None:
+        counters[ProgressCounters.TESTED] += 1
+        counter = CategoryIndex.COUNTERS.get(interpretation)
+        if counter is not None:
+            counters[counter] += 1
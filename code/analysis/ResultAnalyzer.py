@@ -1,11 +1,18 @@
+from argparse import ArgumentParser, Namespace
+from collections import OrderedDict
+from datetime import datetime
 from os import path
-from csv import DictReader
 from typing import List, Dict, Union, Callable, Tuple
 
 from ReportWriter import ReportWriter
+from analysis.CategoryIndex import CategoryIndex
+from analysis.ResultColumns import ResultColumns
+from analysis.ResultRecord import OutcomeMasks, RecordLayout, ResultRecord
+from analysis.SummaryReader import SummaryReader, SummaryRow
 from model.IEvaluator import IEvaluator
 from model.IResultAnalyzer import IResultAnalyzer
 from utils.filesystem_config import FilesystemConfig
+from utils.progress_counters import ProgressCounters
 
 __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
 
@@ -18,6 +25,24 @@ class ResultAnalyzer(IResultAnalyzer):
     CMD_FAILS = 'fails'
     CMD_OUTS = 'outs'
     CMD_CHECK = 'check'
+    CMD_PROGRESS = 'progress'
+    CMD_EXPORT = 'export'
+    CMD_BY_CATEGORY = 'by-category'
+    CMD_BY_DEVICE = 'by-device'
+    CMD_BY_FAILURE = 'by-failure'
+    CMD_OVER_TIME = 'over-time'
+    CMD_TIMINGS = 'timings'
+    CMD_RUNS = 'runs'
+    CMD_DIFF = 'diff'
+
+    RESULTS_TIMINGS = 'timings.csv'
+    RESULTS_COLUMNS = 'results' + ResultColumns.FILE_ENDING
+
+    # slowdown of a subtask in percent that CMD_DIFF reports as regression
+    REGRESSION_THRESHOLD = 20.0
+
+    # lengths of the time buckets for CMD_OVER_TIME
+    BUCKETS = OrderedDict([('hour', 3600), ('day', 86400), ('week', 604800)])
 
     LOG_TAG = "ResultAnalyzer"
 
@@ -28,8 +53,15 @@ class ResultAnalyzer(IResultAnalyzer):
         self.summary_file = path.join(self.fsm.get_result_dir(),
                                       evaluator.get_eval_id() + "_" + ResultAnalyzer.RESULTS_SUMMARY)
         print(self.summary_file)
+        self.timings_file = path.join(self.fsm.get_result_dir(),
+                                      evaluator.get_eval_id() + "_" + ResultAnalyzer.RESULTS_TIMINGS)
+        # cache of the results in columnar form
+        self.columns_file = path.join(self.fsm.get_result_dir(),
+                                      evaluator.get_eval_id() + "_" + ResultAnalyzer.RESULTS_COLUMNS)
 
         self.evaluator = evaluator
+        # options of the analysis commands, see set_options
+        self.options = None
 
         # caching
         self.subtasks = evaluator.get_subtask_ids_ordered()
@@ -45,6 +77,11 @@ class ResultAnalyzer(IResultAnalyzer):
         self.fixed_fields_back = fixed_fields_back
         self.ordered_fieldnames = self.fixed_fields_front + self.subtasks + self.fixed_fields_back
 
+        # results are read into compact records that are interpreted with bitmasks
+        self.masks = OutcomeMasks(self.subtasks, self.interpretations)
+        self.record_layout = RecordLayout(self.ordered_fieldnames, self.masks, ReportWriter.KEY_PKG,
+                                          ReportWriter.KEY_CATS, ReportWriter.CSV_IN_CELL_SEPARATOR)
+
     ### interface
 
     def is_success(self, summary_row: Dict[str, str]) -> bool:
@@ -56,7 +93,9 @@ class ResultAnalyzer(IResultAnalyzer):
     def is_failure(self, summary_row: Dict[str, str]) -> bool:
         return self.interpret(summary_row) == IResultAnalyzer.FAIL
 
-    def interpret(self, summary_row: Dict[str, str]) -> Union[str, None]:
+    def interpret(self, summary_row: Union[ResultRecord, Dict[str, str]]) -> Union[str, None]:
+        if isinstance(summary_row, ResultRecord):
+            return self.masks.interpret(summary_row.outcomes)
 
         for subtask in self.subtasks:
 
@@ -92,6 +131,9 @@ class ResultAnalyzer(IResultAnalyzer):
         # no fails (that we care about) occurred
         return IResultAnalyzer.SUCCESS
 
+    def get_record_layout(self) -> RecordLayout:
+        return self.record_layout
+
     #
     def get_all(self) -> Tuple[List[Dict[str, str]], List[Dict[str, str]], List[Dict[str, str]], List[Dict[str, str]]]:
         # if this method ever gets too slow because the data is too big: implement in one interation
@@ -103,7 +145,14 @@ class ResultAnalyzer(IResultAnalyzer):
 
     def get_tested(self) -> List[Dict[str, str]]:
         # filter out non-data rows (comments, headlines, ...)
-        return self.find_matching_entries(lambda row: self.interpret(row) is not None)
+        return self.find_matching_entries(lambda row: self.interpret(row) is not None, csv_rows=self.get_app_rows())
+
+    def get_tested_packages(self) -> List[str]:
+        category_index = CategoryIndex(self.summary_file)
+        if category_index.is_up_to_date():
+            # the index is maintained by the report writer and much smaller than the summary
+            return category_index.get_packages()
+        return [app_row[ReportWriter.KEY_PKG] for app_row in self.get_tested()]
 
     def get_outs(self, csv_rows: Union[List[Dict[str, str]], None]=None) -> List[Dict[str, str]]:
         if not csv_rows:
@@ -127,52 +176,76 @@ class ResultAnalyzer(IResultAnalyzer):
             ResultAnalyzer.CMD_CHECK: self.api_check,
             ResultAnalyzer.CMD_SUCC: self.get_successes,
             ResultAnalyzer.CMD_FAILS: self.api_failures,
-            ResultAnalyzer.CMD_OUTS: self.get_outs
+            ResultAnalyzer.CMD_OUTS: self.get_outs,
+            ResultAnalyzer.CMD_PROGRESS: self.api_progress,
+            ResultAnalyzer.CMD_EXPORT: self.api_export,
+            ResultAnalyzer.CMD_BY_CATEGORY: self.api_by_category,
+            ResultAnalyzer.CMD_BY_DEVICE: self.api_by_device,
+            ResultAnalyzer.CMD_BY_FAILURE: self.api_by_failure,
+            ResultAnalyzer.CMD_OVER_TIME: self.api_over_time,
+            ResultAnalyzer.CMD_TIMINGS: self.api_timings,
+            ResultAnalyzer.CMD_RUNS: self.api_runs,
+            ResultAnalyzer.CMD_DIFF: self.api_diff
         }
 
     ### API implementation ###
 
     def api_summary(self) -> None:
         """
-        API method to print a summary of the current evaluation results.
+        API method to print a summary of the current evaluation results. With --category, only the given categories
+        are summarized, from the category index if it is up to date.
         """
-
-        # category -> (tests, outs, fails, successes)
+        selected = self.get_options().category
+        category_index = CategoryIndex(self.summary_file)
+        if selected and category_index.is_up_to_date():
+            # the index has the interpretation of every result, so the summary is not read
+            self.log_summary(dict((category, [counters[ProgressCounters.TESTED], counters[ProgressCounters.OUTS],
+                                              counters[ProgressCounters.FAILS], counters[ProgressCounters.SUCCESSES]])
+                                  for category, counters in category_index.count(selected).items()))
+            return
+
+        # category id -> (tests, outs, fails, successes)
         results = dict()
-
-        # use list since tuples do not support item assignment
-        overall = [0, 0, 0, 0]
+        category_names = self.record_layout.categories.names
 
         for row in self.get_app_rows():
             # app = row[ReportWriter.KEY_PKG]
-            categories = row[ReportWriter.KEY_CATS].strip().split(ReportWriter.CSV_IN_CELL_SEPARATOR)
-            for cat in categories:
+            for cat in row.categories:
+                if selected and category_names[cat] not in selected:
+                    continue
                 if cat not in results.keys():
                     # use list since tuples do not support item assignment
                     results[cat] = [0, 0, 0, 0]
 
                 # increase number of tests
                 results[cat][0] += 1
-                overall[0] += 1
 
                 # None not possible since we iterate over checked app rows
                 interpretation = self.interpret(row)
                 if interpretation == IResultAnalyzer.OUT:
                     results[cat][1] += 1
-                    overall[1] += 1
                     continue
                 if interpretation == IResultAnalyzer.FAIL:
                     results[cat][2] += 1
-                    overall[2] += 1
                     continue
                 if interpretation == IResultAnalyzer.SUCCESS:
                     results[cat][3] += 1
-                    overall[3] += 1
                     continue
                 raise AssertionError('Unknown interpretation: ' + interpretation)
 
+        self.log_summary(dict((category_names[cat], counts) for cat, counts in results.items()))
+
+    def log_summary(self, results: Dict[str, List[int]]) -> None:
+        """
+        Prints the statistics of every category and the overall statistics, which count apps once per category.
+        :param results: mapping from categories to their tests, outs, fails and successes
+        """
+        # use list since tuples do not support item assignment
+        overall = [0, 0, 0, 0]
         for cat in sorted(results.keys()):
             tests, outs, fails, successes = results[cat]
+            for field, count in enumerate(results[cat]):
+                overall[field] += count
             included = tests - outs
             percentage = (successes / included) * 100 if included > 0 else 0
             self.log('Category ' + cat + ': Tested: ' + str(tests) + ', removed: ' + str(outs)
@@ -187,6 +260,169 @@ class ResultAnalyzer(IResultAnalyzer):
                  + ', success: ' + str(overall_successes) + '/' + str(overall_included) + ' = ' + str(
             overall_percentage) + '%')
 
+    def api_progress(self) -> None:
+        """
+        API method to print the overall statistics of the evaluation from its progress counters, which are updated while
+        the evaluation runs. Unlike the summary, this does not read the results.
+        """
+        progress = ProgressCounters.open_for_summary(self.summary_file)
+        counters = progress.read() if progress is not None else None
+        if progress is not None:
+            progress.close()
+        if counters is None:
+            self.log('No progress recorded.')
+            return
+        self.log(ReportWriter.format_progress(counters))
+        summary_bytes = path.getsize(self.summary_file) if path.isfile(self.summary_file) else 0
+        if counters[ProgressCounters.SUMMARY_BYTES] != summary_bytes:
+            self.log('The results changed without updating the progress, use ' + ResultAnalyzer.CMD_SUMMARY
+                     + ' for exact numbers.')
+
+    def api_export(self) -> None:
+        """
+        API method to export the results and subtask durations in columnar form (NumPy .npz), e.g., for cross-run
+        analyses. The file is given with --columns and defaults to the cache used by the columnar analyses.
+        """
+        columns = self.read_columns()
+        columns_path = self.get_options().columns or self.columns_file
+        columns.save(columns_path)
+        self.log('Exported ' + str(len(columns.packages)) + ' results to ' + columns_path)
+
+    def api_by_category(self) -> None:
+        """
+        API method to print the success rate and mean duration per category, computed on the columnar results.
+        """
+        names, counts, durations = self.get_columns().by_category()
+        self.log_groups('Category', names, counts, durations)
+
+    def api_by_device(self) -> None:
+        """
+        API method to print the success rate and mean duration per device.
+        """
+        names, counts, durations = self.get_columns().by_device()
+        self.log_groups('Device', names, counts, durations)
+
+    def api_by_failure(self) -> None:
+        """
+        API method to print how many apps were failed or removed by each subtask, i.e., at which point of the evaluation
+        apps drop out.
+        """
+        columns = self.get_columns()
+        subtasks, failures = columns.by_failure_point()
+        tested = len(columns.packages)
+        for subtask, count in zip(subtasks, failures):
+            share = (count / tested) * 100 if tested > 0 else 0
+            self.log('Subtask ' + subtask + ' (' + self.describe_interpretation(subtask) + '): ' + str(count) + '/'
+                     + str(tested) + ' = ' + str(share) + '%')
+
+    def api_over_time(self) -> None:
+        """
+        API method to print the success rate and mean duration per time bucket, selected with --bucket.
+        """
+        bucket = self.get_options().bucket
+        starts, counts, durations = self.get_columns().over_time(ResultAnalyzer.BUCKETS[bucket])
+        names = [datetime.utcfromtimestamp(start).strftime('%d.%m.%Y %H:%M') for start in starts]
+        self.log_groups('From', names, counts, durations)
+
+    def api_timings(self) -> None:
+        """
+        API method to print statistics of the subtask durations.
+        """
+        subtasks, stats = self.get_columns().subtask_timings()
+        for subtask, (count, mean, median, percentile) in zip(subtasks, stats):
+            self.log('Subtask ' + subtask + ': ' + str(int(count)) + ' timed, mean: ' + ('%.3f' % mean) + 's, median: '
+                     + ('%.3f' % median) + 's, 95th percentile: ' + ('%.3f' % percentile) + 's')
+
+    def api_runs(self) -> None:
+        """
+        API method to list the runs of the evaluation. Runs can be referred to by their id or number, negative numbers
+        count from the last run.
+        """
+        for number, (run_id, rows) in enumerate(self.read_runs().items()):
+            self.log('Run ' + str(number + 1) + ': ' + run_id + ', ' + str(len(rows)) + ' results')
+
+    def api_diff(self) -> None:
+        """
+        API method to compare two runs, e.g., of different ARTist builds: <run A> <run B> (default: the last two runs).
+        Apps are joined by package name and newly failing as well as fixed apps are listed, followed by the
+        subtasks that became slower in run B. With --fail-on-regression, the command exits with 1 if there are newly
+        failing apps or slower subtasks.
+        """
+        options = self.get_options()
+        reader = self.get_reader()
+        run_ids = reader.get_run_ids()
+        names = options.arguments if options.arguments else ['-2', '-1']
+        if len(names) != 2:
+            self.log('Expected two runs, got: ' + ' '.join(names))
+            exit(-1)
+        run_a, run_b = self.find_run(run_ids, names[0]), self.find_run(run_ids, names[1])
+
+        # hash join by package, the last result of an app within a run counts
+        rows_a = dict((row[ReportWriter.KEY_PKG], row) for row in reader.read_run(run_a))
+        rows_b = dict((row[ReportWriter.KEY_PKG], row) for row in reader.read_run(run_b))
+        common = [package for package in rows_b.keys() if package in rows_a]
+        self.log('Comparing run ' + run_a + ' (' + str(len(rows_a)) + ' apps) with run ' + run_b + ' ('
+                 + str(len(rows_b)) + ' apps): ' + str(len(common)) + ' apps in both')
+
+        # mapping: (interpretation in A, interpretation in B) -> packages
+        changes = dict()
+        for package in sorted(common):
+            change = (self.interpret(rows_a[package]), self.interpret(rows_b[package]))
+            if change[0] != change[1]:
+                changes.setdefault(change, list()).append(package)
+
+        newly_failing = changes.get((IResultAnalyzer.SUCCESS, IResultAnalyzer.FAIL), list())
+        fixed = changes.get((IResultAnalyzer.FAIL, IResultAnalyzer.SUCCESS), list())
+        self.log('Newly failing: ' + str(len(newly_failing)))
+        for package in newly_failing:
+            self.log('  ' + package + ' (at ' + str(self.get_failure_point(rows_b[package])) + ')')
+        self.log('Fixed: ' + str(len(fixed)))
+        for package in fixed:
+            self.log('  ' + package)
+        for (before, after), packages in sorted(changes.items()):
+            if (before, after) not in [(IResultAnalyzer.SUCCESS, IResultAnalyzer.FAIL),
+                                       (IResultAnalyzer.FAIL, IResultAnalyzer.SUCCESS)]:
+                self.log('Changed from ' + before + ' to ' + after + ': ' + str(len(packages)))
+        self.log('Only in run ' + run_a + ': ' + str(len(rows_a) - len(common)) + ', only in run ' + run_b + ': '
+                 + str(len(rows_b) - len(common)))
+
+        regressions = self.diff_timings(run_a, run_b, common, options.threshold)
+
+        if options.fail_on_regression and (newly_failing or regressions):
+            exit(1)
+
+    def diff_timings(self, run_a: str, run_b: str, packages: List[str], threshold: float) -> List[str]:
+        """
+        Compares the mean subtask durations of two runs, using only apps that were timed in both runs.
+        :return: the subtasks that became slower by more than threshold percent
+        """
+        reader = self.get_reader(self.timings_file)
+        timings_a = dict((row[ReportWriter.KEY_PKG], row) for row in reader.read_run(run_a))
+        timings_b = dict((row[ReportWriter.KEY_PKG], row) for row in reader.read_run(run_b))
+        if not timings_a or not timings_b:
+            self.log('No timings for both runs.')
+            return list()
+
+        regressions = list()
+        for subtask in self.subtasks:
+            durations = list()
+            for package in packages:
+                duration_a = timings_a.get(package, dict()).get(subtask)
+                duration_b = timings_b.get(package, dict()).get(subtask)
+                if duration_a and duration_b:
+                    durations.append((float(duration_a), float(duration_b)))
+            if not durations:
+                continue
+            mean_a = sum(duration_a for (duration_a, duration_b) in durations) / len(durations)
+            mean_b = sum(duration_b for (duration_a, duration_b) in durations) / len(durations)
+            change = ((mean_b - mean_a) / mean_a) * 100 if mean_a > 0 else 0
+            regression = change > threshold
+            if regression:
+                regressions.append(subtask)
+            self.log('Subtask ' + subtask + ': ' + str(len(durations)) + ' apps, mean ' + ('%.3f' % mean_a) + 's -> '
+                     + ('%.3f' % mean_b) + 's (' + ('%+.1f' % change) + '%)' + (' REGRESSION' if regression else ''))
+        return regressions
+
     def api_successes(self, dump: bool=False) -> None:
         """
         API method to display all apps that were successfully tested. 
@@ -228,7 +464,10 @@ class ResultAnalyzer(IResultAnalyzer):
         API method to check the current evaluation resilts for inconsistencies, such as duplicate app packages.
         """
 
-        row_dict = self.get_app_rows()
+        reader = self.get_reader()
+        row_dict = list(reader.iter_rows())
+        if reader.malformed > 0:
+            self.log('Warning: Found ' + str(reader.malformed) + ' malformed lines.')
 
         # count occurences of package names
         packages_counter = dict()  # mapping: package -> occurence
@@ -263,20 +502,150 @@ class ResultAnalyzer(IResultAnalyzer):
     def log(self, s: str) -> None:
         print(ResultAnalyzer.LOG_TAG + ": " + str(s))
 
-    def read_csv_dict(self) -> List[Dict[str, str]]:
+    def add_arguments(self, parser: ArgumentParser) -> None:
         """
-        Reads a csv into a list of row dictionaries. The keys are the ordered fieldnames (package, subtask, ...)saved 
-        in the analyzer. Also contains entries such as header lines and empty lines.
-        :return: list of dictionaries mapping from fieldnames to values
+        Adds the arguments and options of the analysis commands to the parser of analyze.py.
         """
-        result = []
+        parser.add_argument('arguments', metavar='<ARGUMENT>', nargs='*',
+                            help='Arguments of the command, e.g., the runs to compare with ' + ResultAnalyzer.CMD_DIFF
+                                 + '.')
+        parser.add_argument('--category',
+                            action='append',
+                            help='Category to restrict ' + ResultAnalyzer.CMD_SUMMARY + ' to, can be repeated.')
+        parser.add_argument('--columns',
+                            action='store',
+                            help='The columnar results file that is written by ' + ResultAnalyzer.CMD_EXPORT
+                                 + ' and read by the columnar analyses instead of the csv files.')
+        parser.add_argument('--bucket',
+                            action='store',
+                            choices=list(ResultAnalyzer.BUCKETS.keys()),
+                            default='day',
+                            help='Time bucket of ' + ResultAnalyzer.CMD_OVER_TIME + '.')
+        parser.add_argument('--threshold',
+                            action='store',
+                            type=float,
+                            default=ResultAnalyzer.REGRESSION_THRESHOLD,
+                            help='Slowdown of a subtask in percent that ' + ResultAnalyzer.CMD_DIFF
+                                 + ' reports as regression.')
+        parser.add_argument('--fail-on-regression',
+                            action='store_true',
+                            help='Exit with 1 if ' + ResultAnalyzer.CMD_DIFF + ' finds newly failing apps or slower '
+                                 'subtasks.')
+
+    def set_options(self, options: Namespace) -> None:
+        """
+        :param options: the parsed command line of analyze.py, including the arguments added by add_arguments
+        """
+        self.options = options
 
-        if path.isfile(self.summary_file):
-            with open(self.summary_file, 'r') as result_csv:
-                csv_reader = DictReader(result_csv, delimiter=';', fieldnames=self.ordered_fieldnames)
-                for row in csv_reader:
-                    result.append(row)
-        return result
+    def get_options(self) -> Namespace:
+        """
+        :return: the options of the analysis commands, the defaults if none were set
+        """
+        if self.options is None:
+            parser = ArgumentParser()
+            self.add_arguments(parser)
+            self.options = parser.parse_args([])
+        return self.options
+
+    def read_columns(self) -> ResultColumns:
+        """
+        Reads the results and subtask durations from the csv files into columns.
+        """
+        return ResultColumns.from_rows(self.get_app_rows(), list(self.get_reader(self.timings_file).iter_rows()),
+                                       self.subtasks, self.interpretations)
+
+    def get_columns(self) -> ResultColumns:
+        """
+        :return: the columnar results, read from the file given with --columns or from a cache that is updated
+        whenever the csv files changed
+        """
+        columns_path = self.get_options().columns
+        if columns_path is not None:
+            return ResultColumns.load(columns_path)
+        if ResultColumns.is_up_to_date(self.columns_file, [self.summary_file, self.timings_file]):
+            columns = ResultColumns.load(self.columns_file)
+            if columns.matches(self.subtasks):
+                return columns
+        columns = self.read_columns()
+        columns.save(self.columns_file)
+        return columns
+
+    def get_result_files(self) -> List[str]:
+        summary_files = [ProgressCounters.get_path(self.summary_file), CategoryIndex.get_path(self.summary_file),
+                         CategoryIndex.get_counts_path(self.summary_file)]
+        csv_files = list()
+        for csv_file in [self.summary_file, self.timings_file]:
+            csv_files += [csv_file, SummaryReader.get_index_path(csv_file)]
+        return csv_files + summary_files + [self.columns_file]
+
+    def get_reader(self, csv_file: Union[str, None]=None) -> SummaryReader:
+        """
+        :param csv_file: a csv file with the layout of the summary, e.g., the timings. Defaults to the summary itself,
+        which is read into ResultRecords
+        :return: a streaming reader of the csv file
+        """
+        if csv_file is None:
+            return SummaryReader(self.summary_file, self.ordered_fieldnames, ReportWriter.RUN_HEADER_PREFIX,
+                                 self.record_layout)
+        return SummaryReader(csv_file, self.ordered_fieldnames, ReportWriter.RUN_HEADER_PREFIX)
+
+    def read_runs(self, csv_file: Union[str, None]=None) -> Dict[str, List[Union[ResultRecord, SummaryRow]]]:
+        """
+        Reads the app rows of a csv file with the layout of the summary, grouped by the run that wrote them.
+        :param csv_file: the csv file, defaults to the summary
+        :return: ordered mapping from run ids (the start time of a run) to the app rows of the run
+        """
+        return self.get_reader(csv_file).read_runs()
+
+    def find_run(self, run_ids: List[str], name: str) -> str:
+        """
+        :param run_ids: the ids of all runs, in order
+        :param name: the id or (1-based, negative from the end) number of a run
+        :return: the id of the run
+        """
+        if name in run_ids:
+            return name
+        try:
+            number = int(name)
+            return run_ids[number - 1 if number > 0 else number]
+        except (ValueError, IndexError):
+            self.log('No such run: ' + name + ', see ' + ResultAnalyzer.CMD_RUNS)
+            exit(-1)
+
+    def get_failure_point(self, summary_row: Union[ResultRecord, Dict[str, str]]) -> Union[str, None]:
+        """
+        :return: the first failed subtask that is not DONTCARE, None if there is none
+        """
+        if isinstance(summary_row, ResultRecord):
+            return self.masks.failure_point(summary_row.outcomes)
+        for subtask in self.subtasks:
+            if self.interpretations[subtask] != IEvaluator.DONTCARE and summary_row[subtask] != 'True':
+                return subtask
+        return None
+
+    def describe_interpretation(self, subtask: str) -> str:
+        interpretation = self.interpretations[subtask]
+        if interpretation == IEvaluator.REQUIRED:
+            return 'required'
+        if interpretation == IEvaluator.ASSUMPTION:
+            return 'assumption'
+        return 'do not care'
+
+    def log_groups(self, title: str, names: List[str], counts, durations) -> None:
+        """
+        Prints the results of grouped analyses in the style of the summary.
+        :param title: what the groups are, e.g., Category
+        :param names: the name of every group
+        :param counts: tested, outs, fails and successes per group
+        :param durations: mean duration per group, NaN without timings
+        """
+        for name, (tests, outs, fails, successes), duration in zip(names, counts, durations):
+            included = tests - outs
+            percentage = (successes / included) * 100 if included > 0 else 0
+            self.log(title + ' ' + str(name) + ': Tested: ' + str(tests) + ', removed: ' + str(outs)
+                     + ', success: ' + str(successes) + '/' + str(included) + ' = ' + str(percentage) + '%'
+                     + (', mean duration: ' + ('%.3f' % duration) + 's' if duration == duration else ''))
 
     def find_matching_entries(self, condition: Callable[[Dict[str, str]], bool],
                               csv_rows: Union[List[Dict[str, str]], None]=None) -> List[Dict[str, str]]:
@@ -288,7 +657,7 @@ class ResultAnalyzer(IResultAnalyzer):
         """
         results = []
         if csv_rows is None:
-            csv_rows = self.read_csv_dict()
+            csv_rows = self.get_app_rows()
 
         # noinspection PyTypeChecker
         for row in csv_rows:
@@ -297,12 +666,12 @@ class ResultAnalyzer(IResultAnalyzer):
         return results
 
     # get all app entries from the summary csv, omitting categories and empty lines
-    def get_app_rows(self) -> List[Dict[str, str]]:
+    def get_app_rows(self) -> List[ResultRecord]:
         """
         Reads all app rows from the summary csv, omitting categories and empty lines.
-        :return: list of row dicts
+        :return: list of result records, which support read access like dicts
         """
-        return self.find_matching_entries(ResultAnalyzer.is_app_row)
+        return list(self.get_reader().iter_rows())
 
     # True if a given row is an app testing result, False otherwise (categories, header lines)
     @staticmethod
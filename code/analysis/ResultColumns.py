@@ -0,0 +1,248 @@
+from calendar import timegm
+from os import path, replace, getpid
+from time import strptime
+from typing import List, Dict, Tuple
+
+from ReportWriter import ReportWriter
+from analysis.ResultRecord import ResultRecord
+from model.IEvaluator import IEvaluator
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+def get_numpy():
+    # numpy is only needed for the columnar analyses, so it is an optional dependency
+    try:
+        import numpy
+    except ImportError:
+        print('The columnar analysis requires numpy, install it with "pip3 install numpy".')
+        exit(-1)
+    return numpy
+
+
+class ResultColumns(object):
+    """
+    Column-oriented copy of the results of an evaluation, held in NumPy arrays. Every app row of the summary csv is
+    one row of the columns, joined with the subtask durations of the timings csv. Categories are stored separately as
+    (row, category) pairs since apps can have several categories.
+    Analyses group the rows with vectorized operations instead of looping over row dicts, and the columns can be
+    saved to a .npz file that loads much faster than parsing the csv files again.
+    """
+
+    # codes of the interpretations
+    SUCCESS = 0
+    FAIL = 1
+    OUT = 2
+
+    FILE_ENDING = '.npz'
+
+    # names of the arrays, as stored in the file
+    ARRAYS = ['subtasks', 'kinds', 'packages', 'worker_names', 'worker_ids', 'timestamps', 'outcomes', 'durations',
+              'category_names', 'category_rows', 'category_ids']
+
+    def __init__(self, arrays: Dict):
+        """
+        :param arrays: mapping from the names in ARRAYS to the arrays
+        """
+        np = get_numpy()
+        for name in ResultColumns.ARRAYS:
+            setattr(self, name, arrays[name])
+
+        # derived columns: the first failing subtask that is not DONTCARE decides about the interpretation
+        relevant = self.kinds != IEvaluator.DONTCARE
+        failing = ~self.outcomes & relevant
+        has_failure = failing.any(axis=1)
+        first = failing.argmax(axis=1) if len(self.subtasks) > 0 else np.zeros(len(self.packages), dtype=np.int64)
+        # index of the subtask that decided about a fail or out, -1 for successes
+        self.failure_point = np.where(has_failure, first, -1)
+        self.interpretation = np.full(len(self.packages), ResultColumns.SUCCESS, dtype=np.int8)
+        if len(self.subtasks) > 0:
+            self.interpretation[has_failure & (self.kinds[first] == IEvaluator.REQUIRED)] = ResultColumns.FAIL
+            self.interpretation[has_failure & (self.kinds[first] == IEvaluator.ASSUMPTION)] = ResultColumns.OUT
+
+    @staticmethod
+    def from_rows(summary_rows: List[ResultRecord], timing_rows: List[Dict[str, str]], subtasks: List[str],
+                  interpretations: Dict[str, int]) -> 'ResultColumns':
+        """
+        :param summary_rows: the app rows of the summary csv, read with a layout for the given subtasks
+        :param timing_rows: the app rows of the timings csv
+        :param subtasks: the ordered subtasks of the evaluation
+        :param interpretations: the interpretation of each subtask
+        :return: the columns of the results
+        """
+        np = get_numpy()
+        num_rows = len(summary_rows)
+
+        packages = np.array([row[ReportWriter.KEY_PKG] for row in summary_rows], dtype=str)
+        worker_names, worker_ids = np.unique(np.array([row[ReportWriter.KEY_WORKER] or ReportWriter.UNKNOWN_WORKER
+                                                       for row in summary_rows], dtype=str), return_inverse=True)
+        timestamps = np.array([ResultColumns.parse_timestamp(row[ReportWriter.KEY_TIMESTAMP])
+                               for row in summary_rows], dtype=np.int64)
+        # unpack the outcome bits of the records, the first subtask is the lowest bit
+        outcome_bits = np.array([row.outcomes for row in summary_rows], dtype=object).reshape(num_rows, 1)
+        outcomes = ((outcome_bits >> np.arange(len(subtasks))) & 1).astype(bool).reshape(num_rows, len(subtasks))
+
+        # the same report produces rows with the same package, worker and timestamp in both files
+        timings = dict((ResultColumns.row_key(row), row) for row in timing_rows)
+        durations = np.full((num_rows, len(subtasks)), np.nan)
+        for index, row in enumerate(summary_rows):
+            timing_row = timings.get(ResultColumns.row_key(row))
+            if timing_row is None:
+                continue
+            for subtask_index, subtask in enumerate(subtasks):
+                value = timing_row.get(subtask)
+                if value:
+                    durations[index, subtask_index] = float(value)
+
+        # the records already carry interned category ids, which are renumbered to the categories that occur
+        category_rows = np.array([index for index, row in enumerate(summary_rows) for category_id in row.categories],
+                                 dtype=np.int64)
+        interned_ids = np.array([category_id for row in summary_rows for category_id in row.categories],
+                                dtype=np.int64)
+        used_ids, category_row_ids = np.unique(interned_ids, return_inverse=True)
+        interned_names = summary_rows[0].layout.categories.names if summary_rows else list()
+        category_names = [interned_names[category_id] for category_id in used_ids]
+
+        return ResultColumns({
+            'subtasks': np.array(subtasks, dtype=str),
+            'kinds': np.array([interpretations[subtask] for subtask in subtasks], dtype=np.int8),
+            'packages': packages,
+            'worker_names': worker_names,
+            'worker_ids': worker_ids.astype(np.int64),
+            'timestamps': timestamps,
+            'outcomes': outcomes,
+            'durations': durations,
+            'category_names': np.array(category_names, dtype=str),
+            'category_rows': category_rows,
+            'category_ids': category_row_ids.reshape(-1).astype(np.int64)
+        })
+
+    @staticmethod
+    def load(columns_path: str) -> 'ResultColumns':
+        np = get_numpy()
+        with np.load(columns_path) as stored:
+            return ResultColumns(dict((name, stored[name]) for name in ResultColumns.ARRAYS))
+
+    def save(self, columns_path: str) -> None:
+        np = get_numpy()
+        # write to a temporary file first, readers never see a partially written file
+        tmp_path = columns_path + '.' + str(getpid()) + '.tmp' + ResultColumns.FILE_ENDING
+        np.savez_compressed(tmp_path, **dict((name, getattr(self, name)) for name in ResultColumns.ARRAYS))
+        replace(tmp_path, columns_path)
+
+    @staticmethod
+    def is_up_to_date(columns_path: str, sources: List[str]) -> bool:
+        """
+        :return: whether the columns file exists and is newer than all of its (existing) source files
+        """
+        if not path.isfile(columns_path):
+            return False
+        columns_mtime = path.getmtime(columns_path)
+        return all(not path.isfile(source) or path.getmtime(source) <= columns_mtime for source in sources)
+
+    def matches(self, subtasks: List[str]) -> bool:
+        """
+        :return: whether the columns were created for the given subtasks
+        """
+        return list(self.subtasks) == list(subtasks)
+
+    @staticmethod
+    def row_key(row: Dict[str, str]) -> Tuple[str, str, str]:
+        return row[ReportWriter.KEY_PKG], row[ReportWriter.KEY_WORKER], row[ReportWriter.KEY_TIMESTAMP]
+
+    # the same timestamps occur many times, so they are only parsed once
+    parsed_timestamps = dict()
+
+    @staticmethod
+    def parse_timestamp(timestamp: str) -> int:
+        """
+        :param timestamp: a timestamp as formatted by ReportWriter.format_timestamp (UTC)
+        :return: seconds since the epoch, 0 for malformed timestamps
+        """
+        seconds = ResultColumns.parsed_timestamps.get(timestamp)
+        if seconds is None:
+            try:
+                seconds = timegm(strptime(timestamp, '%d.%m.%Y %H:%M:%S'))
+            except (TypeError, ValueError):
+                seconds = 0
+            ResultColumns.parsed_timestamps[timestamp] = seconds
+        return seconds
+
+    ### analyses
+
+    def count_by(self, group_ids, num_groups: int, rows=None):
+        """
+        Counts the interpretations per group.
+        :param group_ids: the group of every (selected) row
+        :param num_groups: the number of groups
+        :param rows: indices of the rows that the groups refer to, None for all rows
+        :return: matrix with a row per group and the columns tested, outs, fails and successes
+        """
+        np = get_numpy()
+        interpretation = self.interpretation if rows is None else self.interpretation[rows]
+        counts = np.bincount(group_ids * 3 + interpretation, minlength=num_groups * 3).reshape(num_groups, 3)
+        return np.column_stack([counts.sum(axis=1), counts[:, ResultColumns.OUT], counts[:, ResultColumns.FAIL],
+                                counts[:, ResultColumns.SUCCESS]])
+
+    def mean_duration_by(self, group_ids, num_groups: int, rows=None):
+        """
+        :return: the mean total duration of the rows with timings per group, NaN for groups without timings
+        """
+        np = get_numpy()
+        durations = self.durations if rows is None else self.durations[rows]
+        timed = ~np.isnan(durations).all(axis=1)
+        totals = np.nansum(durations, axis=1)
+        sums = np.bincount(group_ids[timed], weights=totals[timed], minlength=num_groups)
+        counts = np.bincount(group_ids[timed], minlength=num_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / counts
+
+    def by_category(self) -> Tuple[List[str], object, object]:
+        """
+        :return: the category names, their counts (see count_by) and mean durations
+        """
+        num_groups = len(self.category_names)
+        return list(self.category_names), self.count_by(self.category_ids, num_groups, self.category_rows), \
+            self.mean_duration_by(self.category_ids, num_groups, self.category_rows)
+
+    def by_device(self) -> Tuple[List[str], object, object]:
+        """
+        :return: the worker names, their counts (see count_by) and mean durations
+        """
+        num_groups = len(self.worker_names)
+        return list(self.worker_names), self.count_by(self.worker_ids, num_groups), \
+            self.mean_duration_by(self.worker_ids, num_groups)
+
+    def by_failure_point(self) -> Tuple[List[str], object]:
+        """
+        :return: the subtasks and how many rows failed first at each of them
+        """
+        np = get_numpy()
+        failed = self.failure_point >= 0
+        return list(self.subtasks), np.bincount(self.failure_point[failed], minlength=len(self.subtasks))
+
+    def over_time(self, bucket_seconds: int) -> Tuple[List[int], object, object]:
+        """
+        :param bucket_seconds: the length of the time buckets
+        :return: the start of every bucket in seconds since the epoch, their counts (see count_by) and mean durations
+        """
+        np = get_numpy()
+        buckets, bucket_ids = np.unique(self.timestamps // bucket_seconds, return_inverse=True)
+        bucket_ids = bucket_ids.reshape(-1)
+        return [int(bucket) * bucket_seconds for bucket in buckets], self.count_by(bucket_ids, len(buckets)), \
+            self.mean_duration_by(bucket_ids, len(buckets))
+
+    def subtask_timings(self, percentile: float=95) -> Tuple[List[str], object]:
+        """
+        :return: the subtasks and a matrix with a row per subtask and the columns count, mean, median and the
+        percentile of the durations (NaN without timings)
+        """
+        np = get_numpy()
+        stats = np.full((len(self.subtasks), 4), np.nan)
+        for index in range(len(self.subtasks)):
+            durations = self.durations[:, index]
+            durations = durations[~np.isnan(durations)]
+            stats[index, 0] = len(durations)
+            if len(durations) > 0:
+                stats[index, 1:] = [durations.mean(), np.median(durations), np.percentile(durations, percentile)]
+        return list(self.subtasks), stats
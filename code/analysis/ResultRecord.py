@@ -0,0 +1,209 @@
+from typing import List, Dict, Tuple, Union
+from sys import intern
+
+from model.IEvaluator import IEvaluator
+from model.IResultAnalyzer import IResultAnalyzer
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class OutcomeMasks(object):
+    """
+    Bitmask view of the subtasks of an evaluation. The outcomes of a result are packed into an int with one bit per
+    subtask (in order, first subtask = lowest bit) that is set if the subtask succeeded, so a result is interpreted
+    with a few integer operations instead of a string comparison per subtask.
+    """
+
+    def __init__(self, subtasks: List[str], interpretations: Dict[str, int]):
+        """
+        :param subtasks: the ordered subtasks of the evaluation
+        :param interpretations: the interpretation of each subtask
+        """
+        self.subtasks = subtasks
+        # mapping: subtask -> bit
+        self.bits = dict((subtask, 1 << index) for index, subtask in enumerate(subtasks))
+        self.required = 0
+        self.assumption = 0
+        for subtask in subtasks:
+            interpretation = interpretations[subtask]
+            if interpretation == IEvaluator.REQUIRED:
+                self.required |= self.bits[subtask]
+            elif interpretation == IEvaluator.ASSUMPTION:
+                self.assumption |= self.bits[subtask]
+            elif interpretation != IEvaluator.DONTCARE:
+                raise AssertionError('Unexpected interpretation for subtask ' + subtask + ': ' + str(interpretation))
+        # DONTCARE subtasks never decide about the interpretation
+        self.relevant = self.required | self.assumption
+
+    def encode(self, successes: Dict[str, Union[bool, str]]) -> int:
+        """
+        :param successes: mapping from subtasks to their success, as bool or as written to the csv ('True', 'False').
+        Missing subtasks count as failed
+        :return: the packed outcomes
+        """
+        outcomes = 0
+        for subtask, bit in self.bits.items():
+            success = successes.get(subtask)
+            if success is True or success == 'True':
+                outcomes |= bit
+        return outcomes
+
+    def interpret(self, outcomes: int) -> str:
+        """
+        :return: FAIL, OUT or SUCCESS, decided by the first failed subtask that is not DONTCARE
+        """
+        failing = self.relevant & ~outcomes
+        if not failing:
+            return IResultAnalyzer.SUCCESS
+        # isolate the lowest set bit, i.e., the first failed subtask
+        first = failing & -failing
+        return IResultAnalyzer.FAIL if first & self.required else IResultAnalyzer.OUT
+
+    def failure_point(self, outcomes: int) -> Union[str, None]:
+        """
+        :return: the first failed subtask that is not DONTCARE, None if there is none
+        """
+        failing = self.relevant & ~outcomes
+        if not failing:
+            return None
+        return self.subtasks[(failing & -failing).bit_length() - 1]
+
+
+class CategoryTable(object):
+    """
+    Interns category names as small ids, so that records store their categories as a tuple of ints.
+    """
+
+    def __init__(self, separator: str):
+        """
+        :param separator: the separator of categories within a csv cell
+        """
+        self.separator = separator
+        # mapping: category -> id
+        self.ids = dict()
+        self.names = list()
+        # most apps share a handful of category cells, so every cell is only split once
+        self.cells = dict()
+
+    def get_id(self, category: str) -> int:
+        category_id = self.ids.get(category)
+        if category_id is None:
+            category_id = len(self.names)
+            self.ids[category] = category_id
+            self.names.append(intern(category))
+        return category_id
+
+    def parse(self, cell: str) -> Tuple[int, ...]:
+        """
+        :param cell: the categories as written to the csv
+        :return: the ids of the categories
+        """
+        category_ids = self.cells.get(cell)
+        if category_ids is None:
+            category_ids = tuple(self.get_id(category) for category in cell.strip().split(self.separator))
+            self.cells[cell] = category_ids
+        return category_ids
+
+    def format(self, category_ids: Tuple[int, ...]) -> str:
+        return self.separator.join(self.names[category_id] for category_id in category_ids)
+
+
+class RecordLayout(object):
+    """
+    Describes how the columns of the summary csv map to the parts of a ResultRecord. Shared by all records of an
+    evaluation, together with the outcome masks and the category table.
+    """
+
+    def __init__(self, fieldnames: List[str], masks: OutcomeMasks, package_field: str, categories_field: str,
+                 category_separator: str):
+        """
+        :param fieldnames: the ordered columns of the summary
+        :param masks: the masks of the subtasks, which are columns of the summary
+        :param package_field: the column of the package
+        :param categories_field: the column of the categories
+        :param category_separator: the separator of categories within a csv cell
+        """
+        self.fieldnames = fieldnames
+        self.masks = masks
+        self.package_field = package_field
+        self.categories_field = categories_field
+        self.categories = CategoryTable(category_separator)
+        # all other columns are kept as strings: mapping field -> index in ResultRecord.fields
+        self.other_fields = [field for field in fieldnames
+                             if field not in masks.bits and field not in [package_field, categories_field]]
+        self.other_indices = dict((field, index) for index, field in enumerate(self.other_fields))
+        self.csv_positions = dict((field, index) for index, field in enumerate(fieldnames))
+
+    def from_values(self, run: str, values: List[str]) -> Union['ResultRecord', None]:
+        """
+        :param run: the id of the run that wrote the csv row
+        :param values: the values of a csv row, in the order of the fieldnames
+        :return: the record or None if a subtask has neither succeeded nor failed
+        """
+        outcomes = 0
+        for subtask, bit in self.masks.bits.items():
+            value = values[self.csv_positions[subtask]]
+            if value == 'True':
+                outcomes |= bit
+            elif value != 'False':
+                return None
+        return ResultRecord(run, values[self.csv_positions[self.package_field]],
+                            self.categories.parse(values[self.csv_positions[self.categories_field]]), outcomes,
+                            tuple(values[self.csv_positions[field]] for field in self.other_fields), self)
+
+    def from_dict(self, run: str, row: Dict[str, object]) -> 'ResultRecord':
+        """
+        :param run: the id of the run that wrote the row
+        :param row: a result row, with subtask values as bool or as written to the csv
+        :return: the record
+        """
+        return ResultRecord(run, row[self.package_field], self.categories.parse(row[self.categories_field]),
+                            self.masks.encode(row), tuple(str(row.get(field)) for field in self.other_fields), self)
+
+
+class ResultRecord(object):
+    """
+    Compact result of a single app: the subtask outcomes packed into an int (see OutcomeMasks), the categories as
+    interned ids (see CategoryTable) and the remaining columns as shared strings. Supports the read access of a row
+    dict, with subtask values formatted as in the csv.
+    """
+
+    __slots__ = ['run', 'package', 'categories', 'outcomes', 'fields', 'layout']
+
+    def __init__(self, run: str, package: str, categories: Tuple[int, ...], outcomes: int, fields: Tuple[str, ...],
+                 layout: RecordLayout):
+        # id of the run that wrote the result
+        self.run = run
+        self.package = package
+        self.categories = categories
+        self.outcomes = outcomes
+        self.fields = fields
+        self.layout = layout
+
+    def get_category_names(self) -> List[str]:
+        return [self.layout.categories.names[category_id] for category_id in self.categories]
+
+    def __getitem__(self, field: str) -> str:
+        if field == self.layout.package_field:
+            return self.package
+        if field == self.layout.categories_field:
+            return self.layout.categories.format(self.categories)
+        bit = self.layout.masks.bits.get(field)
+        if bit is not None:
+            return 'True' if self.outcomes & bit else 'False'
+        return self.fields[self.layout.other_indices[field]]
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.layout.csv_positions
+
+    def get(self, field: str, default: Union[str, None]=None) -> Union[str, None]:
+        return self[field] if field in self else default
+
+    def keys(self) -> List[str]:
+        return list(self.layout.fieldnames)
+
+    def items(self) -> List[Tuple[str, str]]:
+        return [(field, self[field]) for field in self.layout.fieldnames]
+
+    def __repr__(self):
+        return 'ResultRecord(' + self.run + ', ' + repr(dict(self.items())) + ')'
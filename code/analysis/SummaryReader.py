@@ -0,0 +1,235 @@
+from collections import OrderedDict
+from csv import reader as csv_reader
+from os import path
+from sys import intern
+from typing import List, Dict, Tuple, Iterator, Union
+
+from analysis.ResultRecord import RecordLayout, ResultRecord
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class SummaryRow(object):
+    """
+    A single app row of a summary csv. The values are kept in a tuple and accessed by field name through a layout that
+    all rows of a file share, so a row costs a fraction of a dict while supporting the same read access.
+    """
+
+    __slots__ = ['run', 'values', 'layout']
+
+    def __init__(self, run: str, values: Tuple[str, ...], layout: Dict[str, int]):
+        # id of the run that wrote the row
+        self.run = run
+        self.values = values
+        self.layout = layout
+
+    def __getitem__(self, field: str) -> str:
+        return self.values[self.layout[field]]
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.layout
+
+    def get(self, field: str, default: Union[str, None]=None) -> Union[str, None]:
+        index = self.layout.get(field)
+        return self.values[index] if index is not None else default
+
+    def keys(self) -> List[str]:
+        return list(self.layout.keys())
+
+    def items(self) -> List[Tuple[str, str]]:
+        return [(field, self.values[index]) for field, index in self.layout.items()]
+
+    def __repr__(self):
+        return 'SummaryRow(' + self.run + ', ' + repr(dict(self.items())) + ')'
+
+
+class SummaryReader(object):
+    """
+    Streaming parser for csv files with the layout of the summary: blocks of runs, each starting with a run header
+    line (see ReportWriter.RUN_HEADER_PREFIX) and a header row, followed by the app rows of the run.
+    If a run index exists (see SummaryReader.add_run), single runs are read by seeking to their first row instead of
+    parsing the whole file.
+    App rows are returned as SummaryRow or, for summaries read with a record layout, as ResultRecord.
+    """
+
+    INDEX_SUFFIX = '.runs'
+    INDEX_SEPARATOR = ';'
+
+    def __init__(self, csv_file: str, fieldnames: List[str], run_header_prefix: str,
+                 record_layout: Union[RecordLayout, None]=None):
+        """
+        :param csv_file: the csv file
+        :param fieldnames: the ordered columns of the file, starting with the package
+        :param run_header_prefix: the prefix of run header lines
+        :param record_layout: the layout of the records to create from the app rows, None for SummaryRows
+        """
+        self.csv_file = csv_file
+        self.record_layout = record_layout
+        self.fieldnames = fieldnames
+        self.run_header_prefix = run_header_prefix
+        self.layout = dict((field, index) for index, field in enumerate(fieldnames))
+        # lines that are neither run headers, header rows nor app rows, found by the last read
+        self.malformed = 0
+
+    ### run index
+
+    @staticmethod
+    def get_index_path(csv_file: str) -> str:
+        return csv_file + SummaryReader.INDEX_SUFFIX
+
+    @staticmethod
+    def add_run(csv_file: str, run_id: str, offset: int) -> None:
+        """
+        Records where a run starts. Called by the writer of the csv file right before it writes the run header.
+        :param csv_file: the csv file
+        :param run_id: the id of the run
+        :param offset: the position of the run header in the csv file, i.e., its size before the run started
+        """
+        with open(SummaryReader.get_index_path(csv_file), 'a') as index:
+            index.write(run_id + SummaryReader.INDEX_SEPARATOR + str(offset) + '\n')
+
+    def read_index(self) -> Union[List[Tuple[str, int]], None]:
+        """
+        :return: the runs and their offsets in the csv file or None if there is no index
+        """
+        index_path = SummaryReader.get_index_path(self.csv_file)
+        if not path.isfile(index_path) or not path.isfile(self.csv_file):
+            return None
+        runs = list()
+        with open(index_path, 'r') as index:
+            for line in index:
+                run_id, separator, offset = line.strip().rpartition(SummaryReader.INDEX_SEPARATOR)
+                if not separator or not offset.isdigit():
+                    return None
+                runs.append((run_id, int(offset)))
+        return runs if runs else None
+
+    def is_complete(self, index: Union[List[Tuple[str, int]], None]) -> bool:
+        """
+        :return: whether the index covers all runs, which is not the case if the file was started by an older version
+        """
+        return index is not None and index[0][1] == 0 and self.is_run_start(index[0])
+
+    def is_run_start(self, run: Tuple[str, int]) -> bool:
+        run_id, offset = run
+        expected = (self.run_header_prefix + ' ' + run_id).encode()
+        with open(self.csv_file, 'rb') as csv_file:
+            csv_file.seek(offset)
+            return csv_file.read(len(expected)) == expected
+
+    ### parsing
+
+    def iter_rows(self, offset: int=0, end: Union[int, None]=None,
+                  run: Union[str, None]=None) -> Iterator[Union[SummaryRow, ResultRecord]]:
+        """
+        Parses the app rows of the file.
+        :param offset: position in the file to start at, must be the start of a line
+        :param end: position in the file to stop at, None for the end of the file
+        :param run: the id of the run at the offset, if known
+        :return: iterator over the app rows
+        """
+        for row_offset, row in self.iter_indexed(offset, end, run):
+            yield row
+
+    def iter_indexed(self, offset: int=0, end: Union[int, None]=None,
+                     run: Union[str, None]=None) -> Iterator[Tuple[int, Union[SummaryRow, ResultRecord]]]:
+        """
+        Parses the app rows of the file, see iter_rows.
+        :return: iterator over the positions of the app rows in the file and the rows
+        """
+        self.malformed = 0
+        if not path.isfile(self.csv_file):
+            return
+        run_id = run if run is not None else ''
+        with open(self.csv_file, 'rb') as binary_file:
+            binary_file.seek(offset)
+            # position of the next line that the csv reader consumes
+            position = [offset]
+
+            def lines() -> Iterator[str]:
+                for line in binary_file:
+                    if end is not None and position[0] >= end:
+                        return
+                    position[0] += len(line)
+                    yield line.decode()
+
+            records = csv_reader(lines(), delimiter=';', quotechar='"')
+            # except for the package, the same strings occur in many rows, e.g., categories, workers and subtask results
+            shared = dict()
+            while True:
+                record_offset = position[0]
+                record = next(records, None)
+                if record is None:
+                    break
+                if record and record[0].startswith(self.run_header_prefix):
+                    run_id = intern(record[0][len(self.run_header_prefix):].strip())
+                    continue
+                row = self.create_row(run_id, record, shared)
+                if row is not None:
+                    yield record_offset, row
+
+    def create_row(self, run_id: str, record: List[str],
+                   shared: Dict[str, str]) -> Union[SummaryRow, ResultRecord, None]:
+        """
+        :return: the app row of a parsed csv record, None for empty records, header rows and malformed records
+        """
+        num_fields = len(self.fieldnames)
+        if not record or record[0] == self.fieldnames[0]:
+            # empty line or header row
+            return None
+        if len(record) != num_fields:
+            self.malformed += 1
+            return None
+        values = list(record)
+        for index in range(1, num_fields):
+            values[index] = shared.setdefault(values[index], values[index])
+        if self.record_layout is None:
+            return SummaryRow(run_id, tuple(values), self.layout)
+        result = self.record_layout.from_values(run_id, values)
+        if result is None:
+            self.malformed += 1
+        return result
+
+    def read_runs(self) -> Dict[str, List[Union[SummaryRow, ResultRecord]]]:
+        """
+        :return: ordered mapping from run ids to the app rows of the run. Rows before the first run header belong to
+        the run ''
+        """
+        runs = dict()
+        run_ids = list()
+        index = self.read_index()
+        if self.is_complete(index):
+            # also list runs without results
+            for run_id, offset in index:
+                runs[run_id] = list()
+                run_ids.append(run_id)
+        for row in self.iter_rows():
+            if row.run not in runs:
+                runs[row.run] = list()
+                run_ids.append(row.run)
+            runs[row.run].append(row)
+        return OrderedDict((run_id, runs[run_id]) for run_id in run_ids)
+
+    def get_run_ids(self) -> List[str]:
+        """
+        :return: the ids of all runs, from the index if possible
+        """
+        index = self.read_index()
+        if self.is_complete(index):
+            return [run_id for run_id, offset in index]
+        return list(self.read_runs().keys())
+
+    def read_run(self, run_id: str) -> List[Union[SummaryRow, ResultRecord]]:
+        """
+        :return: the app rows of a single run, parsing only this run if the index allows it
+        """
+        index = self.read_index()
+        if index is not None:
+            for position, (indexed_id, offset) in enumerate(index):
+                if indexed_id != run_id:
+                    continue
+                end = index[position + 1][1] if position + 1 < len(index) else None
+                if self.is_run_start((run_id, offset)):
+                    return list(self.iter_rows(offset, end, run_id))
+                break
+        return [row for row in self.iter_rows() if row.run == run_id]
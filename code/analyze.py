@@ -9,16 +9,21 @@ from utils.filesystem_config import FilesystemConfig
 __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
 
 
-def create_parser() -> ArgumentParser:
-    parser = ArgumentParser()
+def create_parser(pre_parse: bool=False) -> ArgumentParser:
+    """
+    :param pre_parse: create a lenient parser that only looks for the evaluation and the out folder
+    """
+    parser = ArgumentParser(add_help=not pre_parse)
     parser.add_argument('evaluation',
                         metavar='<EVALUATION>',
                         action='store',
+                        nargs='?' if pre_parse else None,
                         help='The evaluation for which the result will be analyzed.')
 
     parser.add_argument('task',
                         metavar='<TASK>',
                         action='store',
+                        nargs='?' if pre_parse else None,
                         help='The analysis task that should be executed.')
 
     parser.add_argument('-o', '--out-folder',
@@ -30,17 +35,16 @@ def create_parser() -> ArgumentParser:
 
 def main() -> None:
 
-    parser = create_parser()
-    args = parser.parse_args()
+    # the evaluation and the out folder are needed to create the analyzer, which adds the options of its commands
+    # before the whole command line is parsed
+    args = create_parser(pre_parse=True).parse_known_args()[0]
+    if args.evaluation is None:
+        # prints the usage
+        create_parser().parse_args()
 
     evaluation = args.evaluation
-    task = args.task
     out_overwrite = args.out_folder
 
-    print('eval: ' + evaluation)
-    print('task: ' + task)
-    print('out overwrite: ' + str(out_overwrite))
-
     fixed_fields_front = [ReportWriter.KEY_PKG, ReportWriter.KEY_CATS]
     fixed_fields_back = [ReportWriter.KEY_SUCC, ReportWriter.KEY_WORKER, ReportWriter.KEY_TIMESTAMP]
 
@@ -57,6 +61,15 @@ def main() -> None:
 
     analyzer = evaluator.get_analyzer(fixed_fields_front=fixed_fields_front,
                                       fixed_fields_back=fixed_fields_back)
+    parser = create_parser()
+    analyzer.add_arguments(parser)
+    args = parser.parse_args()
+    analyzer.set_options(args)
+    task = args.task
+
+    print('eval: ' + evaluation)
+    print('task: ' + task)
+    print('out overwrite: ' + str(out_overwrite))
 
     api = analyzer.get_command_api()
     for command, method in api.items():
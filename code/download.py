@@ -4,22 +4,24 @@ import os
 import sys
 from shutil import disk_usage
 
+from evaluations.common import read_apps_from_path
+from repositories.gplay.GPlayDownloaderRepository import GPlayDownloaderRepository
 from repositories.gplay.MonkeyLoader import MonkeyLoaderConfig, MonkeyLoader
+from utils.filesystem_config import FilesystemConfig
 import argparse
 
 
 __author__ = 'Sebastian Weisgerber <weisgerber@cs.uni-saarland.de>'
 
 
-def terminate_if_disk_is_full(reserved_disk_space: int = MonkeyLoaderConfig.RESERVED_DISK_SPACE) -> None:
-    disk_space = disk_usage('/home')
+def terminate_if_disk_is_full(folder: str, reserved_disk_space: int = MonkeyLoaderConfig.RESERVED_DISK_SPACE) -> None:
+    # check the volume the apks are actually written to
+    disk_space = disk_usage(folder)
     print ('Disk Free: ' + str(disk_space.free) + ' of (' + str(disk_space.total) + ')')
     print ('Disk Used: ' + str(disk_space.used) + ' of (' + str(disk_space.total) + ')')
 
     if int(disk_space.free) < int(reserved_disk_space):
-        print ('Terminating Programm, /home DiskFree: ' + str(disk_space.free) + ' of (' + str(
-            disk_space.total) + ')')
-        print('Terminating Programm, /home DiskFree: ' + str(disk_space.free) + ' of (' + str(
+        print('Terminating Programm, ' + folder + ' DiskFree: ' + str(disk_space.free) + ' of (' + str(
             disk_space.total) + ')')
         sys.exit(1)
 
@@ -37,9 +39,29 @@ def setup_args():
     parser.add_argument('apk_name',
                         metavar='<APK NAME>',
                         action='store',
+                        nargs='*',
                         help='PlayStore URL: "https://play.google.com/store/apps/details'
                              '?id=com.google.android.apps.maps"'
-                             'APKName: "com.google.android.apps.maps"')
+                             'APKName: "com.google.android.apps.maps". Several apps are downloaded in parallel.')
+    parser.add_argument('-f', '--package_file',
+                        metavar='<PACKAGE_FILE>',
+                        action='store',
+                        help='Package list (as used for evaluations) with apps to download in parallel')
+    parser.add_argument('-j', '--jobs',
+                        metavar='<JOBS>',
+                        type=int,
+                        default=MonkeyLoaderConfig.PARALLEL_DOWNLOADS,
+                        help='Number of parallel downloads')
+    parser.add_argument('-r', '--rate',
+                        metavar='<DOWNLOADS_PER_MINUTE>',
+                        type=float,
+                        default=MonkeyLoaderConfig.DOWNLOAD_RATE,
+                        help='Maximum downloads per minute and account, 0 for no limit')
+    parser.add_argument('--retries',
+                        metavar='<RETRIES>',
+                        type=int,
+                        default=MonkeyLoaderConfig.DOWNLOAD_RETRIES,
+                        help='Number of retries for failed downloads')
     parser.add_argument('-a', '--apk_folder',
                         metavar='<APK_FOLDER>',
                         action='store',
@@ -66,13 +88,37 @@ def main(commandline_args) -> None:
     """
     downloader = MonkeyLoader()
 
-    terminate_if_disk_is_full()
-
-    package_name = commandline_args.apk_name
+    package_names = list(commandline_args.apk_name)
+    if commandline_args.package_file is not None:
+        terminate_if_path_does_not_exist(commandline_args.package_file)
+        package_names += [package_name for package_name in read_apps_from_path(commandline_args.package_file)[0].keys()
+                          if package_name not in package_names]
     apk_folder = commandline_args.apk_folder
 
-    if (commandline_args.apk_folder is not None):
+    if len(package_names) == 0:
+        print('No packages provided.')
+        sys.exit(1)
+
+    if apk_folder is not None:
         terminate_if_path_does_not_exist(apk_folder)
+    terminate_if_disk_is_full(apk_folder if apk_folder is not None else os.getcwd())
+
+    if len(package_names) > 1:
+        if apk_folder is None:
+            apk_folder = os.getcwd()
+        # the apps are added to the repository of the folder, like apps that evaluations download
+        FilesystemConfig(apk=apk_folder)
+        repository = GPlayDownloaderRepository()
+        results = downloader.download_all(package_names, repository, workers=commandline_args.jobs,
+                                          rate=commandline_args.rate, retries=commandline_args.retries)
+        failed = [package_name for package_name, apk_path in results.items() if apk_path is None]
+        if len(failed) > 0:
+            print('Failed downloads: ' + ', '.join(failed))
+            sys.exit(1)
+        return
+
+    package_name = package_names[0]
+    if (commandline_args.apk_folder is not None):
         downloader.download_if_not_exist(package_name, apk_folder)
     else:
         downloader.download(package_name)
@@ -0,0 +1,57 @@
+from asyncio import new_event_loop, set_event_loop
+from sys import version_info
+from threading import Thread
+from typing import List
+
+from model.IWorkerEngine import IWorkerEngine
+from model.TaskWorker import TaskWorker
+from utils import shellutils
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class AsyncioEngine(IWorkerEngine):
+    """
+    Runs all workers in the main process. Every worker runs in a thread, while the commands of all workers (adb and
+    other subprocesses) are executed on a single asyncio event loop. Compared to a process per device, the
+    repository proxies, loaded modules and logs exist only once, so a single host can drive many devices.
+    The workers are unchanged, they only block their own thread while waiting for a command.
+    """
+
+    def __init__(self):
+        self.loop = new_event_loop()
+        if version_info < (3, 8):
+            # child processes are watched with a signal handler that has to be installed from the main thread
+            from asyncio import get_child_watcher
+            get_child_watcher().attach_loop(self.loop)
+        self.loop_thread = Thread(target=self.run_loop, name='AsyncioEngine', daemon=True)
+        self.loop_thread.start()
+        shellutils.set_command_loop(self.loop)
+
+        # mapping: worker -> thread running it
+        self.threads = dict()
+
+    def run_loop(self) -> None:
+        set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start_worker(self, worker: TaskWorker) -> None:
+        thread = Thread(target=worker.run, name=worker.name, daemon=True)
+        self.threads[worker] = thread
+        thread.start()
+
+    def is_alive(self, worker: TaskWorker) -> bool:
+        return worker in self.threads and self.threads[worker].is_alive()
+
+    def join_workers(self, workers: List[TaskWorker]) -> None:
+        for worker in workers:
+            print('Joining ' + worker.name)
+            if worker in self.threads:
+                self.threads[worker].join()
+
+    def shutdown(self) -> None:
+        shellutils.set_command_loop(None)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
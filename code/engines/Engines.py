@@ -0,0 +1,33 @@
+from typing import List
+
+from engines.AsyncioEngine import AsyncioEngine
+from engines.ProcessEngine import ProcessEngine
+from model.IWorkerEngine import IWorkerEngine
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class Engines(object):
+    # ids of the available worker engines
+    PROCESS = 'process'
+    ASYNCIO = 'asyncio'
+
+    # constant map of all engines available. Instances are created on demand, since the asyncio engine starts its
+    # event loop right away
+    MAP = {PROCESS: ProcessEngine,
+           ASYNCIO: AsyncioEngine}
+
+    DEFAULT = PROCESS
+
+    @staticmethod
+    def get_ids() -> List[str]:
+        return sorted(Engines.MAP.keys())
+
+    @staticmethod
+    def create(engine_id: str) -> IWorkerEngine:
+        """
+        :param engine_id: one of the keys of MAP
+        :return: a new instance of the engine
+        """
+        return Engines.MAP[engine_id]()
@@ -0,0 +1,27 @@
+from typing import List
+
+from model.IWorkerEngine import IWorkerEngine
+from model.TaskWorker import TaskWorker
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class ProcessEngine(IWorkerEngine):
+    """
+    Runs every worker in its own process.
+    """
+
+    def start_worker(self, worker: TaskWorker) -> None:
+        worker.start()
+
+    def is_alive(self, worker: TaskWorker) -> bool:
+        return worker.is_alive()
+
+    def join_workers(self, workers: List[TaskWorker]) -> None:
+        for worker in workers:
+            print('Joining ' + worker.name)
+            worker.join()
+
+    def shutdown(self) -> None:
+        pass
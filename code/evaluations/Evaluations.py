@@ -1,3 +1,5 @@
+from typing import List, Tuple
+
 from evaluations.trace_logging.TraceLoggingEvaluator import TraceLoggingEvaluator
 
 __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
@@ -6,3 +8,44 @@ __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
 class Evaluations(object):
     # constant map of all evaluations available
     MAP = {TraceLoggingEvaluator.EVAL_ID: TraceLoggingEvaluator()}
+
+    # multiple evaluations can be combined in one run, e.g., 'trace_logging:2,sample'
+    SEPARATOR = ','
+    WEIGHT_SEPARATOR = ':'
+    DEFAULT_WEIGHT = 1
+
+    @staticmethod
+    def parse_spec(spec: str) -> List[Tuple[str, int]]:
+        """
+        Splits an evaluation argument into evaluation ids and their scheduling weights.
+        Evaluations are separated by SEPARATOR, an optional weight can be appended using WEIGHT_SEPARATOR.
+        :param spec: the evaluation argument as provided on the command line
+        :return: ordered list of (evaluation id, weight) tuples
+        :raises ValueError: for invalid weights and evaluations that are given more than once
+        """
+        result = list()
+        for entry in spec.split(Evaluations.SEPARATOR):
+            entry = entry.strip()
+            if not entry:
+                continue
+            if Evaluations.WEIGHT_SEPARATOR in entry:
+                eval_id, weight = entry.split(Evaluations.WEIGHT_SEPARATOR, 1)
+                weight = int(weight)
+                if weight < 1:
+                    raise ValueError('Evaluation weight must be positive: ' + entry)
+            else:
+                eval_id, weight = entry, Evaluations.DEFAULT_WEIGHT
+            eval_id = eval_id.strip()
+            # the results of an evaluation are written by a single report writer
+            if eval_id in [known_id for (known_id, known_weight) in result]:
+                raise ValueError('Evaluation given more than once: ' + eval_id)
+            result.append((eval_id, weight))
+        return result
+
+    @staticmethod
+    def get_ids(spec: str) -> List[str]:
+        """
+        :param spec: the evaluation argument as provided on the command line
+        :return: the ids of all evaluations contained in the argument
+        """
+        return [eval_id for (eval_id, weight) in Evaluations.parse_spec(spec)]
@@ -9,9 +9,16 @@ class Task(ITask):
     def __init__(self, package_name: str, categories: List[str]):
         self.package = package_name
         self.categories = categories
+        self.rejected_devices = list()
 
     def get_categories(self) -> List[str]:
         return self.categories
 
     def get_package(self) -> str:
         return self.package
+
+    def get_rejected_devices(self) -> List[str]:
+        return self.rejected_devices
+
+    def reject(self, device_id: str) -> None:
+        self.rejected_devices.append(device_id)
@@ -1,7 +1,11 @@
 # reads apps from an input list
 # returns: (map: package->list(category), unique app count)
+from argparse import ArgumentTypeError
+from collections import OrderedDict
+from hashlib import md5
 from os.path import join
-from typing import List, Dict, Tuple
+from random import Random
+from typing import List, Dict, Tuple, Union
 
 from utils.filesystem_config import FilesystemConfig
 
@@ -16,10 +20,18 @@ def read_apps(packages_file: str) -> Tuple[Dict[str, List[str]], int]:
 
     # realtive to search dir
     lists_dir = FilesystemConfig().get_lists_dir()
-    packages_path = join(lists_dir, packages_file)
+    return read_apps_from_path(join(lists_dir, packages_file))
 
-    # mapping: app -> list(category)
-    app_dictionary = dict()
+
+def read_apps_from_path(packages_path: str) -> Tuple[Dict[str, List[str]], int]:
+    """
+    Reads package names from a list file.
+    :param packages_path: the path of the list file
+    :return: a tuple of the dictionary mapping from package names to categories, and the amount of unique apps
+    """
+
+    # mapping: app -> list(category), in the order of the list so that selections do not depend on the hash seed
+    app_dictionary = OrderedDict()
     # mock category for apps without a real category
     current_category = "<NO_CATEGORY>"
     # number of unique apps
@@ -44,3 +56,177 @@ def read_apps(packages_file: str) -> Tuple[Dict[str, List[str]], int]:
 
                 app_dictionary[package_name].append(current_category)
     return app_dictionary, unique_count
+
+
+def build_category_index(app_dictionary: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """
+    Inverts the mapping returned by read_apps.
+    :param app_dictionary: mapping from package names to categories
+    :return: ordered mapping from categories to their package names, in the order of their first occurrence in the list
+    file
+    """
+    category_index = OrderedDict()
+    for package_name, categories in app_dictionary.items():
+        for category in categories:
+            category_index.setdefault(category, list()).append(package_name)
+    return category_index
+
+
+def sample_balanced(category_index: Dict[str, List[str]], size: int, random: Random) -> List[str]:
+    """
+    Samples apps evenly from all categories: the categories take turns, each contributing a random app that was not
+    sampled yet, until enough apps are sampled. Small categories are exhausted first, the others fill up the sample.
+    :param category_index: mapping from categories to package names, see build_category_index
+    :param size: the number of apps to sample
+    :param random: the source of randomness, seeded by the caller for reproducible samples
+    :return: the sampled package names
+    """
+    # shuffled copies, apps are taken from the end
+    remaining = list()
+    for category in category_index.keys():
+        package_names = list(category_index[category])
+        random.shuffle(package_names)
+        remaining.append(package_names)
+
+    sample = list()
+    sampled = set()
+    while len(sample) < size and remaining:
+        for package_names in remaining:
+            # skip apps of several categories that were sampled for another one
+            while package_names and package_names[-1] in sampled:
+                package_names.pop()
+            if package_names and len(sample) < size:
+                package_name = package_names.pop()
+                sample.append(package_name)
+                sampled.add(package_name)
+        remaining = [package_names for package_names in remaining if package_names]
+    return sample
+
+
+def sample_stratified(category_index: Dict[str, List[str]], size: int, random: Random) -> List[str]:
+    """
+    Samples apps so that every category is represented in proportion to its size. Apps of several categories count
+    for the first category they are sampled for, and the sample is filled up with random apps if this leaves it short.
+    :param category_index: mapping from categories to package names, see build_category_index
+    :param size: the number of apps to sample
+    :param random: the source of randomness, seeded by the caller for reproducible samples
+    :return: the sampled package names
+    """
+    total = sum(len(package_names) for package_names in category_index.values())
+    if total == 0:
+        return list()
+
+    # largest remainder method: every category gets the integer part of its share, the largest remainders get the rest
+    shares = dict((category, size * len(package_names) / total) for category, package_names in category_index.items())
+    quotas = dict((category, int(share)) for category, share in shares.items())
+    by_remainder = sorted(category_index.keys(), key=lambda category: shares[category] - quotas[category], reverse=True)
+    for category in by_remainder[:size - sum(quotas.values())]:
+        quotas[category] += 1
+
+    sample = list()
+    sampled = set()
+    rest = list()
+    for category, package_names in category_index.items():
+        shuffled = list(package_names)
+        random.shuffle(shuffled)
+        taken = 0
+        for package_name in shuffled:
+            if package_name in sampled:
+                continue
+            if taken < quotas[category]:
+                sample.append(package_name)
+                sampled.add(package_name)
+                taken += 1
+            else:
+                rest.append(package_name)
+
+    random.shuffle(rest)
+    for package_name in rest:
+        if len(sample) >= size:
+            break
+        if package_name not in sampled:
+            sample.append(package_name)
+            sampled.add(package_name)
+    return sample
+
+
+def limit_per_category(category_index: Dict[str, List[str]], limit: int) -> List[str]:
+    """
+    :param category_index: mapping from categories to package names, see build_category_index
+    :param limit: the maximum number of apps per category
+    :return: the first apps of every category, apps of several categories are included if one of them selects them
+    """
+    selected = list()
+    seen = set()
+    for package_names in category_index.values():
+        for package_name in package_names[:limit]:
+            if package_name not in seen:
+                selected.append(package_name)
+                seen.add(package_name)
+    return selected
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    Parses shards given on the command line.
+    :param value: the shard as <index>/<count>, with 1-based indices, e.g., 2/4 for the second of four shards
+    :return: the 1-based index and the number of shards
+    """
+    index, separator, count = value.partition('/')
+    if not separator or not index.isdigit() or not count.isdigit() or not 1 <= int(index) <= int(count):
+        raise ArgumentTypeError('Expected a shard of the form <index>/<count> with 1 <= index <= count, got: ' + value)
+    return int(index), int(count)
+
+
+def parse_positive(value: str) -> int:
+    """
+    Parses sizes and limits given on the command line.
+    :param value: a positive integer
+    :return: the integer
+    """
+    if not value.isdigit() or int(value) < 1:
+        raise ArgumentTypeError('Expected a positive integer, got: ' + value)
+    return int(value)
+
+
+def in_shard(package_name: str, shard: Tuple[int, int]) -> bool:
+    """
+    Assigns apps to shards by a hash of their package name, so every host that evaluates one of the shards of a list
+    selects a disjoint part of it without coordination, regardless of the order of the list or Python's hash seed.
+    :param package_name: the package name of the app
+    :param shard: the 1-based index and the number of shards, see parse_shard
+    :return: whether the app belongs to the shard
+    """
+    index, count = shard
+    digest = md5(package_name.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count == index - 1
+
+
+def select_apps(app_dictionary: Dict[str, List[str]], shard: Union[Tuple[int, int], None]=None,
+                per_category_limit: Union[int, None]=None, sample_size: Union[int, None]=None, seed: int=0,
+                balanced: bool=False) -> Dict[str, List[str]]:
+    """
+    Selects the apps to evaluate from a list. The shard is selected first, then the limit per category is applied and
+    the sample is drawn from the remaining apps.
+    :param app_dictionary: mapping from package names to categories, see read_apps
+    :param shard: the shard to select, see parse_shard, None for all apps
+    :param per_category_limit: the maximum number of apps per category, None for no limit
+    :param sample_size: the number of apps to sample, stratified by category, None for all apps
+    :param seed: the seed of the sample, the same seed selects the same sample
+    :param balanced: sample the same number of apps from every category instead of sampling proportionally
+    :return: the selected part of the mapping, in the order of the list
+    """
+    selected = [package_name for package_name in app_dictionary.keys()
+                if shard is None or in_shard(package_name, shard)]
+    if per_category_limit is not None:
+        selected = limit_per_category(build_category_index(OrderedDict((package_name, app_dictionary[package_name])
+                                                                       for package_name in selected)),
+                                      per_category_limit)
+    if sample_size is not None:
+        category_index = build_category_index(OrderedDict((package_name, app_dictionary[package_name])
+                                                          for package_name in selected))
+        sampler = sample_balanced if balanced else sample_stratified
+        selected = sampler(category_index, sample_size, Random(seed))
+    selected = set(selected)
+    return OrderedDict((package_name, categories) for package_name, categories in app_dictionary.items()
+                       if package_name in selected)
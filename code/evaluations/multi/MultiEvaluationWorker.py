@@ -0,0 +1,52 @@
+from typing import Dict
+
+from DeviceWorker import DeviceWorker
+from evaluations.multi.TaskBundle import TaskBundle
+from model.TaskQueue import TaskQueue
+from utils.device_apk_cache import DeviceApkCache
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class MultiEvaluationWorker(DeviceWorker):
+    """
+    Device worker that processes task bundles of several evaluations on one device.
+    The actual work is delegated to the evaluation-specific workers, which are never started as own processes but
+    executed in the context of this one. Each of them reports to the report queue of its evaluation.
+    """
+
+    def __init__(self, group=None, target: str=None, name: str="DeviceProcess", args=(), kwargs={}, control_channel=None,
+                 queue: TaskQueue=None, device_id: str=None, workers: Dict[str, DeviceWorker]=None,
+                 device_pool: Dict[str, Dict[str, str]]=None):
+        # results are reported by the delegates, so this worker does not need a report queue
+        super(MultiEvaluationWorker, self).__init__(group, target, name, args, kwargs, control_channel, queue, None,
+                                                    device_id, device_pool=device_pool)
+
+        if not workers:
+            raise AssertionError('No evaluation workers provided. Abort.')
+        self.workers = workers
+
+    # the delegates are never started, so they share the cache of this worker, which covers the same device
+    def set_apk_cache(self, apk_cache: DeviceApkCache) -> None:
+        super(MultiEvaluationWorker, self).set_apk_cache(apk_cache)
+        for worker in self.workers.values():
+            worker.set_apk_cache(apk_cache)
+
+    def process(self, bundle: TaskBundle) -> None:
+        self.start_task(bundle)
+
+        for eval_id, task in bundle.tasks.items():
+            worker = self.workers[eval_id]
+            self.log('Processing ' + bundle.get_package() + ' for evaluation ' + eval_id)
+            try:
+                worker.process(task)
+            except KeyboardInterrupt:
+                raise
+            except Exception as generic_exception:
+                worker.log('Error: Aborting task due to exception: ' + str(generic_exception))
+                # fallthrough to send an (incomplete) report
+            worker.send_report()
+
+    # the delegates clean up after each of their tasks
+    def cleanup(self, task: TaskBundle) -> None:
+        pass
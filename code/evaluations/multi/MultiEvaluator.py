@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from typing import List, Dict, Tuple
+
+from DeviceWorker import DeviceWorker
+from evaluations.multi.MultiEvaluationWorker import MultiEvaluationWorker
+from evaluations.multi.TaskBundle import TaskBundle
+from model.IEvaluator import IEvaluator
+from model.TaskQueue import TaskQueue
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class MultiEvaluator(object):
+    """
+    Combines the task queues of several evaluations into one queue that is served by a shared device pool.
+
+    Evaluations are interleaved using weighted fair (stride) scheduling: each evaluation advances its virtual time by
+    1/weight whenever one of its tasks is scheduled and the evaluation with the lowest virtual time is served next.
+    Tasks of different evaluations that target the same package are bundled, so the apk is only obtained once and all
+    evaluations of an app run on the same device directly after each other.
+    """
+
+    def __init__(self, evaluators: List[Tuple[IEvaluator, int]]):
+        if len(evaluators) == 0:
+            raise AssertionError('No evaluators provided.')
+        self.evaluators = evaluators
+
+    def create_task_queue(self, skips: Dict[str, List[str]]) -> TaskQueue:
+        """
+        :param skips: mapping from eval ids to packages that should not be processed for the respective evaluation
+        :return: queue of TaskBundles in scheduling order
+        """
+        bundles = self.schedule(skips)
+        queue = TaskQueue(max(len(bundles), 1))
+        for bundle in bundles:
+            queue.put(bundle)
+        return queue
+
+    def schedule(self, skips: Dict[str, List[str]]) -> List[TaskBundle]:
+        # mapping: eval id -> (ordered mapping: package -> task) of tasks that are not scheduled yet
+        pending = OrderedDict()
+        strides = dict()
+        passes = dict()
+        for evaluator, weight in self.evaluators:
+            eval_id = evaluator.get_eval_id()
+            tasks = OrderedDict()
+            for task in evaluator.create_task_list(skips.get(eval_id, list())):
+                tasks[task.get_package()] = task
+            pending[eval_id] = tasks
+            strides[eval_id] = 1.0 / weight
+            passes[eval_id] = 0.0
+
+        bundles = list()
+        while True:
+            candidates = [eval_id for eval_id, tasks in pending.items() if len(tasks) > 0]
+            if len(candidates) == 0:
+                break
+            # min is stable, so ties are resolved in the order the evaluations were provided
+            current = min(candidates, key=lambda e: passes[e])
+            package, task = pending[current].popitem(last=False)
+
+            bundle = TaskBundle(package)
+            bundle.add(current, task)
+            passes[current] += strides[current]
+
+            # piggyback all other evaluations of the same app, they are charged as if they were scheduled now
+            for eval_id, tasks in pending.items():
+                if eval_id != current and package in tasks:
+                    bundle.add(eval_id, tasks.pop(package))
+                    passes[eval_id] += strides[eval_id]
+            bundles.append(bundle)
+        return bundles
+
+    def create_device_worker(self, control_channel, queue: TaskQueue, device_id: str,
+                             report_queues: Dict[str, TaskQueue], process_args=(), process_kwargs={}, device_pool: Dict[str, Dict[str, str]]=None) \
+            -> DeviceWorker:
+        """
+        :param report_queues: mapping from eval ids to the report queues of the corresponding reporters
+        :param device_pool: system properties of all devices that process the queue
+        :return: a worker that delegates the bundled tasks to the workers of the single evaluations
+        """
+        process_name = 'device_' + device_id
+        workers = OrderedDict()
+        for evaluator, weight in self.evaluators:
+            eval_id = evaluator.get_eval_id()
+            # delegates are never started, so they get a private (and always empty) queue. Since they cannot hand
+            # single tasks of a bundle to other devices, they only know their own device
+            own_pool = {device_id: device_pool[device_id]} if device_pool and device_id in device_pool else None
+            workers[eval_id] = evaluator.create_device_worker(control_channel, TaskQueue(), device_id,
+                                                              report_queues[eval_id], device_pool=own_pool)
+        return MultiEvaluationWorker(name=process_name, args=process_args, kwargs=process_kwargs,
+                                     control_channel=control_channel, queue=queue, device_id=device_id,
+                                     workers=workers, device_pool=device_pool)
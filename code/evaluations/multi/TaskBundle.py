@@ -0,0 +1,38 @@
+from collections import OrderedDict
+from typing import List
+
+from model.ITask import ITask
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class TaskBundle(ITask):
+    """
+    Groups the tasks of several evaluations that target the same package, so they are processed by the same device
+    directly after each other.
+    """
+
+    def __init__(self, package_name: str):
+        self.package = package_name
+        self.categories = list()
+        # mapping: eval id -> task, in processing order
+        self.tasks = OrderedDict()
+        self.rejected_devices = list()
+
+    def add(self, eval_id: str, task: ITask) -> None:
+        self.tasks[eval_id] = task
+        for category in task.get_categories():
+            if category not in self.categories:
+                self.categories.append(category)
+
+    def get_categories(self) -> List[str]:
+        return self.categories
+
+    def get_package(self) -> str:
+        return self.package
+
+    def get_rejected_devices(self) -> List[str]:
+        return self.rejected_devices
+
+    def reject(self, device_id: str) -> None:
+        self.rejected_devices.append(device_id)
@@ -1,15 +1,16 @@
 from argparse import ArgumentParser
-from multiprocessing import Queue
+from collections import OrderedDict
 from typing import List, Dict
 
 from DeviceWorker import DeviceWorker
 from analysis.ResultAnalyzer import ResultAnalyzer
 from evaluations.Task import Task
-from evaluations.common import read_apps
+from evaluations.common import read_apps, parse_shard, parse_positive, select_apps, build_category_index
 from evaluations.trace_logging.TraceLoggingWorker import TraceLoggingWorker
 from model.IAppRepository import IAppRepository
 from model.IEvaluator import IEvaluator
-from repositories.gplay.GPlayDownloaderRepository import GPlayDownloaderRepository
+from model.TaskQueue import TaskQueue
+from repositories.Repositories import Repositories
 
 __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
 
@@ -45,6 +46,8 @@ class TraceLoggingEvaluator(IEvaluator):
     ARG_PKG_LIST = 'package_list'
     ARG_APK_FOLDER = 'apk_folder'
     ARG_REVERSE = 'reverse'
+    ARG_REINSTALL = 'reinstall'
+    ARG_PIPELINE = 'pipeline'
 
     # parcel
     SEPARATOR = '::'
@@ -52,6 +55,14 @@ class TraceLoggingEvaluator(IEvaluator):
     def __init__(self):
         self.package_list = None
         self.reverse = False
+        self.reinstall = False
+        self.pipeline = False
+        # selection of the apps from the package list
+        self.shard = None
+        self.per_category_limit = None
+        self.sample = None
+        self.seed = 0
+        self.balanced = False
 
     def init(self) -> None:
         parser = self.create_parser()
@@ -59,12 +70,21 @@ class TraceLoggingEvaluator(IEvaluator):
         # we only care for the recognized args
         args = parser.parse_known_args()[0]
 
-        if args.evaluation != TraceLoggingEvaluator.EVAL_ID:
+        # local import to avoid circular dependency
+        from evaluations.Evaluations import Evaluations
+        if TraceLoggingEvaluator.EVAL_ID not in Evaluations.get_ids(args.evaluation):
             print('Error! Wrong evaluation provided. Expected "' + TraceLoggingEvaluator.EVAL_ID + '"')
             exit(-1)
 
         self.package_list = args.package_list
         self.reverse = args.reverse
+        self.reinstall = args.reinstall
+        self.pipeline = args.pipeline
+        self.shard = args.shard
+        self.per_category_limit = args.per_category_limit
+        self.sample = args.sample
+        self.seed = args.seed
+        self.balanced = args.balanced
 
     def create_parser(self) -> ArgumentParser:
         parser = ArgumentParser()
@@ -82,27 +102,83 @@ class TraceLoggingEvaluator(IEvaluator):
         parser.add_argument('-r', '--reverse',
                             action='store_true',
                             help='Activating this flag leads to a reverse processing of the package list')
+
+        parser.add_argument('--reinstall',
+                            action='store_true',
+                            help='Reinstall apps before instrumenting them instead of only clearing their data')
+
+        parser.add_argument('--pipeline',
+                            action='store_true',
+                            help='Push the apk of the next app to the device while the current app is tested')
+
+        parser.add_argument('--shard',
+                            metavar='<INDEX>/<COUNT>',
+                            action='store',
+                            type=parse_shard,
+                            help='Only evaluate one of COUNT disjoint parts of the package list (1-based INDEX), e.g., '
+                                 '2/4 on the second of four hosts. Apps are assigned by a hash of their package name')
+
+        parser.add_argument('--per-category-limit',
+                            metavar='<LIMIT>',
+                            action='store',
+                            type=parse_positive,
+                            help='Only evaluate the first LIMIT apps of every category')
+
+        parser.add_argument('--sample',
+                            metavar='<SIZE>',
+                            action='store',
+                            type=parse_positive,
+                            help='Only evaluate a random sample of SIZE apps, with every category represented in '
+                                 'proportion to its size')
+
+        parser.add_argument('--seed',
+                            action='store',
+                            type=int,
+                            default=0,
+                            help='Seed of the sample, the same seed selects the same apps (default: 0)')
+
+        parser.add_argument('--balanced',
+                            action='store_true',
+                            help='Sample the same number of apps from every category')
         return parser
 
-    def create_task_queue(self, skip: int=0) -> Queue:
+    def create_task_queue(self, skip: List[str]=list()) -> TaskQueue:
+        tasks = self.create_task_list(skip)
+        queue = TaskQueue(max(len(tasks), 1))
 
+        for task in tasks:
+            queue.put(task)
+        return queue
+
+    def create_task_list(self, skip: List[str]=list()) -> List[Task]:
         app_dict, num_apps = read_apps(self.package_list)
-        queue = Queue(num_apps)
+        app_dict = select_apps(app_dict, shard=self.shard, per_category_limit=self.per_category_limit,
+                               sample_size=self.sample, seed=self.seed, balanced=self.balanced)
+        if len(app_dict) < num_apps:
+            print('Selected ' + str(len(app_dict)) + ' of ' + str(num_apps) + ' apps from ' + self.package_list)
 
+        tasks = list()
         for app,categories in app_dict.items():
             if app in skip:
                 print('Skipping already processed app ' + app)
                 continue
-            queue.put(Task(app, categories))
-        return queue
-
-    def create_device_worker(self, control_channel, queue: Queue, device_id: str, report_queue, process_args=(),
-                             process_kwargs={}) -> DeviceWorker:
+            tasks.append(Task(app, categories))
+        # the totals for the statistics per category that the report writer prints
+        for category, packages in build_category_index(OrderedDict((task.get_package(), task.get_categories())
+                                                                   for task in tasks)).items():
+            print('Queued ' + str(len(packages)) + ' apps of category ' + category)
+        # keep the apks of queued apps if the apk folder runs out of space
+        self.get_app_repository().pin_apps([task.get_package() for task in tasks])
+        return tasks
+
+    def create_device_worker(self, control_channel, queue: TaskQueue, device_id: str, report_queue, process_args=(),
+                             process_kwargs={}, device_pool: Dict[str, Dict[str, str]]=None) -> DeviceWorker:
         process_name = 'device_' + device_id
         repo = self.get_app_repository()
         return TraceLoggingWorker(name=process_name, args=process_args, kwargs=process_kwargs,
                              control_channel=control_channel, queue=queue, device_id=device_id, report_queue=report_queue,
-                             app_repo=repo)
+                             app_repo=repo, reinstall=self.reinstall, pipeline=self.pipeline,
+                             device_pool=device_pool)
 
     def get_eval_id(self) -> str:
         return TraceLoggingEvaluator.EVAL_ID
@@ -125,6 +201,7 @@ class TraceLoggingEvaluator(IEvaluator):
         return ResultAnalyzer(self, fixed_fields_front, fixed_fields_back)
 
     def get_app_repository(self) -> IAppRepository:
-        return GPlayDownloaderRepository()
+        # selected on the command line and shared by all workers
+        return Repositories.get_app_repository()
 
 
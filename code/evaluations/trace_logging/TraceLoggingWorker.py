@@ -1,9 +1,10 @@
-from multiprocessing import Queue
+from typing import Dict
 
 from DeviceWorker import DeviceWorker
 from evaluations.Task import Task
 from model.IAppRepository import IAppRepository
-from utils.shellutils import adb_install, adb_shell, adb_uninstall
+from model.TaskQueue import TaskQueue
+from utils.device_script import DeviceScript
 
 __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
 
@@ -11,16 +12,22 @@ __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
 class TraceLoggingWorker(DeviceWorker):
 
     def __init__(self, group=None, target: str=None, name: str="DeviceProcess", args=(), kwargs={}, control_channel=None,
-                 queue: Queue=None, report_queue: Queue=None, device_id: str=None,
+                 queue: TaskQueue=None, report_queue: TaskQueue=None, device_id: str=None,
                  app_repo: IAppRepository=None, artist_package: str='saarland.cispa.artist.artistgui',
-                 artist_activity: str='ArtistMainActivity'):
+                 artist_activity: str='ArtistMainActivity', reinstall: bool=False, pipeline: bool=False,
+                 device_pool: Dict[str, Dict[str, str]]=None):
         super(TraceLoggingWorker, self).__init__(group, target, name, args, kwargs, control_channel, queue, report_queue,
-                                                 device_id, artist_package, artist_activity)
+                                                 device_id, artist_package, artist_activity, device_pool)
 
         if app_repo is None:
             raise AssertionError('App repository is not available. Abort.')
         self.repo = app_repo
 
+        # whether the app is reinstalled instead of resetting its data before the instrumentation
+        self.reinstall = reinstall
+        # whether the apk of the next app is pushed to the device while the current one is tested
+        self.pipeline = pipeline
+
     def process(self, task: Task) -> None:
         # local import to avoid circular dependency
         from evaluations.trace_logging.TraceLoggingEvaluator import TraceLoggingEvaluator
@@ -28,25 +35,53 @@ class TraceLoggingWorker(DeviceWorker):
         app = task.package
         seed = self.generate_monkey_seed()
         self.start_task(task)
+        # apps that are known to be incompatible never reach the device, so there is nothing to clean up
+        device_used = False
 
         try:
             # check if app is available
             self.start_subtask(TraceLoggingEvaluator.SUBTASK_TEST_AVAILABLE)
-            app_path = self.repo.get_app(app)
-            app_available = app_path is not None
+            # the previous task might still be staging this app
+            self.wait_for_staging()
+            app_paths = self.repo.get_app_set(app)
+            app_available = len(app_paths) > 0
             self.conclude_subtask(app_available)
             if not app_available:
                 self.log('App not downloaded. Abort.')
                 return
 
+            # predictable installation failures are resolved without the device
+            metadata = self.repo.get_app_metadata(app)
+            incompatibility = self.get_incompatibility(metadata)
+            if incompatibility is not None:
+                if self.route_task(task, metadata):
+                    return
+                self.start_subtask(TraceLoggingEvaluator.SUBTASK_INSTALL_APP_1, clear_logcat=False)
+                self.log('App is not compatible with the device: ' + incompatibility)
+                self.conclude_subtask(False)
+                return
+
             # install app for the first time
+            device_used = True
             self.start_subtask(TraceLoggingEvaluator.SUBTASK_INSTALL_APP_1)
-            (success2, out2) = adb_install(app_path, device=self.device_id)
+            (success2, out2) = self.install_apks(app_paths)
             self.log(out2)
+            if not success2:
+                # the repository trusts apks it handed out before, so make sure they were not damaged meanwhile
+                replacement = self.repo.recheck_app_set(app)
+                if len(replacement) > 0:
+                    self.log('The apks of ' + app + ' changed since they were handed out. Installing them again.')
+                    app_paths = replacement
+                    (success2, out2) = self.install_apks(app_paths)
+                    self.log(out2)
             self.conclude_subtask(success2, include_logcat=True)
             if not success2:
                 return
 
+            # the usb link is idle from here on while the app is tested and instrumented
+            if self.pipeline:
+                self.prefetch_next_app()
+
             # test uninstrumented app. We are interested in whether apps might be broken already BEFORE we instrument
             self.start_subtask(TraceLoggingEvaluator.SUBTASK_TEST_UNINSTRUMENTED)
             success3 = self.monkey_test(app, seed)
@@ -54,10 +89,10 @@ class TraceLoggingWorker(DeviceWorker):
             if not success3:
                 return
 
-            # clean (re)installation of app
+            # clean state of the app, either by clearing its data or by reinstalling it
             self.start_subtask(TraceLoggingEvaluator.SUBTASK_INSTALL_APP_2)
-            (success4, out4) = adb_install(app_path, device=self.device_id)
-            self.log(out4)
+            (success4, reset_method) = self.reset_app(app, app_paths, clear_data=not self.reinstall)
+            self.log('Reset method: ' + reset_method)
             self.conclude_subtask(success4, include_logcat=True)
             if not success4:
                 return
@@ -76,7 +111,31 @@ class TraceLoggingWorker(DeviceWorker):
 
         # always cleanup no matter where we finish
         finally:
-            self.cleanup(task)
+            if device_used:
+                self.cleanup(task)
+            elif self.current_task is not None:
+                # reports always cover the cleanup, which trivially succeeds if the app never reached the device
+                self.start_subtask(TraceLoggingEvaluator.SUBTASK_CLEANUP, clear_logcat=False)
+                self.log('Nothing to clean up for task ' + app)
+                self.conclude_subtask(True)
+            # tasks handed to another device are still queued
+            if self.current_task is not None:
+                self.repo.unpin_app(app)
+
+    def prefetch_next_app(self) -> None:
+        """
+        Obtain the apk of the next task and push it to the device in the background.
+        """
+        next_task = self.peek_task()
+        if next_task is None:
+            return
+        def resolve():
+            app_paths = self.repo.get_app_set(next_task.get_package())
+            # apk sets are installed in a single session from the host and therefore not staged
+            return app_paths[0] if len(app_paths) == 1 else None
+
+        self.log('Staging apk of the next app ' + next_task.get_package())
+        self.stage_apk_async(resolve)
 
     # best effort cleanup since we do not know what apps and data are still on the device
     def cleanup(self, task: Task) -> None:
@@ -87,20 +146,31 @@ class TraceLoggingWorker(DeviceWorker):
         app_package = task.package
         self.log('Clean up for task ' + app_package)
 
-        artist_succ, artist_out = adb_shell('am force-stop ' + self.artist_package, device=self.device_id)
-        self.log(('un' if not artist_succ else '') + 'successfully stopped ARTistGUI')
-        self.log(artist_out)
-
-        app_succ, app_out = adb_uninstall(app_package, device=self.device_id)
-        self.log(('un' if not app_succ else '') + 'successfully deinstalled ' + app_package + ': ')
-        self.log(app_out)
-
-        # delete all result files
-        del_succ, del_out = adb_shell('rm ' + self.instrumentation_result_path() + '*', device=self.device_id)
-        self.log(('un' if not del_succ else '') + 'successfully removed result files: ')
-        self.log(del_out)
-
-        # TODO in order to reliably report whether cleaning up worked,
-        # we need to find out what needs to be cleaned up and then check if it worked.
-        # Either we remember it during the processing or simply probe whether an app is installed or a file is present
-        self.conclude_subtask(True, include_logcat=True)
\ No newline at end of file
+        # clean up and probe the resulting state in a single adb call
+        result_files = self.instrumentation_result_path() + '*'
+        script = DeviceScript(self.device_id)
+        script.add('stop_artist', 'am force-stop ' + self.artist_package)
+        script.add('uninstall', 'pm uninstall ' + app_package)
+        script.add('remove_results', 'rm -f ' + result_files)
+        script.add('probe_installed', 'pm list packages ' + app_package)
+        script.add('probe_results', 'ls ' + result_files)
+        script_succ, results = script.run()
+
+        for step in ['stop_artist', 'uninstall', 'remove_results']:
+            exit_code, out = results[step]
+            self.log(step + ' exited with ' + str(exit_code) + ('' if not out else ': ' + out))
+
+        # the cleanup steps fail if there is nothing to clean up, so the probes decide whether it worked.
+        # 'pm list packages' filters by substring and exits with 1 if nothing matches
+        probed = results['probe_installed'][0] in [0, 1]
+        still_installed = ('package:' + app_package) in results['probe_installed'][1].split('\n')
+        leftover_files = results['probe_results'][1] if DeviceScript.succeeded(results, 'probe_results') else ''
+        if not script_succ or not probed:
+            self.log('Probing the device state failed')
+        if still_installed:
+            self.log(app_package + ' is still installed')
+        if leftover_files:
+            self.log('Leftover result files: ' + leftover_files)
+
+        self.conclude_subtask(script_succ and probed and not still_installed and not leftover_files,
+                              include_logcat=True)
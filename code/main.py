@@ -1,6 +1,7 @@
 from argparse import ArgumentParser
+from collections import OrderedDict
 from multiprocessing import Pipe
-from os import makedirs, path
+from os import makedirs, path, remove
 from sys import argv
 from time import sleep
 
@@ -9,10 +10,14 @@ from typing import List
 
 from DeviceWorker import DeviceWorker
 from ReportWriter import ReportWriter
+from engines.Engines import Engines
 from evaluations.Evaluations import Evaluations
+from evaluations.multi.MultiEvaluator import MultiEvaluator
+from model.IResultAnalyzer import IResultAnalyzer
 from model.TaskWorker import TaskWorker
+from repositories.Repositories import Repositories
 from utils import shellutils
-from utils.filesystem_config import FilesystemConfig
+from utils.filesystem_config import FilesystemConfig, parse_size
 
 __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
 
@@ -33,12 +38,74 @@ def wait_for_workers(workers: List[TaskWorker]) -> None:
         p.join()
 
 
+def delete_results(analyzer: IResultAnalyzer, eval_id: str) -> None:
+    """
+    Deletes the results and reports of an evaluation, but not those of other evaluations in the same out folder.
+    :param analyzer: the analyzer of the evaluation
+    :param eval_id: the id of the evaluation
+    """
+    for result_file in analyzer.get_result_files():
+        if path.isfile(result_file):
+            remove(result_file)
+    reports_dir = ReportWriter.get_reports_dir(eval_id)
+    if path.isdir(reports_dir):
+        shutil.rmtree(reports_dir)
+
+
+def ask_for_resume(analyzer: IResultAnalyzer, eval_id: str) -> List[str]:
+    """
+    Asks the user whether a previously started evaluation should be resumed.
+    :param analyzer: the analyzer of the evaluation
+    :param eval_id: the id of the evaluation, whose data is deleted in case the evaluation is not resumed
+    :return: packages that have already been tested and should be skipped
+    """
+    tested = analyzer.get_tested_packages()
+    # if unfinished_runs_exist(evaluation_name):
+    #     cont = input("Evaluation was finished prematurely the last time. Do you want to proceed? (y/n)").lower()
+    #     if cont == 'y' or cont == 'yes':
+    #         # restore state if present (do not count from 0)
+    #         (tested, succeeded) = read_progress(get_save_path(evaluation_name))
+    #     else:
+    #         if cont != 'n' and cont != 'no':
+    #             print('No valid answer given. Treated as no.')
+    #         print('Deleting saved progress.')
+    #         remove(get_save_path(evaluation_name))
+
+    skip = []
+    if len(tested) > 0:
+        sure = False
+        while not sure:
+            cont = input('Evaluation ' + eval_id +
+                         ' was finished prematurely the last time. Do you want to proceed? (y/n)').lower()
+            # continue
+            if cont == 'y' or cont == 'yes':
+                print('Proceeding with evaluation.')
+                print('Current state:')
+                analyzer.api_progress()
+                skip = tested
+                sure = True
+            # do not continue
+            else:
+                if cont != 'n' and cont != 'no':
+                    print('No valid answer given. Treated as no.')
+                print('Do not proceed with evaluation.')
+
+                delete = input(
+                    'Are you sure you want to delete all persisted data from the last evaluation? (y/n)').lower()
+                if delete == 'y' or delete == 'yes':
+                    # delete data from last evaluation
+                    delete_results(analyzer, eval_id)
+                    sure = True
+    return skip
+
+
 def create_parser() -> ArgumentParser:
     parser = ArgumentParser()
     parser.add_argument('evaluation',
                         metavar='<EVALUATION>',
                         action='store',
-                        help='The evaluation that will be invoked.')
+                        help='The evaluation that will be invoked. Several evaluations can share the devices by '
+                             'separating them with "," and weighting them with ":", e.g., "trace_logging:2,sample".')
 
     parser.add_argument('package-list',
                         metavar='<PACKAGE_LIST>',
@@ -58,6 +125,34 @@ def create_parser() -> ArgumentParser:
     parser.add_argument('-l', '--list-folder',
                         action='store',
                         help='Search folder for package lists.')
+    parser.add_argument('--repository',
+                        action='store',
+                        choices=Repositories.get_ids(),
+                        default=Repositories.DEFAULT,
+                        help='Source of the apps under test: the apk folder only (local), a mirror folder (mirror), '
+                             'an HTTP mirror (http) or the Google Play Store (gplay).')
+    parser.add_argument('--mirror',
+                        action='store',
+                        help='Folder or URL of the mirror used by the mirror and http repositories.')
+    parser.add_argument('--apk-budget',
+                        action='store',
+                        help='Maximum size of the downloaded apks, e.g., "50G". Apks of apps that are not queued '
+                             'anymore are removed to stay within the budget.')
+    parser.add_argument('--apk-reserve',
+                        action='store',
+                        help='Free space to keep on the volume of the apk folder, e.g., "5G". Apks of apps that are '
+                             'not queued anymore are removed to keep it. By default, no space is reserved.')
+    parser.add_argument('--apk-eviction',
+                        action='store',
+                        choices=['lru', 'lfu'],
+                        default='lru',
+                        help='Remove the least recently (lru) or least frequently (lfu) used apks first.')
+    parser.add_argument('--engine',
+                        action='store',
+                        choices=Engines.get_ids(),
+                        default=Engines.DEFAULT,
+                        help='Run every device worker in its own process (process) or all of them in the main process, '
+                             'sharing one event loop for their commands (asyncio).')
 
     return parser
 
@@ -65,7 +160,8 @@ def create_parser() -> ArgumentParser:
 def main() -> None:
     # parsing general arguments
     parser = create_parser()
-    args = parser.parse_args()
+    # evaluation-specific arguments are parsed by the evaluators themselves
+    args = parser.parse_known_args()[0]
 
     evaluation_name = args.evaluation
     apk = args.apk_folder
@@ -83,81 +179,86 @@ def main() -> None:
         fsm_args['tmp'] = tmp
     if lists is not None:
         fsm_args['lists'] = lists
+    if args.apk_budget is not None:
+        try:
+            fsm_args['apk_budget'] = parse_size(args.apk_budget)
+        except ValueError:
+            print('Invalid apk budget: ' + args.apk_budget)
+            exit(-1)
+    if args.apk_reserve is not None:
+        try:
+            fsm_args['apk_reserve'] = parse_size(args.apk_reserve)
+        except ValueError:
+            print('Invalid apk reserve: ' + args.apk_reserve)
+            exit(-1)
+    fsm_args['apk_eviction'] = args.apk_eviction
     fsm = FilesystemConfig(**fsm_args)
 
+    try:
+        Repositories.select(args.repository, args.mirror)
+    except ValueError as invalid_repository:
+        print(str(invalid_repository))
+        exit(-1)
+
     # set dir values to the updated value
     # apk_dir = fsm.get_apk_dir()
-    out_dir = fsm.get_out_dir()
+    # out_dir = fsm.get_out_dir()
     # tmp_dir = fsm.get_tmp_dir()
     report_dir = fsm.get_report_dir()
     result_dir = fsm.get_result_dir()
     # lists = fsm.get_lists_dir()
 
-    # finding the right evaluation
+    # finding the right evaluation(s)
 
     if len(argv) < 2:
         print('Did not provide evaluation name.')
         exit(-1)
 
     # ~ strategy pattern
+    evaluators = list()
     try:
-        evaluator = Evaluations.MAP[evaluation_name]
-        if evaluator is None:
+        for eval_id, weight in Evaluations.parse_spec(evaluation_name):
+            evaluator = Evaluations.MAP[eval_id]
+            if evaluator is None:
+                raise KeyError
+            evaluators.append((evaluator, weight))
+        if len(evaluators) == 0:
             raise KeyError
+    except ValueError as invalid_spec:
+        print('Invalid evaluations ' + evaluation_name + ': ' + str(invalid_spec))
+        exit(-1)
+        return  # ide workaround
     except KeyError as no_such_evaluator:
         print('No such evaluator: ' + evaluation_name)
         exit(-1)
         return  # ide workaround
 
-    # initialization (e.g. eval-specific input parsing)
-    evaluator.init()
+    # all workers share one repository instance, hosted by a service process
+    Repositories.start_service()
 
-    # preparing the queue
+    analyzers = OrderedDict()
+    skips = dict()
+    for evaluator, weight in evaluators:
+        # initialization (e.g. eval-specific input parsing)
+        evaluator.init()
 
-    analyzer = evaluator.get_analyzer([ReportWriter.KEY_PKG, ReportWriter.KEY_CATS],
-                                      [ReportWriter.KEY_SUCC, ReportWriter.KEY_WORKER, ReportWriter.KEY_TIMESTAMP])
-    tested = [app_row[ReportWriter.KEY_PKG] for app_row in analyzer.get_tested()]
-    # if unfinished_runs_exist(evaluation_name):
-    #     cont = input("Evaluation was finished prematurely the last time. Do you want to proceed? (y/n)").lower()
-    #     if cont == 'y' or cont == 'yes':
-    #         # restore state if present (do not count from 0)
-    #         (tested, succeeded) = read_progress(get_save_path(evaluation_name))
-    #     else:
-    #         if cont != 'n' and cont != 'no':
-    #             print('No valid answer given. Treated as no.')
-    #         print('Deleting saved progress.')
-    #         remove(get_save_path(evaluation_name))
-
-    skip = []
-    if len(tested) > 0:
-        sure = False
-        while not sure:
-            cont = input("Evaluation was finished prematurely the last time. Do you want to proceed? (y/n)").lower()
-            # continue
-            if cont == 'y' or cont == 'yes':
-                print('Proceeding with evaluation.')
-                print('Current state:')
-                analyzer.api_summary()
-                skip = tested
-                sure = True
-            # do not continue
-            else:
-                if cont != 'n' and cont != 'no':
-                    print('No valid answer given. Treated as no.')
-                print('Do not proceed with evaluation.')
-
-                delete = input(
-                    'Are you sure you want to delete all persisted data from the last evaluation? (y/n)').lower()
-                if delete == 'y' or delete == 'yes':
-                    # delete data from last evaluation
-                    shutil.rmtree(out_dir)
-                    sure = True
+        analyzer = evaluator.get_analyzer([ReportWriter.KEY_PKG, ReportWriter.KEY_CATS],
+                                          [ReportWriter.KEY_SUCC, ReportWriter.KEY_WORKER, ReportWriter.KEY_TIMESTAMP])
+        analyzers[evaluator.get_eval_id()] = analyzer
+        skips[evaluator.get_eval_id()] = ask_for_resume(analyzer, evaluator.get_eval_id())
 
     # ensure 'out' directories exist
     makedirs(report_dir, exist_ok=True)
     makedirs(result_dir, exist_ok=True)
 
-    tasks = evaluator.create_task_queue(skip)
+    if len(evaluators) == 1:
+        multi_evaluator = None
+        evaluator = evaluators[0][0]
+        tasks = evaluator.create_task_queue(skips[evaluator.get_eval_id()])
+    else:
+        # several evaluations share the device pool
+        multi_evaluator = MultiEvaluator(evaluators)
+        tasks = multi_evaluator.create_task_queue(skips)
 
     # should be reliable since no one touched the queue yet
     # task_num = tasks.qsize()
@@ -170,21 +271,39 @@ def main() -> None:
         print('No devices available.')
         exit(0)
 
+    # system properties of all devices, read once so workers can match apps against any device of the pool
+    device_pool = dict()
+    for device in devices:
+        (success, properties) = shellutils.adb_getprop(device=device)
+        if success:
+            device_pool[device] = properties
+        else:
+            print('Could not read the properties of ' + device)
+
     device_workers = list()
     device_worker_connections = dict()
 
     helper_workers = list()
     helper_worker_connections = dict()
 
-    # preparing the reporter process
-    reporter_pipe_worker, reporter_pipe_main = Pipe(True)
-    reporter = ReportWriter(name='ReportWriter', control_channel=reporter_pipe_worker,
-                            known_subtasks=evaluator.get_subtask_ids_ordered(),
-                            analyzer=analyzer, eval_name=evaluation_name)
-    report_queue = reporter.get_task_queue()
-    helper_workers.append(reporter)
-    helper_worker_connections[reporter] = reporter_pipe_main
-    reporter.start()
+    # preparing one reporter process per evaluation
+    report_queues = dict()
+    reporters = list()
+    for evaluator, weight in evaluators:
+        eval_id = evaluator.get_eval_id()
+        reporter_pipe_worker, reporter_pipe_main = Pipe(True)
+        reporter = ReportWriter(name='ReportWriter_' + eval_id, control_channel=reporter_pipe_worker,
+                                known_subtasks=evaluator.get_subtask_ids_ordered(),
+                                analyzer=analyzers[eval_id], eval_name=eval_id)
+        report_queues[eval_id] = reporter.get_task_queue()
+        reporters.append(reporter)
+        helper_workers.append(reporter)
+        helper_worker_connections[reporter] = reporter_pipe_main
+        reporter.start()
+
+    # runs the device workers, the helper workers are always processes. Created after starting the helper processes,
+    # so they do not inherit the event loop of the asyncio engine
+    engine = Engines.create(args.engine)
 
     # try: handle interrupts and errors
     try:
@@ -194,15 +313,21 @@ def main() -> None:
         # noinspection PyTypeChecker
         for device in devices:
             recv, send = Pipe(False)
-            worker = evaluator.create_device_worker(recv, tasks, device, report_queue)
+            if multi_evaluator is not None:
+                worker = multi_evaluator.create_device_worker(recv, tasks, device, report_queues,
+                                                              device_pool=device_pool)
+            else:
+                worker = evaluator.create_device_worker(recv, tasks, device, report_queues[evaluator.get_eval_id()],
+                                                        device_pool=device_pool)
             device_workers.append(worker)
             device_worker_connections[worker] = send
-            worker.start()
+            engine.start_worker(worker)
             print('started ' + device)
 
-        # wait for workers to finish
+        # wait for workers to finish all tasks, including those handed back to the queue. Tasks taken by workers that
+        # died are never finished, so stop waiting once no worker is left
         waited_rounds = 0
-        while not tasks.empty():
+        while not tasks.empty() and any(engine.is_alive(worker) for worker in device_workers):
             waited_rounds += 1
             sleep(5)
             if waited_rounds % 10 == 0:
@@ -212,12 +337,13 @@ def main() -> None:
 
         # give the workers a chance to finish the last task and send a report before telling the
         # reporter to finish the report queue and exit
-        wait_for_workers(device_workers)
+        engine.join_workers(device_workers)
 
-        # now signal the reporter to stop after finishing the current queue
-        reporter_pipe_main.send(ReportWriter.msg_producers_done)
-        # and wait for it to finish
-        wait_for_workers([reporter])
+        # now signal the reporters to stop after finishing their current queue
+        for reporter in reporters:
+            helper_worker_connections[reporter].send(ReportWriter.msg_producers_done)
+        # and wait for them to finish
+        wait_for_workers(reporters)
         print('Evaluation completed.')
 
 
@@ -231,19 +357,22 @@ def main() -> None:
     # so we just terminate all of them
     print('Terminating worker processes that are possibly still running.')
 
-    # merge worker lists and connection dicts
-    all_workers = device_workers + helper_workers
-    all_connections = device_worker_connections.copy()
-    all_connections.update(helper_worker_connections)
-
-    for worker in all_workers:
+    for worker in device_workers:
+        if engine.is_alive(worker):
+            device_worker_connections[worker].send(DeviceWorker.msg_terminate)
+    for worker in helper_workers:
         if worker.is_alive():
-            all_connections[worker].send(DeviceWorker.msg_terminate)
-    wait_for_workers(all_workers)
+            helper_worker_connections[worker].send(DeviceWorker.msg_terminate)
+    engine.join_workers(device_workers)
+    wait_for_workers(helper_workers)
+    engine.shutdown()
 
     print('Evaluation finished.')
+    Repositories.stop_service()
 
-    analyzer.api_summary()
+    # the counters are up to date, so there is no need to read the results again
+    for analyzer in analyzers.values():
+        analyzer.api_progress()
 
     # some threads (e.g. daemon threads of queue) need some time to finish before we finish the main process.
     sleep(2)
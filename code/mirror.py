@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from os import path
+from socketserver import ThreadingMixIn
+from urllib.parse import unquote, urlparse
+
+from utils.apkutils import APK_FILE_ENDING
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def create_handler(apk_dir: str):
+    """
+    :param apk_dir: the folder to serve
+    :return: a request handler class that serves the apk files in apk_dir and nothing else
+    """
+    class ApkRequestHandler(SimpleHTTPRequestHandler):
+        def translate_path(self, url_path: str) -> str:
+            # only plain file names are accepted, so requests cannot escape the folder
+            name = path.basename(unquote(urlparse(url_path).path))
+            if not name.endswith(APK_FILE_ENDING):
+                return path.join(apk_dir, '.not-an-apk')
+            return path.join(apk_dir, name)
+
+        def list_directory(self, dir_path: str):
+            self.send_error(404, 'No directory listings')
+            return None
+
+    return ApkRequestHandler
+
+
+def setup_args():
+    parser = ArgumentParser(description='Serves an apk folder over HTTP, e.g., as a LAN mirror for the "http" '
+                                        'repository or as a local stand-in for it.')
+    parser.add_argument('apk_folder',
+                        metavar='<APK_FOLDER>',
+                        action='store',
+                        help='Folder with <package>.apk files')
+    parser.add_argument('-p', '--port',
+                        type=int,
+                        default=8000,
+                        help='Port to listen on')
+    parser.add_argument('-b', '--bind',
+                        default='',
+                        help='Address to listen on, all interfaces by default')
+    return parser.parse_args()
+
+
+def main(commandline_args) -> None:
+    apk_dir = path.realpath(commandline_args.apk_folder)
+    server = ThreadingHTTPServer((commandline_args.bind, commandline_args.port), create_handler(apk_dir))
+    print('Serving ' + apk_dir + ' on port ' + str(server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Stopping the mirror.')
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main(setup_args())
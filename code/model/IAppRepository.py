@@ -1,4 +1,4 @@
-from typing import Union
+from typing import Union, List
 
 
 __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
@@ -8,9 +8,39 @@ class IAppRepository(object):
 
     # change type in case another type is used to represent paths in this class
     Path = Union[str, None]
+    # base apk first, followed by the split apks. Empty if the app is not available
+    PathSet = List[str]
 
     def get_app(self, package_name: str) -> Path:
         raise AssertionError('IAppRepository: get_app not implemented')
 
     def get_app_version(self, package_name: str, version: str) -> Path:
         raise AssertionError('IAppRepository: get_app_version not implemented')
+
+    def get_app_set(self, package_name: str) -> PathSet:
+        raise AssertionError('IAppRepository: get_app_set not implemented')
+
+    def recheck_app_set(self, package_name: str) -> PathSet:
+        """
+        Verifies an app once more after installing it failed, since repositories may trust apps they handed out before.
+        :param package_name
+        :return: paths to the apk files if they were damaged or outdated and were replaced, otherwise an empty list
+        """
+        raise AssertionError('IAppRepository: recheck_app_set not implemented')
+
+    def get_app_metadata(self, package_name: str):
+        """
+        :param package_name
+        :return: the ApkMetadata of the (base) apk of an available app or None
+        """
+        raise AssertionError('IAppRepository: get_app_metadata not implemented')
+
+    def pin_apps(self, package_names: List[str]) -> None:
+        """
+        Protects apps that are queued for evaluation from being removed from the repository to save space.
+        :param package_names
+        """
+        raise AssertionError('IAppRepository: pin_apps not implemented')
+
+    def unpin_app(self, package_name: str) -> None:
+        raise AssertionError('IAppRepository: unpin_app not implemented')
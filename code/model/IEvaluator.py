@@ -1,8 +1,9 @@
-from multiprocessing import Queue
 from typing import List, Dict
 
 from DeviceWorker import DeviceWorker
 from model.IAppRepository import IAppRepository
+from model.ITask import ITask
+from model.TaskQueue import TaskQueue
 
 
 __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
@@ -17,10 +18,24 @@ class IEvaluator(object):
     def init(self) -> None:
         raise AssertionError('Evaluator: init not implemented')
 
-    def create_task_queue(self, skip: int=0) -> Queue:
+    def create_task_queue(self, skip: List[str]=list()) -> TaskQueue:
         raise AssertionError('Evaluator: create_task_queue not implemented')
 
-    def create_device_worker(self, control_channel, queue: Queue, device: str, report_channel) -> DeviceWorker:
+    def create_task_list(self, skip: List[str]=list()) -> List[ITask]:
+        """
+        Provides the tasks of this evaluation in processing order. Used to combine the tasks of multiple evaluations
+        into a single queue.
+        :param skip: packages that should not be processed, e.g., because they have been tested already
+        :return: ordered list of tasks
+        """
+        raise AssertionError('Evaluator: create_task_list not implemented')
+
+    def create_device_worker(self, control_channel, queue: TaskQueue, device: str, report_channel,
+                             device_pool: Dict[str, Dict[str, str]]=None) -> DeviceWorker:
+        """
+        :param device_pool: system properties of all devices that process the queue, so that workers can hand tasks
+        to compatible devices
+        """
         raise AssertionError('Evaluator: create_device_worker not implemented')
 
     def get_eval_id(self) -> str:
@@ -27,6 +27,19 @@ class IResultAnalyzer(object):
         """
         raise AssertionError('ResultAnalyzer: "interpret" not yet implemented!')
 
+    def get_record_layout(self):
+        """
+        :return: the layout (analysis.ResultRecord.RecordLayout) of the compact result records that the analyzer reads
+        and interprets
+        """
+        raise AssertionError('ResultAnalyzer: "get_record_layout" not yet implemented!')
+
+    def get_result_files(self) -> List[str]:
+        """
+        :return: the files that hold the results of the evaluation, including indices and caches
+        """
+        raise AssertionError('ResultAnalyzer: "get_result_files" not yet implemented!')
+
     def get_all(self) -> List[Dict[str, str]]:
         """
         Returns all summary rows in a tuple
@@ -40,6 +53,12 @@ class IResultAnalyzer(object):
         """
         raise AssertionError('ResultAnalyzer: "get_tested" not yet implemented!')
 
+    def get_tested_packages(self) -> List[str]:
+        """
+        :return: the packages of all tested apps
+        """
+        raise AssertionError('ResultAnalyzer: "get_tested_packages" not yet implemented!')
+
     def get_outs(self, csv_rows: Union[List[Dict[str, str]],None]=None) -> List[Dict[str, str]]:
         """
         Returns summary rows from apps that did not meet the assumptions
@@ -64,6 +83,19 @@ class IResultAnalyzer(object):
         """
         raise AssertionError('ResultAnalyzer: "get_successes" not yet implemented!')
 
+    def add_arguments(self, parser) -> None:
+        """
+        Adds the arguments and options of the analysis commands to the command line parser (argparse.ArgumentParser)
+        of analyze.py.
+        """
+        raise AssertionError('ResultAnalyzer: "add_arguments" not yet implemented!')
+
+    def set_options(self, options) -> None:
+        """
+        Passes the parsed command line (argparse.Namespace) to the analyzer before a command is executed.
+        """
+        raise AssertionError('ResultAnalyzer: "set_options" not yet implemented!')
+
     def get_command_api(self) -> Dict[str, Callable[[], None]]:
         """
         Defines the public command API of this analyzer. 
@@ -11,3 +11,11 @@ class ITask(object):
     def get_categories(self) -> List[str]:
         raise AssertionError('Task: get_category not implemented')
 
+    def get_rejected_devices(self) -> List[str]:
+        """
+        :return: devices that handed the task back because they cannot process it
+        """
+        raise AssertionError('Task: get_rejected_devices not implemented')
+
+    def reject(self, device_id: str) -> None:
+        raise AssertionError('Task: reject not implemented')
@@ -0,0 +1,31 @@
+from typing import List
+
+from model.TaskWorker import TaskWorker
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class IWorkerEngine(object):
+    """
+    Runs the device workers of an evaluation, e.g., as processes or on a shared event loop.
+    """
+
+    def start_worker(self, worker: TaskWorker) -> None:
+        raise AssertionError('WorkerEngine: start_worker not implemented')
+
+    def is_alive(self, worker: TaskWorker) -> bool:
+        raise AssertionError('WorkerEngine: is_alive not implemented')
+
+    def join_workers(self, workers: List[TaskWorker]) -> None:
+        """
+        Blocks until all provided workers finished execution.
+        :param workers: the workers to wait for
+        """
+        raise AssertionError('WorkerEngine: join_workers not implemented')
+
+    def shutdown(self) -> None:
+        """
+        Releases the resources of the engine once all workers finished.
+        """
+        raise AssertionError('WorkerEngine: shutdown not implemented')
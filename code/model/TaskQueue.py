@@ -0,0 +1,48 @@
+from multiprocessing import Queue, Value
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class TaskQueue(object):
+    """
+    Task queue shared by workers that keeps track of outstanding tasks: tasks that were put into the queue and have
+    not been finished with task_done yet, no matter whether they are still queued or already taken by a worker.
+    multiprocessing.Queue.empty is not reliable right after put, since items are handed to a feeder thread, and it
+    does not know about taken tasks that might be handed back (see TaskWorker.defer_task). Workers and the main process
+    therefore wait for the outstanding tasks instead.
+    """
+
+    def __init__(self, maxsize: int=0):
+        self.queue = Queue(maxsize)
+        self.outstanding = Value('i', 0)
+
+    def put(self, task) -> None:
+        # counted before the task becomes visible, so the queue never appears done while a task is handed over
+        with self.outstanding.get_lock():
+            self.outstanding.value += 1
+        self.queue.put(task)
+
+    def get(self, block: bool=True, timeout: float=None):
+        """
+        :raises Empty: if no task is available
+        """
+        return self.queue.get(block=block, timeout=timeout)
+
+    def task_done(self) -> None:
+        """
+        Marks a task that was taken from the queue as finished.
+        """
+        with self.outstanding.get_lock():
+            self.outstanding.value -= 1
+
+    def pending(self) -> int:
+        """
+        :return: the number of outstanding tasks
+        """
+        return self.outstanding.value
+
+    def empty(self) -> bool:
+        """
+        :return: whether all tasks are finished
+        """
+        return self.pending() <= 0
@@ -1,9 +1,10 @@
 from multiprocessing import Process
 from queue import Empty
-from multiprocessing import Queue
-from time import time
+from time import time, monotonic
+from typing import Union
 
 from model.ITask import ITask
+from model.TaskQueue import TaskQueue
 
 
 __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
@@ -18,7 +19,7 @@ class TaskWorker(Process):
         pass
 
     def __init__(self, group=None, target=None, name: str = "DeviceProcess", args=(), kwargs={},
-                 control_channel=None, queue: Queue = None, report_queue: Queue = None, worker_id=None):
+                 control_channel=None, queue: TaskQueue = None, report_queue: TaskQueue = None, worker_id=None):
         super(TaskWorker, self).__init__(group, target, name, args, kwargs)
 
         # identifying string for this worker
@@ -38,12 +39,18 @@ class TaskWorker(Process):
 
         self.log_prefix = name
 
+        # task that has already been taken from the queue to prepare it ahead of time, see peek_task
+        self.next_task = None
+
         # logging and reporting state
         self.current_task = None
         self.current_subtask = None
         self.worker_log = list()
         self.subtask_log = dict()
         self.subtask_success = dict()
+        # mapping: subtask -> duration in seconds
+        self.subtask_durations = dict()
+        self.subtask_start = None
 
     def log(self, s: str) -> None:
         if self.current_subtask is not None:
@@ -56,6 +63,8 @@ class TaskWorker(Process):
         self.current_subtask = None
         self.subtask_success = dict()
         self.subtask_log = dict()
+        self.subtask_durations = dict()
+        self.subtask_start = None
 
     def start_task(self, task) -> None:
         self.reset_task_state()
@@ -64,19 +73,22 @@ class TaskWorker(Process):
     def start_subtask(self, subtask: str) -> None:
         self.current_subtask = subtask
         self.subtask_log[subtask] = list()
+        self.subtask_start = monotonic()
 
     def conclude_subtask(self, success: bool) -> None:
         self.subtask_success[self.current_subtask] = success
+        if self.subtask_start is not None:
+            self.subtask_durations[self.current_subtask] = monotonic() - self.subtask_start
 
     def send_report(self) -> None:
-        # not all workers have a report queue
-        if self.report_queue is not None:
+        # not all workers have a report queue and deferred tasks are reported by the worker that processes them
+        if self.report_queue is not None and self.current_task is not None:
             timestamp = int(time())
 
             # local import to avoid circular dependency
             from ReportWriter import ReportTask
             report = ReportTask(self.current_task, self.worker_log, self.subtask_success, self.subtask_log, timestamp,
-                                self.id)
+                                self.id, self.subtask_durations)
             self.report_queue.put(report)
 
     def run(self) -> None:
@@ -91,9 +103,9 @@ class TaskWorker(Process):
                     break
 
                 try:
-                    task = self.tasks.get(block=True, timeout=1)
+                    task = self.take_task()
                 except Empty as empty:
-                    self.log('Queue is empty. Continuing to re-evaluate keepalive condition.')
+                    # not logged, workers wait here for outstanding tasks of other workers as long as they run
                     continue
 
                 # if not self.tasks.valid(task):
@@ -110,13 +122,64 @@ class TaskWorker(Process):
                     self.log('Error: Aborting task due to exception: ' + str(generic_exception))
                     # fallthrough to send an (incomplete) report
                 self.send_report()
+                # only now other workers may stop waiting for the task, it might have been handed back to the queue
+                self.tasks.task_done()
                 # implicit continue here
 
             self.log("queue is empty, finishing process.")
         except KeyboardInterrupt as abort:
             self.log('Keyboard interrupt. Finishing.')
+        finally:
+            # a task prepared ahead of time is left when the worker is terminated or interrupted
+            self.release_next_task()
+
+    def take_task(self) -> ITask:
+        """
+        Returns the next task to process, which is either the one obtained by peek_task or a new one from the queue.
+        :return: the task
+        :raises Empty: if no task is available within a second
+        """
+        if self.next_task is not None:
+            task = self.next_task
+            self.next_task = None
+            return task
+        return self.tasks.get(block=True, timeout=1)
+
+    def peek_task(self) -> Union[ITask, None]:
+        """
+        Takes the task that will be processed next from the queue without blocking, so that the worker can prepare it
+        while still processing the current one. The task is returned again by the next call to take_task.
+        :return: the next task or None if the queue is currently empty
+        """
+        if self.next_task is None:
+            try:
+                self.next_task = self.tasks.get(block=False)
+            except Empty as empty:
+                return None
+        return self.next_task
+
+    def release_next_task(self) -> None:
+        """
+        Hands the task obtained by peek_task back to the queue, so it is not lost if the worker exits before
+        processing it.
+        """
+        if self.next_task is not None:
+            self.log('Handing the next task ' + self.next_task.get_package() + ' back to the queue.')
+            self.tasks.put(self.next_task)
+            # the task was taken from the queue, it is outstanding once again after put
+            self.tasks.task_done()
+            self.next_task = None
+
+    def defer_task(self, task: ITask) -> None:
+        """
+        Hands the current task back to the queue, so another worker processes it. Nothing is reported for it. The task
+        stays outstanding throughout, since it is put back before the worker marks the current task as done.
+        :param task: the current task
+        """
+        self.tasks.put(task)
+        self.reset_task_state()
 
-    def get_task_queue(self) -> Queue:
+    def get_task_queue(self) -> TaskQueue:
         return self.tasks
 
     def not_implemented(self, msg: str) -> None:
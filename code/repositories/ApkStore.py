@@ -0,0 +1,467 @@
+import json
+from os import path, makedirs, link, replace, remove, getpid, scandir, utime
+from shutil import disk_usage
+from socket import gethostname
+from threading import get_ident
+from time import time
+from typing import Union, Dict, List, Set, Tuple, Callable
+
+from utils.apkutils import sha256_file, APK_FILE_ENDING, ApkMetadata, read_apk_metadata
+from utils.filelock import FileLock
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class ApkStore(object):
+    """
+    Content-addressed storage for apk files.
+
+    Each apk is stored exactly once as a blob named by its SHA-256 hash. An index maps packages and their version codes
+    to blobs. Human-readable views (e.g., <package>.apk in the apk folder) are hardlinks to blobs, so they do not take
+    up additional space.
+    The store also caches the metadata of apk files (see ApkMetadata) by hash, so every apk is only parsed once. The
+    metadata of each apk is kept in a small file of its own, so adding metadata never rewrites the others.
+
+    The size of the store can be limited by a byte budget. Besides, a reserve of free space can be kept on its
+    volume. Without either limit, blobs are never evicted. Blobs are evicted in least-recently or least-frequently
+    used order to stay within these limits, except for blobs of pinned packages, i.e., apps that are still queued
+    for evaluation. The total size of all blobs is kept in a small file that is updated when blobs are added or
+    evicted, so the blobs are only scanned if eviction actually runs.
+
+    The store can be shared by several threads and processes. Adding and evicting blobs is serialized by a file lock and
+    the json files are updated under their own locks, so concurrent updates are merged instead of lost. All files are
+    written under a private temporary name first and then atomically renamed. Uses of apks, which are recorded for
+    every lookup, are only appended to a log that is merged into the usage file from time to time.
+    """
+
+    STORE_DIR = '.store'
+    BLOBS_DIR = 'blobs'
+    INCOMING_DIR = 'incoming'
+    INDEX_FILE = 'index.json'
+    METADATA_DIR = 'metadata'
+    # metadata of all apks in one file, as written by earlier versions
+    METADATA_FILE = 'metadata.json'
+    USAGE_FILE = 'usage.json'
+    USAGE_LOG = 'usage.log'
+    SIZE_FILE = 'size.json'
+    PINS_DIR = 'pins'
+    LOCK_FILE = 'store.lock'
+
+    EVICTION_LRU = 'lru'
+    EVICTION_LFU = 'lfu'
+
+    # pins of runs that crashed before unpinning their apps are ignored after a week
+    PIN_EXPIRY = 7 * 24 * 60 * 60
+    # size of the usage log at which it is merged into the usage file
+    USAGE_LOG_LIMIT = 1024 * 1024
+
+    # field of the size file
+    KEY_BYTES = 'bytes'
+
+    def __init__(self, root: str, budget: Union[int, None]=None, eviction: str=EVICTION_LRU,
+                 reserved_space: Union[int, None]=None, run_id: Union[str, None]=None):
+        """
+        :param root: the folder to create the store in
+        :param budget: maximum size of all blobs in bytes or None for no limit
+        :param eviction: EVICTION_LRU or EVICTION_LFU
+        :param reserved_space: free space in bytes that is kept on the volume or None for no reserve
+        :param run_id: owner of the pins set through this instance, unique among all runs that share the store.
+        Defaults to an id of this host, process and time
+        """
+        if eviction not in [ApkStore.EVICTION_LRU, ApkStore.EVICTION_LFU]:
+            raise ValueError('Unknown eviction policy: ' + str(eviction))
+        self.budget = budget
+        self.eviction = eviction
+        self.reserved_space = reserved_space
+        if run_id is None:
+            run_id = gethostname() + '-' + str(getpid()) + '-' + str(int(time()))
+        self.run_id = run_id
+
+        self.root = path.join(root, ApkStore.STORE_DIR)
+        self.blobs = path.join(self.root, ApkStore.BLOBS_DIR)
+        self.incoming = path.join(self.root, ApkStore.INCOMING_DIR)
+        self.index_path = path.join(self.root, ApkStore.INDEX_FILE)
+        self.metadata_dir = path.join(self.root, ApkStore.METADATA_DIR)
+        self.metadata_path = path.join(self.root, ApkStore.METADATA_FILE)
+        self.usage_path = path.join(self.root, ApkStore.USAGE_FILE)
+        self.usage_log_path = path.join(self.root, ApkStore.USAGE_LOG)
+        self.size_path = path.join(self.root, ApkStore.SIZE_FILE)
+        self.pins = path.join(self.root, ApkStore.PINS_DIR)
+        self.lock_path = path.join(self.root, ApkStore.LOCK_FILE)
+
+        makedirs(self.blobs, exist_ok=True)
+        makedirs(self.incoming, exist_ok=True)
+        makedirs(self.pins, exist_ok=True)
+        makedirs(self.metadata_dir, exist_ok=True)
+
+        # mapping: package -> (mapping: version code -> hash)
+        self.index = self.read_index()
+        # mapping: hash -> metadata dictionary, filled on first use of each apk
+        self.metadata = ApkStore.read_json(self.metadata_path)
+
+    def get_incoming_dir(self) -> str:
+        """
+        :return: folder for files that are about to be added, on the same filesystem as the blobs
+        """
+        return self.incoming
+
+    def blob_path(self, apk_hash: str) -> str:
+        return path.join(self.blobs, apk_hash[:2], apk_hash + APK_FILE_ENDING)
+
+    def metadata_file(self, apk_hash: str) -> str:
+        return path.join(self.metadata_dir, apk_hash[:2], apk_hash + '.json')
+
+    def lookup(self, package_name: str, version: str) -> Union[str, None]:
+        """
+        :param package_name
+        :param version: the version code
+        :return: path to the blob storing the requested version or None
+        """
+        apk_hash = self.index.get(package_name, dict()).get(str(version))
+        if apk_hash is None:
+            # other processes might have added it in the meantime
+            self.index = self.read_index()
+            apk_hash = self.index.get(package_name, dict()).get(str(version))
+        if apk_hash is None:
+            return None
+        blob = self.blob_path(apk_hash)
+        return blob if path.exists(blob) else None
+
+    def latest(self, package_name: str) -> Union[str, None]:
+        """
+        :param package_name
+        :return: path to the blob storing the highest known version or None
+        """
+        versions = self.index.get(package_name, dict())
+        if len(versions) == 0:
+            return None
+        return self.lookup(package_name, max(versions.keys(), key=ApkStore.version_key))
+
+    def latest_hash(self, package_name: str) -> Union[str, None]:
+        """
+        Answered from the index in memory, without checking that the blob still exists.
+        :param package_name
+        :return: the hash recorded for the highest known version or None
+        """
+        versions = self.index.get(package_name, dict())
+        if len(versions) == 0:
+            return None
+        return versions[max(versions.keys(), key=ApkStore.version_key)]
+
+    def refresh_index(self) -> None:
+        """
+        Reads the index again, e.g., since other processes added or evicted blobs.
+        """
+        self.index = self.read_index()
+
+    def get_versions(self, package_name: str) -> Dict[str, str]:
+        """
+        :param package_name
+        :return: mapping from all known version codes of the package to the hashes of their blobs
+        """
+        return dict(self.index.get(package_name, dict()))
+
+    def add(self, package_name: str, file_path: str, version: Union[str, None]) -> str:
+        """
+        Moves an apk file into the store. If an identical apk is stored already, the file is dropped instead.
+        :param package_name
+        :param file_path: the apk file, ideally located in the incoming folder so it can be moved without copying
+        :param version: the version code of the apk or None if unknown. Unknown versions are indexed by their hash.
+        :return: path to the blob
+        """
+        apk_hash = sha256_file(file_path)
+        blob = self.blob_path(apk_hash)
+        with FileLock(self.lock_path):
+            if path.exists(blob):
+                remove(file_path)
+            else:
+                size = path.getsize(file_path)
+                makedirs(path.dirname(blob), exist_ok=True)
+                replace(file_path, blob)
+                # without a size file, the blobs are counted on the next read of the total size, including this one
+                if path.isfile(self.size_path):
+                    self.update_size(size)
+
+            def add_version(index: dict) -> None:
+                index.setdefault(package_name, dict())[str(version) if version is not None else apk_hash] = apk_hash
+            self.index = ApkStore.update_json(self.index_path, add_version)
+        return blob
+
+    def get_metadata(self, file_path: str, apk_hash: Union[str, None]=None) -> ApkMetadata:
+        """
+        Returns the metadata of an apk file, which also tells whether the apk is intact.
+        The apk file does not need to be part of the store.
+        :param file_path: the apk file
+        :param apk_hash: the hash of the apk file, if the caller computed it already
+        :return: the cached or freshly extracted metadata
+        :raises OSError: if the file does not exist (anymore)
+        """
+        if apk_hash is None:
+            apk_hash = sha256_file(file_path)
+        cached = self.metadata.get(apk_hash)
+        if cached is None:
+            # other processes might have extracted it in the meantime
+            cached = ApkStore.read_json(self.metadata_file(apk_hash)) or None
+        if cached is not None:
+            self.metadata[apk_hash] = cached
+            return ApkMetadata.from_dict(cached)
+
+        metadata = read_apk_metadata(file_path)
+        self.metadata[apk_hash] = metadata.to_dict()
+        # metadata only depends on the content of the apk, so concurrent writers write the same file and need no lock
+        metadata_file = self.metadata_file(apk_hash)
+        makedirs(path.dirname(metadata_file), exist_ok=True)
+        ApkStore.write_json(metadata_file, self.metadata[apk_hash])
+        return metadata
+
+    ### eviction
+
+    def record_uses(self, apk_hashes: List[str]) -> None:
+        """
+        Remembers that apks were used, which determines the eviction order. Uses are appended to a log with a single
+        write, which is merged into the usage file when blobs are evicted or the log grows too large.
+        :param apk_hashes: the hashes of the used apks
+        """
+        now = repr(time())
+        with open(self.usage_log_path, 'a') as usage_log:
+            usage_log.write(''.join(apk_hash + ' ' + now + '\n' for apk_hash in apk_hashes))
+            # the position of an appending file is its size, so this does not need another stat
+            log_size = usage_log.tell()
+        if log_size > ApkStore.USAGE_LOG_LIMIT:
+            with FileLock(self.lock_path):
+                self.compact_usage()
+
+    def compact_usage(self) -> None:
+        """
+        Merges the usage log into the usage file.
+        """
+        # the log is moved aside first, so uses that are logged meanwhile go to a new log. Writers that opened the old
+        # log right before the move may lose a use, which only affects the eviction order.
+        compacting = ApkStore.tmp_path(self.usage_log_path)
+        try:
+            replace(self.usage_log_path, compacting)
+        except FileNotFoundError:
+            return
+        ApkStore.update_json(self.usage_path, lambda usage: ApkStore.fold_usage_log(compacting, usage))
+        remove(compacting)
+
+    @staticmethod
+    def fold_usage_log(log_path: str, usage: dict) -> None:
+        # [last use, number of uses]
+        if not path.isfile(log_path):
+            return
+        with open(log_path, 'r') as usage_log:
+            for line in usage_log:
+                parts = line.split()
+                if len(parts) != 2:
+                    # partially written line
+                    continue
+                entry = usage.get(parts[0], [0, 0])
+                usage[parts[0]] = [max(entry[0], float(parts[1])), entry[1] + 1]
+
+    def pin(self, package_names: List[str]) -> None:
+        """
+        Protects all versions of packages from eviction until they are unpinned. Pins are owned by the run of this
+        instance (pins/<package>/<run id>), so runs sharing the store, e.g., on several hosts, only remove their own.
+        :param package_names
+        """
+        now = time()
+        for package_name in package_names:
+            package_pins = path.join(self.pins, package_name)
+            if path.isfile(package_pins):
+                # pin of an older version without owner
+                remove(package_pins)
+            makedirs(package_pins, exist_ok=True)
+            pin_path = path.join(package_pins, self.run_id)
+            with open(pin_path, 'a'):
+                pass
+            # renew pins of earlier calls
+            utime(pin_path, (now, now))
+
+    def unpin(self, package_name: str) -> None:
+        pin_path = path.join(self.pins, package_name, self.run_id)
+        if path.exists(pin_path):
+            remove(pin_path)
+
+    def get_pinned(self) -> Set[str]:
+        """
+        :return: the packages that are currently pinned by any run
+        """
+        oldest = time() - ApkStore.PIN_EXPIRY
+        pinned = set()
+        for entry in scandir(self.pins):
+            if entry.is_dir():
+                if any(pin.stat().st_mtime >= oldest for pin in scandir(entry.path)):
+                    pinned.add(entry.name)
+            elif entry.stat().st_mtime >= oldest:
+                # pin of an older version without owner
+                pinned.add(entry.name)
+        return pinned
+
+    def get_blobs(self) -> Dict[str, Tuple[str, int, float]]:
+        """
+        :return: mapping from hashes to the path, size and modification time of their blobs
+        """
+        blobs = dict()
+        for prefix in scandir(self.blobs):
+            if not prefix.is_dir():
+                continue
+            for entry in scandir(prefix.path):
+                if entry.name.endswith(APK_FILE_ENDING):
+                    stat = entry.stat()
+                    blobs[entry.name[:-len(APK_FILE_ENDING)]] = (entry.path, stat.st_size, stat.st_mtime)
+        return blobs
+
+    def get_total_size(self) -> int:
+        """
+        :return: the size of all blobs in bytes, as recorded in the size file. The blobs are counted if there is none
+        """
+        total = ApkStore.read_json(self.size_path).get(ApkStore.KEY_BYTES)
+        if total is not None:
+            return total
+        with FileLock(self.lock_path):
+            total = sum(size for (blob, size, mtime) in self.get_blobs().values())
+            ApkStore.write_json(self.size_path, {ApkStore.KEY_BYTES: total})
+        return total
+
+    def update_size(self, change: int) -> None:
+        """
+        Adds to the recorded size of all blobs. Expects the store lock to be held.
+        :param change: the number of bytes added (positive) or removed (negative)
+        """
+        def add_bytes(size: dict) -> None:
+            size[ApkStore.KEY_BYTES] = size.get(ApkStore.KEY_BYTES, 0) + change
+        ApkStore.update_json(self.size_path, add_bytes)
+
+    def make_space(self, size: int) -> Tuple[List[str], bool]:
+        """
+        Evicts unpinned blobs until the store stays within its budget and the reserve is kept after adding size bytes.
+        Views of evicted blobs keep occupying space until they are removed as well, so callers need to update the
+        views of the affected packages.
+        :param size: the number of bytes that is about to be added
+        :return: a tuple of the packages that lost at least one version and whether enough space is available now
+        """
+        if self.budget is None and self.reserved_space is None:
+            return list(), True
+        total = self.get_total_size() if self.budget is not None else 0
+        free = disk_usage(self.root).free if self.reserved_space is not None else 0
+        if self.within_limits(total, free, size):
+            return list(), True
+
+        with FileLock(self.lock_path):
+            # the blobs are scanned since eviction needs their modification times, which also corrects the total
+            blobs = self.get_blobs()
+            total = sum(size for (blob, size, mtime) in blobs.values())
+            self.index = self.read_index()
+            pinned = self.get_pinned()
+            protected = set(apk_hash for package_name, versions in self.index.items() if package_name in pinned
+                            for apk_hash in versions.values())
+            self.compact_usage()
+            usage = ApkStore.read_json(self.usage_path)
+
+            def eviction_key(apk_hash: str):
+                # blobs that were never used count as used when they were stored
+                last_use, uses = usage.get(apk_hash, [blobs[apk_hash][2], 0])
+                return (last_use, uses) if self.eviction == ApkStore.EVICTION_LRU else (uses, last_use)
+
+            evicted = set()
+            for apk_hash in sorted([apk_hash for apk_hash in blobs.keys() if apk_hash not in protected],
+                                   key=eviction_key):
+                if self.within_limits(total, free, size):
+                    break
+                (blob, blob_size, mtime) = blobs[apk_hash]
+                if not path.exists(blob):
+                    # evicted by another process in the meantime
+                    continue
+                print('Evicting ' + blob + ' (' + str(blob_size) + ' bytes) from the apk store.')
+                remove(blob)
+                total -= blob_size
+                free += blob_size
+                evicted.add(apk_hash)
+
+            affected = set()
+
+            def drop_versions(index: dict) -> None:
+                for package_name in list(index.keys()):
+                    versions = index[package_name]
+                    for version in [version for version, apk_hash in versions.items() if apk_hash in evicted]:
+                        del versions[version]
+                        affected.add(package_name)
+                    if len(versions) == 0:
+                        del index[package_name]
+
+            def drop_usage(usage: dict) -> None:
+                for apk_hash in evicted:
+                    usage.pop(apk_hash, None)
+
+            self.index = ApkStore.update_json(self.index_path, drop_versions)
+            ApkStore.update_json(self.usage_path, drop_usage)
+            ApkStore.write_json(self.size_path, {ApkStore.KEY_BYTES: total})
+        return sorted(affected), self.within_limits(total, free, size)
+
+    def within_limits(self, total: int, free: int, size: int) -> bool:
+        """
+        :param total: the size of all blobs
+        :param free: the free space on the volume, unused without a reserve
+        :param size: the number of bytes that is about to be added
+        :return: whether size bytes fit into the budget and the reserve
+        """
+        return (self.budget is None or total + size <= self.budget) \
+            and (self.reserved_space is None or free - size >= self.reserved_space)
+
+    def link_view(self, blob: str, view: str) -> None:
+        """
+        Atomically (re)places a view by a hardlink to a blob.
+        :param blob: path to the blob
+        :param view: path of the view
+        """
+        tmp_view = ApkStore.tmp_path(view)
+        if path.lexists(tmp_view):
+            remove(tmp_view)
+        link(blob, tmp_view)
+        replace(tmp_view, view)
+
+    def read_index(self) -> Dict[str, Dict[str, str]]:
+        return ApkStore.read_json(self.index_path)
+
+    @staticmethod
+    def tmp_path(file_path: str) -> str:
+        """
+        :return: a temporary name for file_path that no other process or thread uses
+        """
+        return file_path + '.' + str(getpid()) + '.' + str(get_ident()) + '.tmp'
+
+    @staticmethod
+    def read_json(json_path: str) -> dict:
+        if not path.isfile(json_path):
+            return dict()
+        with open(json_path, 'r') as json_file:
+            return json.load(json_file)
+
+    @staticmethod
+    def write_json(json_path: str, content: dict) -> None:
+        # write a copy and swap it in, so readers never see a partially written file
+        tmp_path = ApkStore.tmp_path(json_path)
+        with open(tmp_path, 'w') as json_file:
+            json.dump(content, json_file, indent=1, sort_keys=True)
+        replace(tmp_path, json_path)
+
+    @staticmethod
+    def update_json(json_path: str, update: Callable[[dict], None]) -> dict:
+        """
+        Read-modify-write of a json file under a file lock, so concurrent updates are not lost.
+        :param json_path: the json file
+        :param update: modifies the current content in place
+        :return: the updated content
+        """
+        with FileLock(json_path + '.lock'):
+            content = ApkStore.read_json(json_path)
+            update(content)
+            ApkStore.write_json(json_path, content)
+        return content
+
+    @staticmethod
+    def version_key(version: str):
+        # numeric version codes sort numerically and before versions that are only known by their hash
+        return (1, int(version), '') if version.isdigit() else (0, 0, version)
@@ -0,0 +1,95 @@
+from os import path, remove
+from typing import Tuple, Union
+
+from model.IAppRepository import IAppRepository
+from repositories.ApkStore import ApkStore
+from repositories.FileBackedRepository import FileBackedRepository
+from utils.apkutils import APK_FILE_ENDING
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class FetchingRepository(FileBackedRepository):
+    """
+    FileBackedRepository that obtains missing apps from a source, e.g., a mirror or the Google Play Store, and keeps them
+    in its apk folder. Invalid apks are fetched once more, invalid cached apks are replaced by a fresh copy.
+    Only single apks can be fetched.
+    """
+
+    FETCH_ATTEMPTS = 2
+
+    def get_app(self, package_name: str) -> IAppRepository.Path:
+        """
+        Returns either a cached or a freshly fetched apk file.
+        :param package_name: the package to return
+        :return: apk path or None
+        """
+        filepath = super().get_app(package_name)
+        if filepath is not None:
+            return filepath
+
+        # apk not yet available -> fetch it from the source
+        if not self.make_space(0):
+            print('Not enough space in the apk folder to fetch ' + package_name)
+            return None
+        for attempt in range(FetchingRepository.FETCH_ATTEMPTS):
+            (apk_path, version) = self.fetch_app(package_name)
+            if apk_path is None or not path.exists(apk_path):
+                return None
+            filepath = self.add_fetched_app(package_name, apk_path, version)
+            if filepath is not None:
+                return filepath
+        return None
+
+    def add_fetched_app(self, package_name: str, apk_path: str, version: Union[str, None]) -> IAppRepository.Path:
+        """
+        Verifies a fetched apk and adds it to the repository. Invalid apks are dropped.
+        :param package_name
+        :param apk_path: the fetched apk in the store's incoming folder
+        :param version: the version code of the apk or None if unknown
+        :return: path to the apk file of the latest version of the package or None if the fetched apk is invalid
+        """
+        metadata = self.store.get_metadata(apk_path)
+        if not metadata.valid:
+            print('Fetched invalid apk for ' + package_name + ': ' + str(metadata.error))
+            remove(apk_path)
+            return None
+        if version is None and metadata.version_code is not None:
+            version = str(metadata.version_code)
+        return self.add_app(package_name, apk_path, version)
+
+    def handle_invalid_app(self, package_name: str, apk_set: IAppRepository.PathSet) -> IAppRepository.PathSet:
+        """
+        Replaces an invalid single apk by a freshly fetched one. Apk sets cannot be fetched and are rejected.
+        """
+        filename = FileBackedRepository.package_to_file(package_name, None)
+        filepath = self.get_file_path(filename)
+        if apk_set != [filepath]:
+            return super().handle_invalid_app(package_name, apk_set)
+
+        print('Fetching ' + package_name + ' again to replace the invalid apk.')
+        with self.lock:
+            remove(filepath)
+            self.forget_index_entry(filename)
+        # the fetched apk is verified, so this does not recurse again
+        filepath = self.get_app(package_name)
+        return [filepath] if filepath is not None else list()
+
+    def get_incoming_path(self, package_name: str) -> str:
+        """
+        :param package_name
+        :return: a path in the store's incoming folder that no other process or thread fetches to
+        """
+        return ApkStore.tmp_path(path.join(self.store.get_incoming_dir(), package_name + APK_FILE_ENDING))
+
+    ### interface left to implement
+
+    def fetch_app(self, package_name: str) -> Tuple[Union[str, None], Union[str, None]]:
+        """
+        Obtains the apk of a package from the source and stores it in the store's incoming folder, see
+        get_incoming_path.
+        :param package_name
+        :return: a tuple of the path of the fetched apk (None if unavailable) and its version code (None if unknown)
+        """
+        raise AssertionError('FetchingRepository: fetch_app not implemented')
@@ -1,9 +1,12 @@
-from typing import Union
+from typing import Union, List
 
 from model.IAppRepository import IAppRepository
+from repositories.ApkStore import ApkStore
 
-from os import path
+from os import path, listdir, scandir, remove
+from threading import RLock
 
+from utils.apkutils import APK_FILE_ENDING, order_apk_set, is_base_apk, ApkMetadata, sha256_file
 from utils.filesystem_config import FilesystemConfig
 
 
@@ -13,32 +16,323 @@ __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
 class FileBackedRepository(IAppRepository):
     """
     Simple implementation of an AppRepository that manages a directory of apk files.
-    Version-awareness is not supported.
+    Apps are either stored as a single <package>.apk file or, for split apks, as a <package> folder containing the
+    base apk and the split apks.
+    Apps added through add_app are kept in a content-addressed store that knows their versions, while <package>.apk
+    is a hardlink to the latest version. Apps that were copied to the directory by hand are only available as the
+    unversioned <package>.apk.
+
+    The content of the directory is indexed once on creation. Lookups of unknown apps check the filesystem once, since
+    other processes might have added them. Known apps are answered from the index; if handing out their apk fails
+    since another process evicted it meanwhile, the app is looked up once more.
+
+    Apps are verified before they are handed out, so truncated or unsigned apks never reach a device. The metadata
+    extracted during verification is cached by the store, keyed by the hash of the apk. Hashes are taken from the
+    store's index for apps that were added through add_app and only computed for other apps, once per app. Afterwards,
+    they are trusted until installing the app fails, see recheck_app_set.
+
+    If the store exceeds its budget or the disk reserve (see FilesystemConfig), apps that are not pinned are
+    evicted. Hand-copied apks are never evicted.
+
+    The repository can be used by several threads, e.g., of the repository service. Updates of the index and the
+    store are serialized by a lock, while downloads and the verification of apks run in parallel.
     """
 
     def __init__(self):
-        self.root = FilesystemConfig().get_apk_dir()
+        config = FilesystemConfig()
+        self.root = config.get_apk_dir()
+        self.store = ApkStore(self.root, config.get_apk_budget(), config.get_apk_eviction(), config.get_apk_reserve())
+
+        # index of the directory: filename -> path of single apks, filenames of apk set folders
+        self.files = dict()
+        self.sets = set()
+        # filename -> hashes of the apk files, in the order of the apk set
+        self.hashes = dict()
+        # held while the index or the store are updated. Reentrant, since adding apps evicts others
+        self.lock = RLock()
+        self.build_index()
+
+    def build_index(self) -> None:
+        """
+        Indexes the directory with a single scan.
+        """
+        self.files = dict()
+        self.sets = set()
+        for entry in scandir(self.root):
+            if entry.name.startswith('.'):
+                continue
+            if entry.name.endswith(APK_FILE_ENDING) and entry.is_file():
+                self.files[entry.name[:-len(APK_FILE_ENDING)]] = entry.path
+            elif entry.is_dir():
+                self.sets.add(entry.name)
+
+    def refresh_index_entry(self, filename: str) -> None:
+        """
+        Makes sure the index knows filename if it exists. Only unknown filenames are looked up on the filesystem.
+        :param filename
+        """
+        if filename in self.files or filename in self.sets:
+            return
+        with self.lock:
+            filepath = self.get_file_path(filename)
+            if path.isfile(filepath):
+                self.files[filename] = filepath
+            elif path.isdir(self.get_set_dir(filename)):
+                self.sets.add(filename)
 
     def get_app(self, package_name: str) -> IAppRepository.Path:
         """
         :param package_name
         :return: path to apk file or None
         """
+        self.refresh_index_entry(FileBackedRepository.package_to_file(package_name, None))
+        return self.get_indexed_app(package_name)
+
+    def get_indexed_app(self, package_name: str) -> IAppRepository.Path:
+        """
+        Answered from the index only, apps that other processes added since are not looked up.
+        :param package_name
+        :return: path to apk file or None
+        """
         filename = FileBackedRepository.package_to_file(package_name, None)
-        filepath = self.get_file_path(filename)
-        if not path.exists(filepath):
+        if filename in self.files:
+            return self.files[filename]
+        # split apks: fall back to the base apk
+        apk_set = self.get_stored_set(filename)
+        return apk_set[0] if len(apk_set) > 0 and is_base_apk(apk_set[0]) else None
+
+    def get_app_set(self, package_name: str) -> IAppRepository.PathSet:
+        """
+        :param package_name
+        :return: paths to the base apk and all split apks, or an empty list
+        """
+        filename = FileBackedRepository.package_to_file(package_name, None)
+        self.refresh_index_entry(filename)
+        try:
+            return self.hand_out_app_set(package_name, filename)
+        except OSError:
+            # removed since it was indexed, e.g., evicted by another process
+            self.forget_index_entry(filename)
+            self.refresh_index_entry(filename)
+        try:
+            return self.hand_out_app_set(package_name, filename)
+        except OSError as e:
+            print('Could not read the apks of ' + package_name + ': ' + str(e))
+            return list()
+
+    def hand_out_app_set(self, package_name: str, filename: str) -> IAppRepository.PathSet:
+        """
+        Verifies the indexed apks of an app and records their use.
+        :param package_name
+        :param filename
+        :return: paths to the base apk and all split apks, or an empty list
+        :raises OSError: if an indexed apk does not exist anymore
+        """
+        apk_set = self.get_indexed_set(package_name, filename)
+        if len(apk_set) == 0:
+            return apk_set
+
+        apk_hashes = self.get_app_hashes(package_name, filename, apk_set)
+        if not self.verify_app_set(package_name, apk_set, apk_hashes):
+            return self.handle_invalid_app(package_name, apk_set)
+        self.store.record_uses(apk_hashes)
+        return apk_set
+
+    def recheck_app_set(self, package_name: str) -> IAppRepository.PathSet:
+        """
+        Verifies the apks of an app once more after installing them failed. Their index entry is dropped and the apks
+        are hashed again, so apks that were damaged or replaced since they were handed out are detected.
+        :param package_name
+        :return: paths to the apk files if they changed or were replaced since they were handed out, otherwise (also if
+        the apks are damaged and cannot be replaced) an empty list
+        """
+        filename = FileBackedRepository.package_to_file(package_name, None)
+        with self.lock:
+            handed_out = self.hashes.get(filename)
+            self.forget_index_entry(filename)
+            self.store.refresh_index()
+            self.refresh_index_entry(filename)
+        try:
+            apk_set = self.get_indexed_set(package_name, filename)
+            if len(apk_set) == 0:
+                return apk_set
+            apk_hashes = [sha256_file(apk_path, use_cache=False) for apk_path in apk_set]
+            if not self.verify_app_set(package_name, apk_set, apk_hashes):
+                return self.handle_invalid_app(package_name, apk_set)
+        except OSError as e:
+            print('Could not read the apks of ' + package_name + ': ' + str(e))
+            return list()
+        with self.lock:
+            self.hashes[filename] = apk_hashes
+        return apk_set if apk_hashes != handed_out else list()
+
+    def get_indexed_set(self, package_name: str, filename: str) -> IAppRepository.PathSet:
+        """
+        :param package_name
+        :param filename
+        :return: paths to the base apk and all split apks or the single apk, or an empty list
+        """
+        apk_set = self.get_stored_set(filename)
+        if len(apk_set) == 0:
+            # no split apks, so we return the single apk (if available)
+            filepath = self.get_app(package_name)
+            apk_set = [filepath] if filepath is not None else list()
+        return apk_set
+
+    def get_app_hashes(self, package_name: str, filename: str, apk_set: IAppRepository.PathSet) -> List[str]:
+        """
+        Hashes of the apks of an app, for both the verification and the usage statistics. Apps added through add_app
+        are not read, since the store recorded their hashes when they were added.
+        :param package_name
+        :param filename
+        :param apk_set: the apk files of the app
+        :return: the hashes of the apk files
+        :raises OSError: if an apk that needs to be hashed does not exist anymore
+        """
+        apk_hashes = self.hashes.get(filename)
+        if apk_hashes is not None and len(apk_hashes) == len(apk_set):
+            return apk_hashes
+        stored_hash = self.store.latest_hash(package_name)
+        if stored_hash is not None and apk_set == [self.get_file_path(filename)]:
+            # the view links the latest version in the store
+            apk_hashes = [stored_hash]
+        else:
+            apk_hashes = [sha256_file(apk_path) for apk_path in apk_set]
+        with self.lock:
+            self.hashes[filename] = apk_hashes
+        return apk_hashes
+
+    def forget_index_entry(self, filename: str) -> None:
+        with self.lock:
+            self.files.pop(filename, None)
+            self.sets.discard(filename)
+            self.hashes.pop(filename, None)
+
+    def get_app_metadata(self, package_name: str) -> Union[ApkMetadata, None]:
+        """
+        :param package_name
+        :return: the metadata of the (base) apk of the app or None if the app is not available
+        """
+        filename = FileBackedRepository.package_to_file(package_name, None)
+        self.refresh_index_entry(filename)
+        try:
+            return self.read_app_metadata(package_name, filename)
+        except OSError:
+            # removed since it was indexed, e.g., evicted by another process
+            self.forget_index_entry(filename)
+            self.refresh_index_entry(filename)
+        return self.read_app_metadata(package_name, filename)
+
+    def read_app_metadata(self, package_name: str, filename: str) -> Union[ApkMetadata, None]:
+        apk_set = self.get_indexed_set(package_name, filename)
+        if len(apk_set) == 0:
             return None
-        return filepath
+        return self.store.get_metadata(apk_set[0], self.get_app_hashes(package_name, filename, apk_set)[0])
+
+    def verify_app_set(self, package_name: str, apk_set: IAppRepository.PathSet,
+                       apk_hashes: Union[List[str], None]=None) -> bool:
+        """
+        :param package_name
+        :param apk_set: the apk files of the app
+        :param apk_hashes: the hashes of the apk files, if already computed
+        :return: whether all apk files of the app are intact
+        """
+        for index, apk_path in enumerate(apk_set):
+            metadata = self.store.get_metadata(apk_path, apk_hashes[index] if apk_hashes is not None else None)
+            if not metadata.valid:
+                print('Invalid apk ' + apk_path + ': ' + str(metadata.error))
+                return False
+            if metadata.package != package_name:
+                # not fatal, e.g., apps that were copied to the folder by hand might be named differently
+                print('Warning: ' + apk_path + ' contains package ' + str(metadata.package))
+        return True
+
+    def handle_invalid_app(self, package_name: str, apk_set: IAppRepository.PathSet) -> IAppRepository.PathSet:
+        """
+        Called if an app failed the verification. Repositories that can obtain apps again may replace it.
+        :param package_name
+        :param apk_set: the apk files of the invalid app
+        :return: paths to the apk files of a valid replacement or an empty list
+        """
+        print('Rejecting invalid app ' + package_name)
+        return list()
+
+    def get_stored_set(self, filename: str) -> IAppRepository.PathSet:
+        """
+        :param filename
+        :return: paths to the apk files in the apk set folder for filename, base apk first, or an empty list
+        """
+        if filename not in self.sets:
+            return list()
+        set_dir = self.get_set_dir(filename)
+        return order_apk_set([path.join(set_dir, entry) for entry in listdir(set_dir)
+                              if entry.endswith(APK_FILE_ENDING)])
 
     def get_app_version(self, package_name: str, version: str) -> IAppRepository.Path:
         """
         :param package_name
-        :param version
-        :return: path to apk file or None
+        :param version: the version code
+        :return: path to apk file or None if this version is not stored
         """
+        return self.store.lookup(package_name, version)
 
-        # TODO log fallback
-        return self.get_app(package_name)
+    def add_app(self, package_name: str, file_path: str, version: Union[str, None]) -> IAppRepository.Path:
+        """
+        Adds an apk file to the repository. The file is moved into the store, or dropped if an identical apk is
+        stored already.
+        :param package_name
+        :param file_path: the apk file, ideally located in the store's incoming folder
+        :param version: the version code of the apk or None if unknown
+        :return: path to the apk file of the latest version of the package
+        """
+        filename = FileBackedRepository.package_to_file(package_name, None)
+        filepath = self.get_file_path(filename)
+        with self.lock:
+            self.store.add(package_name, file_path, version)
+            self.store.link_view(self.store.latest(package_name), filepath)
+            self.files[filename] = filepath
+            # taken from the store on the next lookup
+            self.hashes.pop(filename, None)
+            # the new apk is protected since it is in use, so other apps make way for it
+            self.store.pin([package_name])
+            self.make_space(0)
+        return filepath
+
+    def pin_apps(self, package_names: List[str]) -> None:
+        """
+        Protects the apks of apps from eviction, e.g., since they are queued for evaluation.
+        :param package_names
+        """
+        self.store.pin(package_names)
+
+    def unpin_app(self, package_name: str) -> None:
+        """
+        Allows the eviction of an app's apks again, e.g., since its evaluation completed.
+        :param package_name
+        """
+        self.store.unpin(package_name)
+
+    def make_space(self, size: int) -> bool:
+        """
+        Evicts apps from the store until size bytes fit into its budget and the disk reserve.
+        :param size: the number of bytes that is about to be added
+        :return: whether enough space is available
+        """
+        with self.lock:
+            (affected, enough) = self.store.make_space(size)
+            for package_name in affected:
+                # the view still links the evicted blob, so fall back to the latest remaining version or drop it
+                filename = FileBackedRepository.package_to_file(package_name, None)
+                filepath = self.get_file_path(filename)
+                self.hashes.pop(filename, None)
+                latest = self.store.latest(package_name)
+                if latest is not None:
+                    self.store.link_view(latest, filepath)
+                else:
+                    if path.exists(filepath):
+                        remove(filepath)
+                    self.files.pop(filename, None)
+        return enough
 
     @staticmethod
     def package_to_file(package_name: str, version: Union[str, None]) -> IAppRepository.Path:
@@ -50,7 +344,7 @@ class FileBackedRepository(IAppRepository):
         :return: filename
         """
 
-        # this implementation is not version-aware
+        # versions are resolved by the store, the file always refers to the latest version
         return package_name
 
     def get_file_path(self, filename: str) -> IAppRepository.Path:
@@ -59,4 +353,12 @@ class FileBackedRepository(IAppRepository):
         :return: full path to filename
         """
 
-        return path.join(self.root, filename + ".apk")
+        return path.join(self.root, filename + APK_FILE_ENDING)
+
+    def get_set_dir(self, filename: str) -> str:
+        """
+        :param filename
+        :return: full path to the folder storing the apk set for filename
+        """
+
+        return path.join(self.root, filename)
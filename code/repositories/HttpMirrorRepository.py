@@ -0,0 +1,42 @@
+from os import path, remove
+from shutil import copyfileobj
+from typing import Tuple, Union
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import urlopen
+
+from repositories.FetchingRepository import FetchingRepository
+from utils.apkutils import APK_FILE_ENDING
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class HttpMirrorRepository(FetchingRepository):
+    """
+    App repository that downloads apks from an HTTP mirror, e.g., an apk folder on the LAN served by mirror.py.
+    Apps are requested as <url>/<package>.apk.
+    """
+
+    TIMEOUT = 60
+
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url.rstrip('/')
+
+    def fetch_app(self, package_name: str) -> Tuple[Union[str, None], Union[str, None]]:
+        url = self.url + '/' + quote(package_name + APK_FILE_ENDING)
+        apk_path = self.get_incoming_path(package_name)
+        try:
+            with urlopen(url, timeout=HttpMirrorRepository.TIMEOUT) as response, open(apk_path, 'wb') as apk_file:
+                copyfileobj(response, apk_file)
+        except HTTPError as e:
+            print('Mirror does not provide ' + package_name + ': ' + str(e.code))
+            return None, None
+        except (URLError, OSError) as e:
+            print('Downloading ' + package_name + ' from the mirror failed: ' + str(e))
+            if path.exists(apk_path):
+                remove(apk_path)
+            return None, None
+        # the version is taken from the manifest
+        return apk_path, None
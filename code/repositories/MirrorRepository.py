@@ -0,0 +1,31 @@
+from os import path
+from shutil import copyfile
+from typing import Tuple, Union
+
+from repositories.FetchingRepository import FetchingRepository
+from utils.apkutils import APK_FILE_ENDING
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class MirrorRepository(FetchingRepository):
+    """
+    App repository that copies apks from a read-only mirror folder, e.g., a network share, into its apk folder.
+    The mirror stores apps as <package>.apk.
+    """
+
+    def __init__(self, mirror_dir: str):
+        super().__init__()
+        if not path.isdir(mirror_dir):
+            raise AssertionError('Mirror folder does not exist: ' + mirror_dir)
+        self.mirror_dir = mirror_dir
+
+    def fetch_app(self, package_name: str) -> Tuple[Union[str, None], Union[str, None]]:
+        source = path.join(self.mirror_dir, package_name + APK_FILE_ENDING)
+        if not path.isfile(source):
+            return None, None
+        apk_path = self.get_incoming_path(package_name)
+        copyfile(source, apk_path)
+        # the version is taken from the manifest
+        return apk_path, None
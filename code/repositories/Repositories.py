@@ -0,0 +1,94 @@
+from typing import List, Union
+
+from model.IAppRepository import IAppRepository
+from repositories.FileBackedRepository import FileBackedRepository
+from repositories.HttpMirrorRepository import HttpMirrorRepository
+from repositories.MirrorRepository import MirrorRepository
+from repositories.RepositoryService import RepositoryManager, ignore_interrupts
+from repositories.gplay.GPlayDownloaderRepository import GPlayDownloaderRepository
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class Repositories(object):
+    # ids of the available app repositories
+    LOCAL = 'local'
+    MIRROR = 'mirror'
+    HTTP = 'http'
+    GPLAY = 'gplay'
+
+    # constant map of all repositories available. Instances are created on demand since most of them access the
+    # apk folder on creation
+    MAP = {LOCAL: FileBackedRepository,
+           MIRROR: MirrorRepository,
+           HTTP: HttpMirrorRepository,
+           GPLAY: GPlayDownloaderRepository}
+
+    # repositories that require a source (mirror folder or url)
+    WITH_SOURCE = [MIRROR, HTTP]
+
+    DEFAULT = GPLAY
+
+    # the repository selected for this run and the service sharing it
+    selected = DEFAULT
+    source = None
+    manager = None
+    shared = None
+
+    @staticmethod
+    def get_ids() -> List[str]:
+        return sorted(Repositories.MAP.keys())
+
+    @staticmethod
+    def select(repo_id: str, source: Union[str, None]=None) -> None:
+        """
+        Selects the repository used by all evaluations of this run.
+        :param repo_id: one of the keys of MAP
+        :param source: the mirror folder or url, required by the repositories in WITH_SOURCE
+        :raises ValueError: for unknown repositories or missing sources
+        """
+        if repo_id not in Repositories.MAP:
+            raise ValueError('No such repository: ' + str(repo_id))
+        if repo_id in Repositories.WITH_SOURCE and not source:
+            raise ValueError('The ' + repo_id + ' repository requires a mirror.')
+        Repositories.selected = repo_id
+        Repositories.source = source
+
+    @staticmethod
+    def create(repo_id: str, source: Union[str, None]=None) -> IAppRepository:
+        """
+        :return: a new instance of the repository
+        """
+        repo_class = Repositories.MAP[repo_id]
+        if repo_id in Repositories.WITH_SOURCE:
+            return repo_class(source)
+        return repo_class()
+
+    @staticmethod
+    def start_service() -> IAppRepository:
+        """
+        Starts a service process that hosts the selected repository, so all workers share a single instance.
+        :return: a proxy for the shared repository that can be handed to other processes
+        """
+        if Repositories.shared is None:
+            Repositories.manager = RepositoryManager()
+            Repositories.manager.start(ignore_interrupts)
+            # noinspection PyUnresolvedReferences
+            Repositories.shared = Repositories.manager.SharedRepository(Repositories.selected, Repositories.source)
+        return Repositories.shared
+
+    @staticmethod
+    def stop_service() -> None:
+        if Repositories.manager is not None:
+            Repositories.manager.shutdown()
+        Repositories.manager = None
+        Repositories.shared = None
+
+    @staticmethod
+    def get_app_repository() -> IAppRepository:
+        """
+        :return: the shared repository if the service is running, otherwise a new instance of the selected repository
+        """
+        if Repositories.shared is not None:
+            return Repositories.shared
+        return Repositories.create(Repositories.selected, Repositories.source)
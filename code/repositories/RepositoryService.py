@@ -0,0 +1,77 @@
+from multiprocessing.managers import BaseManager
+from signal import signal, SIGINT, SIG_IGN
+from threading import Lock
+from typing import List, Union
+
+from model.IAppRepository import IAppRepository
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class SharedRepository(IAppRepository):
+    """
+    The repository that the repository service shares with all workers. The service handles each worker in its own
+    thread. Requests for the same package are coalesced: while one thread obtains an app, e.g., by downloading it,
+    other threads asking for the same app wait and are then served from the apk folder, so every app is only
+    transferred once. Requests for different packages are processed in parallel, while the repository itself
+    serializes the updates of its index and store (see FileBackedRepository).
+    """
+
+    EXPOSED = ['get_app', 'get_app_version', 'get_app_set', 'recheck_app_set', 'get_app_metadata', 'pin_apps',
+               'unpin_app']
+
+    def __init__(self, repo_id: str, source: Union[str, None]):
+        # local import to avoid circular dependency
+        from repositories.Repositories import Repositories
+        self.repo = Repositories.create(repo_id, source)
+        # mapping: package -> lock held while a request for the package is in flight
+        self.in_flight = dict()
+        self.lock = Lock()
+
+    def package_lock(self, package_name: str) -> Lock:
+        with self.lock:
+            if package_name not in self.in_flight:
+                self.in_flight[package_name] = Lock()
+            return self.in_flight[package_name]
+
+    def get_app(self, package_name: str) -> IAppRepository.Path:
+        with self.package_lock(package_name):
+            return self.repo.get_app(package_name)
+
+    def get_app_version(self, package_name: str, version: str) -> IAppRepository.Path:
+        with self.package_lock(package_name):
+            return self.repo.get_app_version(package_name, version)
+
+    def get_app_set(self, package_name: str) -> IAppRepository.PathSet:
+        with self.package_lock(package_name):
+            return self.repo.get_app_set(package_name)
+
+    def recheck_app_set(self, package_name: str) -> IAppRepository.PathSet:
+        with self.package_lock(package_name):
+            return self.repo.recheck_app_set(package_name)
+
+    def get_app_metadata(self, package_name: str):
+        with self.package_lock(package_name):
+            return self.repo.get_app_metadata(package_name)
+
+    def pin_apps(self, package_names: List[str]) -> None:
+        self.repo.pin_apps(package_names)
+
+    def unpin_app(self, package_name: str) -> None:
+        self.repo.unpin_app(package_name)
+
+
+class RepositoryManager(BaseManager):
+    """
+    Runs the repository service process. Its proxies can be handed to worker processes.
+    """
+    pass
+
+
+RepositoryManager.register('SharedRepository', SharedRepository, exposed=SharedRepository.EXPOSED)
+
+
+def ignore_interrupts() -> None:
+    # the service is stopped by the main process after the workers finished, not by ctrl-c
+    signal(SIGINT, SIG_IGN)
@@ -1,14 +1,28 @@
 # -*- coding: utf-8 -*-
 import os
+from shutil import disk_usage
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock, local, get_ident
+from time import monotonic, sleep
+from typing import Union, Dict, List
 
-from repositories.gplay.googleplay_api.googleplay_api.googleplay import GooglePlayAPI
-from repositories.gplay.googleplay_api.googleplay_api.helpers import sizeof_fmt
+from repositories.FetchingRepository import FetchingRepository
+from utils.ratelimit import TokenBucket, backoff_delay
 
 __author__ = 'Sebastian Weisgerber <weisgerber@cs.uni-saarland.de>'
 
-# Do not remove
-GOOGLE_LOGIN = GOOGLE_PASSWORD = AUTH_TOKEN = None
-from repositories.gplay.googleplay_api.googleplay_api.config import *
+
+# The Play Store client (protobuf messages, requests) and its configuration are imported on first use, so that
+# evaluations with local apks and the analysis do not pay for loading them.
+
+def get_config():
+    from repositories.gplay.googleplay_api.googleplay_api import config
+    return config
+
+
+def sizeof_fmt(num) -> str:
+    from repositories.gplay.googleplay_api.googleplay_api.helpers import sizeof_fmt as helpers_sizeof_fmt
+    return helpers_sizeof_fmt(num)
 
 
 class MonkeyLoaderConfig:
@@ -18,42 +32,78 @@ class MonkeyLoaderConfig:
 
     APK_FILE_ENDING = '.apk'
 
+    # bulk downloads
+    PARALLEL_DOWNLOADS = 4
+    # downloads per minute and account
+    DOWNLOAD_RATE = 20
+    DOWNLOAD_RETRIES = 3
+
 
 class GooglePlayApi:
-    def __init__(self):
+    def __init__(self, account: Union[Dict[str, str], None]=None):
+        """
+        :param account: credentials with the keys android_id, login, password and auth_token. Missing keys default to
+        the single account of the configuration
+        """
         print('> Starting GooglePlayApi')
-        pass
-
-    def download(self, package_name: str) -> str:
+        self.account = account if account is not None else dict()
+        # mapping: package -> version code of the last download
+        self.version_codes = dict()
+        # logged in api handles, one per thread since they are not thread-safe
+        self.handles = local()
+
+    def get_api_handle(self):
+        api_handle = getattr(self.handles, 'api', None)
+        if api_handle is None:
+            from repositories.gplay.googleplay_api.googleplay_api.googleplay import GooglePlayAPI
+            config = get_config()
+            api_handle = GooglePlayAPI(self.account.get('android_id', config.ANDROID_ID))
+            api_handle.login(self.account.get('login', config.GOOGLE_LOGIN),
+                             self.account.get('password', config.GOOGLE_PASSWORD),
+                             self.account.get('auth_token', getattr(config, 'AUTH_TOKEN', None)))
+            self.handles.api = api_handle
+        return api_handle
+
+    def download(self, package_name: str, apk_filename: str=None) -> str:
         print('> downloading: ' + package_name + ' [GooglePlayApi]')
 
-        global ANDROID_ID, GOOGLE_LOGIN, GOOGLE_PASSWORD, AUTH_TOKEN
-
-        apk_filename = get_apk_filename(package_name)
+        if apk_filename is None:
+            apk_filename = get_apk_filename(package_name)
 
-        api_handle = GooglePlayAPI(ANDROID_ID)
-        api_handle.login(GOOGLE_LOGIN, GOOGLE_PASSWORD, AUTH_TOKEN)
+        try:
+            api_handle = self.get_api_handle()
 
-        # Get the version code and the offer type from the app details
-        app_details = api_handle.details(package_name)
-        app_details_docv2 = app_details.docV2
-        app_version_code = app_details_docv2.details.appDetails.versionCode
-        app_offer_type = app_details_docv2.offer[0].offerType
+            # Get the version code and the offer type from the app details
+            app_details = api_handle.details(package_name)
+            app_details_docv2 = app_details.docV2
+            app_version_code = app_details_docv2.details.appDetails.versionCode
+            app_offer_type = app_details_docv2.offer[0].offerType
 
-        # Download
-        print("Downloading %s..." % sizeof_fmt(app_details_docv2.details.appDetails.installationSize), end=' ')
+            # Download
+            print("Downloading %s..." % sizeof_fmt(app_details_docv2.details.appDetails.installationSize), end=' ')
 
-        apk_download_data = api_handle.download(package_name, app_version_code, app_offer_type)
+            apk_download_data = api_handle.download(package_name, app_version_code, app_offer_type)
+        except Exception:
+            # the session might have expired, log in again next time
+            self.handles.api = None
+            raise
 
         self.save_downloaded_apk(apk_download_data, apk_filename)
+        self.version_codes[package_name] = str(app_version_code)
 
         print('> downloading: ' + package_name + ' [GooglePlayApi] DONE')
         return apk_filename
 
+    def get_version_code(self, package_name: str) -> Union[str, None]:
+        return self.version_codes.get(package_name)
+
     def save_downloaded_apk(self, apk_download_data, apk_filename):
-        opened_apk_file = open(apk_filename, "wb")
+        # publish the apk atomically, so concurrent readers never see a partially written file
+        tmp_filename = apk_filename + '.' + str(os.getpid()) + '.' + str(get_ident()) + '.part'
+        opened_apk_file = open(tmp_filename, "wb")
         opened_apk_file.write(apk_download_data)
         opened_apk_file.close()
+        os.replace(tmp_filename, apk_filename)
 
 
 def get_apk_filename(package_name: str) -> str:
@@ -69,27 +119,34 @@ class MonkeyLoader:
 
     """
 
-    downloaders = list()
-
     def __init__(self):
-        self.downloaders.append(GooglePlayApi())
+        # created on first use, since this requires the configuration
+        self.downloaders = None
+
+    def get_downloaders(self) -> List[GooglePlayApi]:
+        if self.downloaders is None:
+            # one downloader per configured account, falling back to the single default account
+            accounts = getattr(get_config(), 'ACCOUNTS', None)
+            self.downloaders = [GooglePlayApi(account) for account in (accounts if accounts else [None])]
+        return self.downloaders
 
     def __str__(self):
         to_string = "class MonkeyLoader"
         return to_string
 
-    def download_if_not_exist(self, package_name: str, apk_folder: str) -> str:
+    def download_if_not_exist(self, package_name: str, apk_folder: str, check_exists: bool=True) -> str:
         """
         Downloads the package from one of the configured downloaders.
         Check if the application is already in the APK folder.
 
         :param package_name:
         :param apk_folder:
+        :param check_exists: set to False if the caller already knows that the APK is missing
         :return:
         """
         apk_name = get_apk_filename(package_name)
         path_to_apk = os.path.join(apk_folder, apk_name)
-        if (os.path.exists(path_to_apk)):
+        if (check_exists and os.path.exists(path_to_apk)):
             print('File exists, Not Downloading: ' + path_to_apk)
             return path_to_apk
         else:
@@ -109,16 +166,140 @@ class MonkeyLoader:
         if (path_to_apk == None):
             path_to_apk = os.getcwd() + '/' + get_apk_filename(package_name)
 
-        for downloader in self.downloaders:
-            apk_file = downloader.download(package_name)
-            if (apk_file != None and path_to_apk != None):
-                try:
-                    os.rename(apk_file, path_to_apk)
-                    break
-                except OSError:
-                    print('>> Could NOT move APK to: ' + path_to_apk)
-            if (os.path.exists(apk_file)):
+        for downloader in self.get_downloaders():
+            # downloaders write to the target directly, moving the apk could cross filesystems
+            try:
+                apk_file = downloader.download(package_name, path_to_apk)
+            except Exception as e:
+                # e.g., the app is not available for this account, try the next one
+                print('>> Download of ' + package_name + ' failed: ' + str(e))
+                continue
+            if (apk_file != None and os.path.exists(apk_file)):
                 print('APK Found: ' + apk_file)
                 break
 
         return path_to_apk
+
+    def get_version_code(self, package_name: str) -> Union[str, None]:
+        """
+        Returns the version code of the last download of a package, as reported by the downloaders.
+
+        :param package_name:
+        :return: the version code or None if unknown
+        """
+        for downloader in self.get_downloaders():
+            version_code = downloader.get_version_code(package_name)
+            if version_code is not None:
+                return version_code
+        return None
+
+    def download_all(self, package_names: List[str], repository: FetchingRepository, check_exists: bool=True,
+                     workers: int=MonkeyLoaderConfig.PARALLEL_DOWNLOADS,
+                     rate: float=MonkeyLoaderConfig.DOWNLOAD_RATE,
+                     retries: int=MonkeyLoaderConfig.DOWNLOAD_RETRIES,
+                     reserved_disk_space: int=MonkeyLoaderConfig.RESERVED_DISK_SPACE) -> Dict[str, Union[str, None]]:
+        """
+        Downloads many packages in parallel. Downloads are spread over the configured accounts and every account is
+        rate limited on its own. Failed downloads are retried with jittered exponential backoff, using the next
+        account for each retry. Downloaded apps are verified and added to the repository, so they end up in its store
+        and index like apps it fetched itself.
+
+        :param package_names:
+        :param repository: the repository of the APK folder
+        :param check_exists: set to False to download apps that are in the repository already
+        :param workers: number of parallel downloads
+        :param rate: downloads per minute and account, 0 for no limit
+        :param retries: number of retries per package
+        :param reserved_disk_space: downloads are skipped (and reported as failed) while less space is free
+        :return: mapping from package names to the downloaded apk files or None for failed downloads
+        """
+        # bursts of one download per worker are fine, the long-term rate is what counts
+        downloaders = self.get_downloaders()
+        buckets = [TokenBucket(rate / 60.0, workers) for downloader in downloaders]
+        progress = DownloadProgress(len(package_names))
+
+        def download_one(index: int, package_name: str) -> Union[str, None]:
+            if check_exists:
+                # answered from the index of the APK folder, which the repository built with a single scan
+                path_to_apk = repository.get_indexed_app(package_name)
+                if path_to_apk is not None:
+                    progress.skipped(package_name)
+                    return path_to_apk
+            if disk_usage(repository.root).free < reserved_disk_space:
+                print('>> Not downloading ' + package_name + ', the disk of ' + repository.root + ' is full')
+                progress.failed(package_name)
+                return None
+            for attempt in range(retries + 1):
+                # retries go to another account
+                account = (index + attempt) % len(downloaders)
+                buckets[account].acquire()
+                try:
+                    download_path = downloaders[account].download(package_name,
+                                                                  repository.get_incoming_path(package_name))
+                    size = os.path.getsize(download_path)
+                    path_to_apk = repository.add_fetched_app(package_name, download_path,
+                                                             downloaders[account].get_version_code(package_name))
+                    # added apps are pinned since they are usually about to be used, which is not the case here
+                    repository.unpin_app(package_name)
+                    if path_to_apk is None:
+                        raise ValueError('invalid apk')
+                    progress.succeeded(package_name, size)
+                    return path_to_apk
+                except Exception as e:
+                    print('>> Download of ' + package_name + ' failed (attempt ' + str(attempt + 1) + '): ' + str(e))
+                    if attempt < retries:
+                        sleep(backoff_delay(attempt))
+            progress.failed(package_name)
+            return None
+
+        results = dict()
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = dict((executor.submit(download_one, index, package_name), package_name)
+                           for index, package_name in enumerate(package_names))
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        progress.report('done')
+        return results
+
+
+class DownloadProgress:
+    """
+    Thread-safe progress and throughput report of bulk downloads.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.failures = 0
+        self.skips = 0
+        self.bytes = 0
+        self.start = monotonic()
+        self.lock = Lock()
+
+    def succeeded(self, package_name: str, size: int) -> None:
+        with self.lock:
+            self.done += 1
+            self.bytes += size
+            self.report(package_name + ' (' + sizeof_fmt(size) + ')')
+
+    def failed(self, package_name: str) -> None:
+        with self.lock:
+            self.done += 1
+            self.failures += 1
+            self.report(package_name + ' FAILED')
+
+    def skipped(self, package_name: str) -> None:
+        with self.lock:
+            self.done += 1
+            self.skips += 1
+
+    def report(self, last: str='') -> None:
+        elapsed = max(monotonic() - self.start, 0.001)
+        downloaded = self.done - self.failures - self.skips
+        rate = downloaded / elapsed
+        remaining = self.total - self.done
+        eta = (str(int(remaining / rate)) + 's') if rate > 0 else '?'
+        print('> [' + str(self.done) + '/' + str(self.total) + '] ' + last
+              + ' | failed: ' + str(self.failures) + ', skipped: ' + str(self.skips)
+              + ' | ' + ('%.2f' % (rate * 60)) + ' apps/min, ' + sizeof_fmt(self.bytes / elapsed) + '/s'
+              + ', eta: ' + eta)
@@ -0,0 +1,340 @@
+import struct
+from hashlib import sha256
+from os import path, stat
+from typing import List, Union, Dict
+from zipfile import ZipFile, BadZipFile
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+APK_FILE_ENDING = '.apk'
+
+# names of the base apk in an apk set, as used by the package manager and bundletool, respectively
+BASE_APK_NAMES = ['base', 'base-master']
+
+# config split qualifiers (in bundletool notation) and the values they correspond to
+ABI_QUALIFIERS = ['armeabi', 'armeabi_v7a', 'arm64_v8a', 'x86', 'x86_64', 'mips', 'mips64']
+DENSITY_QUALIFIERS = {
+    'ldpi': 120,
+    'mdpi': 160,
+    'tvdpi': 213,
+    'hdpi': 240,
+    'xhdpi': 320,
+    'xxhdpi': 480,
+    'xxxhdpi': 640
+}
+
+
+# hashes of files that were already read: (device, inode) -> ((size, mtime), hash)
+# keyed by inode, so renamed files and hardlinks to the same file do not need to be read again
+_hash_cache = dict()
+
+
+def sha256_file(file_path: str, use_cache: bool=True) -> str:
+    """
+    Computes the SHA-256 hash of a file. Hashes are remembered as long as the file is not modified, so repeated lookups
+    do not read the file again.
+    :param file_path: the file to hash
+    :param use_cache: whether a remembered hash may be returned, False to read the file in any case
+    :return: the hex digest
+    """
+    file_stat = stat(file_path)
+    inode = (file_stat.st_dev, file_stat.st_ino)
+    key = (file_stat.st_size, file_stat.st_mtime_ns)
+    cached = _hash_cache.get(inode)
+    if use_cache and cached is not None and cached[0] == key:
+        return cached[1]
+
+    digest = sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    hex_digest = digest.hexdigest()
+    _hash_cache[inode] = (key, hex_digest)
+    return hex_digest
+
+
+def split_name(apk_path: str) -> str:
+    """
+    :param apk_path: path to an apk file of an apk set
+    :return: the file name without folder and file ending
+    """
+    name = path.basename(apk_path)
+    if name.endswith(APK_FILE_ENDING):
+        name = name[:-len(APK_FILE_ENDING)]
+    return name
+
+
+def is_base_apk(apk_path: str) -> bool:
+    return split_name(apk_path) in BASE_APK_NAMES
+
+
+def config_qualifier(apk_path: str) -> Union[str, None]:
+    """
+    Extracts the qualifier from config splits, e.g., 'arm64_v8a' for 'split_config.arm64_v8a.apk' (package manager
+    naming) or 'base-arm64_v8a.apk' (bundletool naming).
+    :param apk_path: path to an apk file of an apk set
+    :return: the qualifier or None for the base apk and feature splits
+    """
+    name = split_name(apk_path)
+    if name in BASE_APK_NAMES:
+        return None
+    if 'config.' in name:
+        return name.split('config.')[-1]
+    if name.startswith('base-'):
+        return name[len('base-'):]
+    return None
+
+
+def order_apk_set(apk_paths: List[str]) -> List[str]:
+    """
+    :param apk_paths: the apk files of an apk set
+    :return: the apk files with the base apk first and the splits in name order
+    """
+    return sorted(apk_paths, key=lambda apk: (not is_base_apk(apk), split_name(apk)))
+
+
+def select_splits(apk_paths: List[str], abis: Union[List[str], None], density: Union[int, None]) -> List[str]:
+    """
+    Selects the apks of an apk set that are required for a specific device. The base apk, feature splits and
+    unknown config splits (e.g., languages) are always kept. For ABI and density config splits, only the best match for
+    the device is kept. If the device properties are unknown or nothing matches, all splits of that kind are kept and
+    the package manager decides.
+    :param apk_paths: the apk files of an apk set
+    :param abis: the ABIs supported by the device in order of preference, as in ro.product.cpu.abilist
+    :param density: the screen density of the device in dpi
+    :return: the apk files to install, base apk first
+    """
+    selected = list()
+    abi_splits = dict()
+    density_splits = dict()
+    for apk in apk_paths:
+        qualifier = config_qualifier(apk)
+        if qualifier in ABI_QUALIFIERS:
+            abi_splits[qualifier] = apk
+        elif qualifier in DENSITY_QUALIFIERS.keys():
+            density_splits[qualifier] = apk
+        else:
+            selected.append(apk)
+
+    if len(abi_splits) > 0:
+        matching_abis = [abi.replace('-', '_') for abi in (abis if abis is not None else list())
+                         if abi.replace('-', '_') in abi_splits.keys()]
+        if len(matching_abis) > 0:
+            # most preferred abi of the device
+            selected.append(abi_splits[matching_abis[0]])
+        else:
+            selected += abi_splits.values()
+
+    if len(density_splits) > 0:
+        if density is None:
+            selected += density_splits.values()
+        else:
+            # smallest density that is not lower than the device's, otherwise the highest one available
+            available = sorted(density_splits.keys(), key=lambda qualifier: DENSITY_QUALIFIERS[qualifier])
+            larger = [qualifier for qualifier in available if DENSITY_QUALIFIERS[qualifier] >= density]
+            best = larger[0] if len(larger) > 0 else available[-1]
+            selected.append(density_splits[best])
+
+    return order_apk_set(selected)
+
+
+### apk verification and metadata
+
+MANIFEST_FILE = 'AndroidManifest.xml'
+NATIVE_LIB_DIR = 'lib/'
+V1_SIGNATURE_ENDINGS = ('.RSA', '.DSA', '.EC')
+# magic at the end of the apk signing block (v2+ signatures), directly in front of the zip central directory
+SIGNING_BLOCK_MAGIC = b'APK Sig Block 42'
+EOCD_SIGNATURE = b'PK\x05\x06'
+EOCD_SIZE = 22
+MAX_ZIP_COMMENT = 0xffff
+
+# binary xml chunk types and resource ids of the manifest attributes we are interested in
+AXML_STRING_POOL = 0x0001
+AXML_RESOURCE_MAP = 0x0180
+AXML_START_ELEMENT = 0x0102
+AXML_UTF8_FLAG = 0x100
+AXML_TYPE_STRING = 0x03
+AXML_TYPE_INT_DEC = 0x10
+AXML_TYPE_INT_HEX = 0x11
+ATTR_VERSION_CODE = (0x0101021b, 'versionCode')
+ATTR_MIN_SDK = (0x0101020c, 'minSdkVersion')
+ATTR_TARGET_SDK = (0x01010270, 'targetSdkVersion')
+
+
+class ApkMetadata(object):
+    """
+    Information extracted from an apk file. If the apk is broken, valid is False and error describes the problem.
+    """
+
+    FIELDS = ['valid', 'error', 'package', 'version_code', 'min_sdk', 'target_sdk', 'abis', 'signed']
+
+    def __init__(self, valid: bool=False, error: Union[str, None]=None, package: Union[str, None]=None,
+                 version_code: Union[int, None]=None, min_sdk: Union[int, None]=None,
+                 target_sdk: Union[int, None]=None, abis: List[str]=list(), signed: bool=False):
+        self.valid = valid
+        self.error = error
+        self.package = package
+        self.version_code = version_code
+        self.min_sdk = min_sdk
+        self.target_sdk = target_sdk
+        self.abis = list(abis)
+        self.signed = signed
+
+    def to_dict(self) -> Dict[str, object]:
+        return dict((field, getattr(self, field)) for field in ApkMetadata.FIELDS)
+
+    @staticmethod
+    def from_dict(values: Dict[str, object]) -> 'ApkMetadata':
+        return ApkMetadata(**dict((field, values[field]) for field in ApkMetadata.FIELDS if field in values))
+
+
+def read_apk_metadata(apk_path: str) -> ApkMetadata:
+    """
+    Verifies the integrity of an apk file and extracts its metadata. Checks that the zip central directory is intact,
+    that the apk is signed (v1 signature files or v2+ signing block) and that the manifest can be parsed. Truncated
+    downloads fail the first check.
+    :param apk_path: the apk file
+    :return: the metadata, with valid set to False if any check fails
+    """
+    try:
+        with ZipFile(apk_path) as apk:
+            names = apk.namelist()
+            if MANIFEST_FILE not in names:
+                return ApkMetadata(error='No ' + MANIFEST_FILE + ' found.')
+            # reading checks the crc of the entry as well
+            manifest = parse_manifest(apk.read(MANIFEST_FILE))
+    except (BadZipFile, OSError, ValueError, IndexError, struct.error) as e:
+        return ApkMetadata(error='Broken apk: ' + str(e))
+
+    signed = has_signing_block(apk_path) \
+        or any(name.startswith('META-INF/') and name.upper().endswith(V1_SIGNATURE_ENDINGS) for name in names)
+    if not signed:
+        return ApkMetadata(error='Apk is not signed.', package=manifest.get('package'))
+
+    abis = sorted(set(name.split('/')[1] for name in names
+                      if name.startswith(NATIVE_LIB_DIR) and name.count('/') >= 2 and name.endswith('.so')))
+    return ApkMetadata(valid=manifest.get('package') is not None,
+                       error=None if manifest.get('package') is not None else 'No package name in manifest.',
+                       package=manifest.get('package'), version_code=manifest.get(ATTR_VERSION_CODE[1]),
+                       min_sdk=manifest.get(ATTR_MIN_SDK[1]), target_sdk=manifest.get(ATTR_TARGET_SDK[1]),
+                       abis=abis, signed=signed)
+
+
+def get_incompatibility(metadata: Union[ApkMetadata, None], abis: Union[List[str], None],
+                        sdk_level: Union[int, None]) -> Union[str, None]:
+    """
+    Checks whether an apk can be installed on a device, based on its metadata and the device properties.
+    :param metadata: the metadata of the (base) apk or None if unknown
+    :param abis: the ABIs supported by the device, as in ro.product.cpu.abilist, or None if unknown
+    :param sdk_level: the API level of the device or None if unknown
+    :return: the reason why the apk cannot be installed or None if it can (or if this is unknown)
+    """
+    if metadata is None or not metadata.valid:
+        return None
+    if sdk_level is not None and metadata.min_sdk is not None and metadata.min_sdk > sdk_level:
+        return 'Requires API level ' + str(metadata.min_sdk) + ' but the device has ' + str(sdk_level) + '.'
+    # apps without native code run on every ABI
+    if abis is not None and len(metadata.abis) > 0 and not any(abi in abis for abi in metadata.abis):
+        return 'Native code for ' + ', '.join(metadata.abis) + ' does not run on ' + ', '.join(abis) + '.'
+    return None
+
+
+def has_signing_block(apk_path: str) -> bool:
+    """
+    :param apk_path: the apk file
+    :return: whether an apk signing block (v2+ signature scheme) precedes the zip central directory
+    """
+    with open(apk_path, 'rb') as apk:
+        apk.seek(0, 2)
+        size = apk.tell()
+        tail_size = min(size, EOCD_SIZE + MAX_ZIP_COMMENT)
+        apk.seek(size - tail_size)
+        tail = apk.read(tail_size)
+        eocd = tail.rfind(EOCD_SIGNATURE)
+        if eocd < 0 or eocd + EOCD_SIZE > len(tail):
+            return False
+        central_directory = struct.unpack('<I', tail[eocd + 16:eocd + 20])[0]
+        if central_directory < len(SIGNING_BLOCK_MAGIC):
+            return False
+        apk.seek(central_directory - len(SIGNING_BLOCK_MAGIC))
+        return apk.read(len(SIGNING_BLOCK_MAGIC)) == SIGNING_BLOCK_MAGIC
+
+
+def parse_manifest(data: bytes) -> Dict[str, object]:
+    """
+    Minimal parser for binary xml manifests. Only extracts the package name, the version code and the sdk versions.
+    :param data: the content of the binary AndroidManifest.xml
+    :return: mapping from 'package' and the attribute names in ATTR_* to their values, if present
+    """
+    result = dict()
+    strings = list()
+    resource_ids = list()
+    wanted = [ATTR_VERSION_CODE, ATTR_MIN_SDK, ATTR_TARGET_SDK]
+
+    # skip the xml header of the file
+    offset = struct.unpack('<H', data[2:4])[0]
+    while offset + 8 <= len(data):
+        chunk_type, header_size, chunk_size = struct.unpack('<HHI', data[offset:offset + 8])
+        if chunk_size < 8:
+            raise ValueError('Malformed binary xml chunk.')
+
+        if chunk_type == AXML_STRING_POOL:
+            strings = parse_string_pool(data[offset:offset + chunk_size])
+        elif chunk_type == AXML_RESOURCE_MAP:
+            resource_ids = list(struct.unpack('<' + str((chunk_size - header_size) // 4) + 'I',
+                                              data[offset + header_size:offset + chunk_size]))
+        elif chunk_type == AXML_START_ELEMENT:
+            name_index, attribute_start, attribute_size, attribute_count = \
+                struct.unpack('<IHHH', data[offset + 20:offset + 30])
+            element = strings[name_index] if name_index < len(strings) else None
+            for i in range(attribute_count):
+                attribute = offset + 16 + attribute_start + i * attribute_size
+                name, raw_value, data_type, value = struct.unpack('<xxxxIIxxxBI', data[attribute:attribute + 20])
+                attr_name = strings[name] if name < len(strings) else None
+                # names may be obfuscated, so we prefer resource ids
+                attr_id = resource_ids[name] if name < len(resource_ids) else None
+
+                if element == 'manifest' and attr_name == 'package' and raw_value < len(strings):
+                    result['package'] = strings[raw_value]
+                for (wanted_id, wanted_name) in wanted:
+                    if attr_id == wanted_id or (attr_id is None and attr_name == wanted_name):
+                        if data_type in (AXML_TYPE_INT_DEC, AXML_TYPE_INT_HEX):
+                            result[wanted_name] = value
+                        elif data_type == AXML_TYPE_STRING and raw_value < len(strings) \
+                                and strings[raw_value].isdigit():
+                            result[wanted_name] = int(strings[raw_value])
+        offset += chunk_size
+    return result
+
+
+def parse_string_pool(chunk: bytes) -> List[str]:
+    """
+    :param chunk: a binary xml string pool chunk
+    :return: the strings of the pool
+    """
+    header_size, chunk_size, count, style_count, flags, strings_start = struct.unpack('<xxHIIIII', chunk[:24])
+    utf8 = flags & AXML_UTF8_FLAG != 0
+    offsets = struct.unpack('<' + str(count) + 'I', chunk[header_size:header_size + count * 4])
+    strings = list()
+    for string_offset in offsets:
+        position = strings_start + string_offset
+        if utf8:
+            # utf-16 length followed by utf-8 length, each encoded in 1 or 2 bytes
+            position += 2 if chunk[position] & 0x80 else 1
+            length = chunk[position]
+            if length & 0x80:
+                length = ((length & 0x7f) << 8) | chunk[position + 1]
+                position += 1
+            position += 1
+            strings.append(chunk[position:position + length].decode('utf-8', errors='replace'))
+        else:
+            length = struct.unpack('<H', chunk[position:position + 2])[0]
+            position += 2
+            if length & 0x8000:
+                length = ((length & 0x7fff) << 16) | struct.unpack('<H', chunk[position:position + 2])[0]
+                position += 2
+            strings.append(chunk[position:position + length * 2].decode('utf-16-le', errors='replace'))
+    return strings
@@ -0,0 +1,158 @@
+from os import path
+from threading import Lock
+from time import time
+from typing import Union, Tuple
+
+from utils.apkutils import sha256_file, APK_FILE_ENDING
+from utils.shellutils import adb_shell, adb_push
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class DeviceApkCache(object):
+    """
+    Cache of apk files on a device, keyed by the SHA-256 hash of the apk. Installing a cached apk only requires a
+    local 'pm install' on the device instead of transferring the apk again.
+    Entries are evicted in least-recently-used order whenever the free space on the device would drop below a reserve.
+    The cache outlives a single evaluation run since its content is read from the device on first use. The last use
+    of an entry is kept as the modification time of its file, which callers update when they install it (see
+    adb_install_remote), so lookups do not need a round trip to the device.
+    """
+
+    CACHE_DIR = '/data/local/tmp/monkey-troop/apks'
+
+    # free space that is kept on the device, e.g., for installing and compiling apps
+    RESERVED_SPACE = 2 * 1024 * 1024 * 1024
+
+    def __init__(self, device_id: str, cache_dir: str=CACHE_DIR, reserved_space: int=RESERVED_SPACE):
+        self.device_id = device_id
+        self.cache_dir = cache_dir
+        self.reserved_space = reserved_space
+
+        # mapping: hash -> [last use, size in bytes]. None until the cache content was read from the device
+        self.entries = None
+        # the cache is used from the worker and its staging thread
+        self.lock = Lock()
+
+    def remote_path(self, apk_hash: str) -> str:
+        return path.join(self.cache_dir, apk_hash + APK_FILE_ENDING)
+
+    def lookup(self, app_path: str) -> Union[str, None]:
+        """
+        :param app_path: host path of an apk
+        :return: the device path of the cached copy of the apk or None if it is not cached
+        """
+        apk_hash = sha256_file(app_path)
+        with self.lock:
+            self.load()
+            entry = self.entries.get(apk_hash)
+            if entry is None:
+                return None
+            entry[0] = time()
+        return self.remote_path(apk_hash)
+
+    def add(self, app_path: str) -> Tuple[Union[str, None], str]:
+        """
+        Push an apk to the cache unless it is cached already.
+        :param app_path: host path of an apk
+        :return: a tuple of the device path of the cached copy (None on failure) and the collected log output
+        """
+        remote_path = self.lookup(app_path)
+        if remote_path is not None:
+            return remote_path, 'Apk is cached on the device already: ' + remote_path
+
+        apk_hash = sha256_file(app_path)
+        size = path.getsize(app_path)
+        with self.lock:
+            log = self.make_space(size)
+            free = self.free_space()
+            if free is not None and free - size < self.reserved_space:
+                return None, log + 'Not enough space on the device to cache the apk.\n'
+            remote_path = self.remote_path(apk_hash)
+            # push to a temporary name first, so an interrupted push never ends up as a cache entry
+            tmp_path = remote_path + '.part'
+            (pushed, push_out) = adb_push(app_path, tmp_path, device=self.device_id)
+            log += push_out
+            if pushed:
+                (pushed, mv_out) = adb_shell('mv ' + tmp_path + ' ' + remote_path, device=self.device_id)
+                log += mv_out
+            if not pushed:
+                adb_shell('rm -f ' + tmp_path, device=self.device_id)
+                return None, log
+            self.entries[apk_hash] = [time(), size]
+        return remote_path, log
+
+    def remove(self, app_path: str) -> Tuple[bool, str]:
+        """
+        Removes an apk from the cache.
+        :param app_path: host path of an apk
+        :return: a tuple of the success flag and the collected log output
+        """
+        apk_hash = sha256_file(app_path)
+        with self.lock:
+            self.load()
+            if apk_hash not in self.entries:
+                return True, 'Apk is not cached on the device.'
+            (removed, rm_out) = adb_shell('rm -f ' + self.remote_path(apk_hash), device=self.device_id)
+            if removed:
+                del self.entries[apk_hash]
+        return removed, rm_out
+
+    def load(self) -> None:
+        """
+        Reads the current cache content from the device, unless this already happened. Files of pushes that were
+        interrupted, e.g., by a crash, are removed.
+        """
+        if self.entries is not None:
+            return
+        self.entries = dict()
+        adb_shell('mkdir -p ' + self.cache_dir + '; rm -f ' + path.join(self.cache_dir, '*.part'),
+                  device=self.device_id)
+        # lines look like: <mtime> <size> <path>
+        (success, out) = adb_shell('stat -c "%Y %s %n" ' + path.join(self.cache_dir, '*' + APK_FILE_ENDING),
+                                   device=self.device_id)
+        for line in out.split('\n'):
+            parts = line.strip().split(' ', 2)
+            if len(parts) != 3 or not parts[2].endswith(APK_FILE_ENDING):
+                continue
+            try:
+                apk_hash = path.basename(parts[2])[:-len(APK_FILE_ENDING)]
+                self.entries[apk_hash] = [float(parts[0]), int(parts[1])]
+            except ValueError:
+                continue
+
+    def free_space(self) -> Union[int, None]:
+        """
+        :return: the free space in bytes on the partition of the cache or None if it cannot be determined
+        """
+        (success, out) = adb_shell('df -k ' + self.cache_dir, device=self.device_id)
+        lines = [line for line in out.split('\n') if line.strip()]
+        if not success or len(lines) < 2:
+            return None
+        # Filesystem 1K-blocks Used Available Use% Mounted on
+        columns = lines[-1].split()
+        try:
+            return int(columns[3]) * 1024
+        except (IndexError, ValueError):
+            return None
+
+    def make_space(self, size: int) -> str:
+        """
+        Evicts least recently used apks until an apk of the given size fits without touching the reserve.
+        Expects the lock to be held.
+        :param size: the size of the apk to be added
+        :return: the collected log output
+        """
+        log = ''
+        free = self.free_space()
+        if free is None:
+            return 'Could not determine the free space on the device.\n'
+        for apk_hash, (last_use, entry_size) in sorted(self.entries.items(), key=lambda item: item[1][0]):
+            if free - size >= self.reserved_space:
+                break
+            (removed, rm_out) = adb_shell('rm -f ' + self.remote_path(apk_hash), device=self.device_id)
+            log += 'Evicting ' + apk_hash + ' from the device apk cache.\n' + rm_out
+            del self.entries[apk_hash]
+            free += entry_size
+        return log
@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from typing import Union, Tuple, Dict
+
+from utils.shellutils import adb_exec_out
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class DeviceScript(object):
+    """
+    Composes several shell commands into a single script that is executed on a device with one adb call. Every step
+    runs regardless of the outcome of the previous ones, and its output and exit code are reported separately.
+    """
+
+    # printed after every step, followed by the index and the exit code of the step
+    MARKER = '#monkey-troop-step#'
+
+    def __init__(self, device_id: Union[str, None]=None):
+        """
+        :param device_id: the device to run the script on or None to use the one connected device
+        """
+        self.device_id = device_id
+        # list of (name, command)
+        self.steps = list()
+
+    def add(self, name: str, command: str) -> 'DeviceScript':
+        """
+        Appends a step to the script.
+        :param name: unique name of the step, used to look up its result
+        :param command: the shell command to run on the device
+        :return: the script itself, so that steps can be chained
+        """
+        self.steps.append((name, command))
+        return self
+
+    def build(self) -> str:
+        """
+        :return: the script as a single shell command line
+        """
+        # printf receives the exit code of the step since $? is expanded before it runs.
+        # The leading line break separates the marker from output that does not end with one.
+        return '; '.join(command + " 2>&1; printf '\\n%s %d %d\\n' '" + DeviceScript.MARKER + "' " + str(index) + ' $?'
+                         for index, (name, command) in enumerate(self.steps))
+
+    def run(self) -> Tuple[bool, Dict[str, Tuple[Union[int, None], str]]]:
+        """
+        Executes all steps with a single adb call.
+        :return: a tuple of the success flag of the adb call and a mapping from step names to their exit code and
+        output, in the order of the steps. Steps that did not run, e.g., because the device is gone, have the exit
+        code None
+        """
+        results = OrderedDict((name, (None, '')) for name, command in self.steps)
+        if not self.steps:
+            return True, results
+
+        success, out = adb_exec_out(self.build(), device=self.device_id)
+        step_output = list()
+        for line in out.replace('\r\n', '\n').split('\n'):
+            parts = line.split(' ')
+            if len(parts) == 3 and parts[0] == DeviceScript.MARKER and parts[1].isdigit() \
+                    and parts[2].lstrip('-').isdigit() and int(parts[1]) < len(self.steps):
+                # drop the line break that precedes the marker
+                if step_output and step_output[-1] == '':
+                    step_output.pop()
+                results[self.steps[int(parts[1])][0]] = (int(parts[2]), '\n'.join(step_output))
+                step_output = list()
+            else:
+                step_output.append(line)
+        return success, results
+
+    @staticmethod
+    def succeeded(results: Dict[str, Tuple[Union[int, None], str]], name: str) -> bool:
+        """
+        :param results: the results of a script run
+        :param name: the name of the step
+        :return: whether the step ran and exited with code 0
+        """
+        return results.get(name, (None, ''))[0] == 0
@@ -0,0 +1,25 @@
+from fcntl import flock, LOCK_EX, LOCK_UN
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class FileLock(object):
+    """
+    Exclusive advisory lock based on flock, to be used as a context manager. Since each instance opens the lock file on
+    its own, threads of the same process exclude each other as well.
+    """
+
+    def __init__(self, lock_path: str):
+        self.lock_path = lock_path
+        self.lock_file = None
+
+    def __enter__(self) -> 'FileLock':
+        self.lock_file = open(self.lock_path, 'a')
+        flock(self.lock_file.fileno(), LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        flock(self.lock_file.fileno(), LOCK_UN)
+        self.lock_file.close()
+        self.lock_file = None
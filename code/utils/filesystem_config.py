@@ -1,5 +1,6 @@
 from os import makedirs
 from os.path import realpath, dirname, join, isabs, exists
+from typing import Union
 
 from utils.singleton import Singleton
 
@@ -19,8 +20,9 @@ class FilesystemConfig(object, metaclass=Singleton):
     # defaults for absolute paths
     DEFAULT_TMP = '/tmp'
 
-    def __init__(self, apk: str=DEFAULT_APK, out: str=DEFAULT_OUT, tmp: str=DEFAULT_TMP, lists: str=DEFAULT_LISTS)\
-            -> None:
+    def __init__(self, apk: str=DEFAULT_APK, out: str=DEFAULT_OUT, tmp: str=DEFAULT_TMP, lists: str=DEFAULT_LISTS,
+                 apk_budget: Union[int, None]=None, apk_eviction: str='lru',
+                 apk_reserve: Union[int, None]=None) -> None:
         """
         Initializes the singleton instance with either provided or default values. 
         Note that due to the singleton nature, this method is only invoked exactly once and for subsequent
@@ -33,6 +35,9 @@ class FilesystemConfig(object, metaclass=Singleton):
         :param out: dir for outputs, such as reports and results
         :param tmp: dir for temporary files
         :param lists: search dir for package list files
+        :param apk_budget: maximum size in bytes of the apks managed in the apk dir or None for no limit
+        :param apk_eviction: which apks are removed first if the apk dir runs out of space, 'lru' or 'lfu'
+        :param apk_reserve: free space in bytes that is kept on the volume of the apk dir or None for no reserve
         """
 
         # root/code/utils/filesystem_config.py
@@ -49,6 +54,10 @@ class FilesystemConfig(object, metaclass=Singleton):
         self.report = join(self.out, FilesystemConfig.DEFAULT_REPORT)
         self.result = join(self.out, FilesystemConfig.DEFAULT_RESULT)
 
+        self.apk_budget = apk_budget
+        self.apk_eviction = apk_eviction
+        self.apk_reserve = apk_reserve
+
     def __prepare_path(self, path: str) -> str:
         assert path is not None
         if not isabs(path):
@@ -81,4 +90,25 @@ class FilesystemConfig(object, metaclass=Singleton):
     def get_lists_dir(self) -> str:
         return self.lists
 
+    def get_apk_budget(self) -> Union[int, None]:
+        return self.apk_budget
+
+    def get_apk_eviction(self) -> str:
+        return self.apk_eviction
+
+    def get_apk_reserve(self) -> Union[int, None]:
+        return self.apk_reserve
+
 
+def parse_size(size: str) -> int:
+    """
+    Parses a human-readable size.
+    :param size: number of bytes, optionally followed by K, M, G or T (powers of 1024), e.g., "50G"
+    :return: the size in bytes
+    :raises ValueError: if the size cannot be parsed
+    """
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    size = size.strip().upper().rstrip('B')
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
@@ -0,0 +1,129 @@
+import mmap
+from os import path
+from struct import Struct
+from typing import Dict, Union
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class ProgressCounters(object):
+    """
+    Statistics of an evaluation, kept in a small memory-mapped file next to its summary csv. The report writer updates
+    them in place for every report, while the main process and monitoring tools read them at any time without
+    parsing the results.
+    There is a single writer. Readers detect concurrent updates with a sequence number that is odd while an update is
+    in progress.
+    """
+
+    MAGIC = b'MTPROG01'
+
+    TESTED = 'tested'
+    OUTS = 'outs'
+    FAILS = 'fails'
+    SUCCESSES = 'successes'
+    # size of the summary csv that the counters reflect, used to detect results written without updating the counters
+    SUMMARY_BYTES = 'summary_bytes'
+
+    FIELDS = [TESTED, OUTS, FAILS, SUCCESSES, SUMMARY_BYTES]
+
+    # magic, sequence number and the fields as little-endian 64 bit integers
+    LAYOUT = Struct('<8sQ' + ('q' * len(FIELDS)))
+
+    FILE_SUFFIX = '.progress'
+
+    READ_ATTEMPTS = 1000
+
+    def __init__(self, file_path: str, writable: bool=False):
+        """
+        :param file_path: the counters file, created by writers if it does not exist
+        :param writable: whether the counters are updated through this instance
+        :raises OSError: if a reader cannot open the file
+        """
+        self.file_path = file_path
+        self.writable = writable
+        if writable:
+            with open(file_path, 'ab') as counters_file:
+                # new or truncated files are initialized with zeros
+                if counters_file.tell() < ProgressCounters.LAYOUT.size:
+                    counters_file.truncate(0)
+                    counters_file.write(ProgressCounters.LAYOUT.pack(ProgressCounters.MAGIC, 0,
+                                                                     *([0] * len(ProgressCounters.FIELDS))))
+        with open(file_path, 'r+b' if writable else 'rb') as counters_file:
+            # the mapping stays valid after the file is closed
+            self.map = mmap.mmap(counters_file.fileno(), ProgressCounters.LAYOUT.size,
+                                 access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+
+    @staticmethod
+    def get_path(summary_path: str) -> str:
+        """
+        :param summary_path: the summary csv of an evaluation
+        :return: the path of the corresponding counters file
+        """
+        return summary_path + ProgressCounters.FILE_SUFFIX
+
+    @staticmethod
+    def open_for_summary(summary_path: str) -> Union['ProgressCounters', None]:
+        """
+        :param summary_path: the summary csv of an evaluation
+        :return: the counters of the evaluation for reading or None if there are none
+        """
+        counters_path = ProgressCounters.get_path(summary_path)
+        if not path.isfile(counters_path) or path.getsize(counters_path) < ProgressCounters.LAYOUT.size:
+            return None
+        return ProgressCounters(counters_path)
+
+    def read(self) -> Union[Dict[str, int], None]:
+        """
+        :return: a consistent snapshot of all counters or None if the file is invalid or an update never finished,
+        e.g., because the writer crashed
+        """
+        for attempt in range(ProgressCounters.READ_ATTEMPTS):
+            values = ProgressCounters.LAYOUT.unpack_from(self.map)
+            if values[0] != ProgressCounters.MAGIC:
+                return None
+            sequence = values[1]
+            if sequence % 2 == 0 and ProgressCounters.LAYOUT.unpack_from(self.map)[1] == sequence:
+                return dict(zip(ProgressCounters.FIELDS, values[2:]))
+        return None
+
+    def write(self, counters: Dict[str, int]) -> None:
+        """
+        Replaces the counters.
+        :param counters: new values, missing fields are kept
+        """
+        sequence = ProgressCounters.LAYOUT.unpack_from(self.map)[1]
+        current = self.read_unchecked()
+        current.update(counters)
+        # odd while writing
+        ProgressCounters.LAYOUT.pack_into(self.map, 0, ProgressCounters.MAGIC, sequence + 1,
+                                          *[current[field] for field in ProgressCounters.FIELDS])
+        ProgressCounters.LAYOUT.pack_into(self.map, 0, ProgressCounters.MAGIC, sequence + 2,
+                                          *[current[field] for field in ProgressCounters.FIELDS])
+
+    def add(self, counters: Dict[str, int], summary_bytes: Union[int, None]=None) -> None:
+        """
+        Increments counters.
+        :param counters: increments per field
+        :param summary_bytes: the new size of the summary csv, if it changed
+        """
+        current = self.read_unchecked()
+        for field, increment in counters.items():
+            current[field] += increment
+        if summary_bytes is not None:
+            current[ProgressCounters.SUMMARY_BYTES] = summary_bytes
+        self.write(current)
+
+    def read_unchecked(self) -> Dict[str, int]:
+        # only the writer may skip the consistency check
+        return dict(zip(ProgressCounters.FIELDS, ProgressCounters.LAYOUT.unpack_from(self.map)[2:]))
+
+    def is_consistent(self) -> bool:
+        """
+        :return: whether the file is valid and the last update finished
+        """
+        values = ProgressCounters.LAYOUT.unpack_from(self.map)
+        return values[0] == ProgressCounters.MAGIC and values[1] % 2 == 0
+
+    def close(self) -> None:
+        self.map.close()
@@ -0,0 +1,55 @@
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+
+
+__author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket rate limiter. Tokens are refilled continuously at a fixed rate up to the capacity, so short
+    bursts are allowed while the long-term rate never exceeds the configured one.
+    """
+
+    def __init__(self, rate: float, capacity: int=1):
+        """
+        :param rate: tokens per second. A rate of 0 or less disables the limit
+        :param capacity: maximum number of tokens, i.e., the largest burst
+        """
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.last_refill = monotonic()
+        self.lock = Lock()
+
+    def acquire(self) -> float:
+        """
+        Blocks until a token is available and takes it.
+        :return: the time in seconds spent waiting
+        """
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            sleep(delay)
+            waited += delay
+
+
+def backoff_delay(attempt: int, base: float=1.0, cap: float=60.0) -> float:
+    """
+    Exponential backoff with full jitter, so clients that failed together do not retry in lockstep.
+    :param attempt: the number of the failed attempt, starting with 0
+    :param base: the delay limit after the first failure in seconds
+    :param cap: the maximum delay in seconds
+    :return: the time in seconds to wait before the next attempt
+    """
+    return uniform(0, min(cap, base * (2 ** attempt)))
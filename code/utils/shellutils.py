@@ -1,102 +1,211 @@
-from subprocess import CalledProcessError, check_output, STDOUT
-from typing import Union, Tuple, List
+from asyncio import AbstractEventLoop, TimeoutError as AsyncTimeoutError, create_subprocess_exec, ensure_future, \
+    run_coroutine_threadsafe, wait as wait_futures, wait_for
+from subprocess import DEVNULL, PIPE, STDOUT, Popen, TimeoutExpired
+from threading import Thread
+from time import monotonic
+from typing import Union, Tuple, List, Dict, Callable
 
 
 __author__ = 'Oliver Schranz <oliver.schranz@cispa.saarland>'
 
 
-def adb_install(packagePath: str, string_out: bool = True, reinstall: bool = True, device: Union[str, None] = None) \
-        -> Tuple[bool, str]:
+# seconds after which adb commands are killed, so a hanging device or adb server does not block a worker forever
+ADB_TIMEOUT = 5 * 60
+# apk installations and file transfers take longer, especially for large apks
+ADB_TRANSFER_TIMEOUT = 20 * 60
+
+
+def adb_install(packagePath: str, string_out: bool = True, reinstall: bool = True, device: Union[str, None] = None,
+                options: List[str] = list(), timeout: Union[float, None]=ADB_TRANSFER_TIMEOUT) -> Tuple[bool, str]:
     """
     Install an application on a specific device.
     :param packagePath: full path to the android apk package
     :param string_out: whether the collected output should be decoded to a regular string
     :param reinstall: whether to force reinstall with the -r flag
     :param device: the device to run the command on or None to use the one connected device
+    :param options: additional install options, e.g., --streaming
+    :param timeout: seconds after which the command is killed, None to wait forever
     :return: a tuple of the success flag and the collected log output of the execution
     """
-    command = 'adb ' \
-              + (('-s ' + device + ' ') if device is not None else '') \
-              + 'install ' \
-              + ('-r ' if reinstall else ' ') \
-              + packagePath
-    return shell(command, string_out=string_out)
+    argv = adb_argv(device) + ['install'] + (['-r'] if reinstall else []) + options + [packagePath]
+    return execute(argv, string_out=string_out, timeout=timeout)
 
 
-def adb_uninstall(packageName: str, string_out: bool=True, device: Union[str, None]=None) -> Tuple[bool, str]:
+def adb_install_multiple(packagePaths: List[str], string_out: bool = True, reinstall: bool = True,
+                         device: Union[str, None] = None, options: List[str] = list(),
+                         timeout: Union[float, None]=ADB_TRANSFER_TIMEOUT) -> Tuple[bool, str]:
+    """
+    Install an application that consists of several apks (base apk and splits) in a single install session.
+    :param packagePaths: full paths to the android apk packages, base apk first
+    :param string_out: whether the collected output should be decoded to a regular string
+    :param reinstall: whether to force reinstall with the -r flag
+    :param device: the device to run the command on or None to use the one connected device
+    :param options: additional install options, e.g., --streaming
+    :param timeout: seconds after which the command is killed, None to wait forever
+    :return: a tuple of the success flag and the collected log output of the execution
+    """
+    argv = adb_argv(device) + ['install-multiple'] + (['-r'] if reinstall else []) + options + packagePaths
+    return execute(argv, string_out=string_out, timeout=timeout)
+
+
+def adb_uninstall(packageName: str, string_out: bool=True, device: Union[str, None]=None,
+                  timeout: Union[float, None]=ADB_TIMEOUT) -> Tuple[bool, str]:
     """
        Uninstall an application on a specific device.
        :param packagePath: full path to the android apk package
        :param string_out: whether the collected output should be decoded to a regular string
        :param device: the device to run the command on or None to use the one connected device
+       :param timeout: seconds after which the command is killed, None to wait forever
        :return: a tuple of the success flag and the collected log output of the execution
        """
-    command = 'adb' \
-              + ((' -s ' + device + '') if device is not None else '') \
-              + ' uninstall ' \
-              + packageName
-    return shell(command, string_out=string_out)
+    return execute(adb_argv(device) + ['uninstall', packageName], string_out=string_out, timeout=timeout)
+
+
+def adb_clear_app_data(packageName: str, string_out: bool=True, device: Union[str, None]=None,
+                       timeout: Union[float, None]=ADB_TIMEOUT) -> Tuple[bool, str]:
+    """
+    Delete all data associated with an installed application, leaving the app in the state of a fresh installation.
+    :param packageName: the package of the application
+    :param string_out: whether the collected output should be decoded to a regular string
+    :param device: the device to run the command on or None to use the one connected device
+    :param timeout: seconds after which the command is killed, None to wait forever
+    :return: a tuple of the success flag and the collected log output of the execution
+    """
+    (success, out) = adb_shell('pm clear ' + packageName, string_out=string_out, device=device, timeout=timeout)
+    # older adb versions do not forward the exit code of shell commands, so we check the output as well
+    return success and 'Success' in str(out), out
 
 
-def adb_shell(command: str, string_out: bool=True, device: Union[str, None]=None) -> Tuple[bool, str]:
+def adb_shell(command: str, string_out: bool=True, device: Union[str, None]=None,
+              timeout: Union[float, None]=ADB_TIMEOUT) -> Tuple[bool, str]:
     """
     Issue shell commands on specific devices.
     :param command: the command to execute
     :param string_out: whether the collected output should be decoded to a regular string
     :param device: the device to run the command on or None to use the one connected device
+    :param timeout: seconds after which the command is killed, None to wait forever
     :return: a tuple of the success flag and the collected log output of the execution
     """
-    cmd = 'adb' \
-          + ((' -s ' + device) if device is not None else '') \
-          + ' shell ' \
-          + command
-    return shell(cmd, string_out=string_out)
+    # adb joins its arguments with spaces and passes them to the shell of the device, so the command stays in one piece
+    return execute(adb_argv(device) + ['shell', command], string_out=string_out, timeout=timeout)
 
 
-def adb_pull(filepath: str, destination: str, string_out: bool=True, device: Union[str, None]=None) -> Tuple[bool, str]:
+def adb_exec_out(command: str, string_out: bool=True, device: Union[str, None]=None,
+                 timeout: Union[float, None]=ADB_TIMEOUT) -> Tuple[bool, str]:
+    """
+    Execute a command on a specific device and return its raw output. In contrast to adb_shell, no pseudo terminal is
+    involved, so the output is not mangled (e.g., line endings), which makes it suitable to read files into memory.
+    :param command: the command to execute
+    :param string_out: whether the collected output should be decoded to a regular string
+    :param device: the device to run the command on or None to use the one connected device
+    :param timeout: seconds after which the command is killed, None to wait forever
+    :return: a tuple of the success flag and the collected output of the execution
+    """
+    return execute(adb_argv(device) + ['exec-out', command], string_out=string_out, timeout=timeout)
+
+
+def adb_pull(filepath: str, destination: str, string_out: bool=True, device: Union[str, None]=None,
+             timeout: Union[float, None]=ADB_TRANSFER_TIMEOUT) -> Tuple[bool, str]:
     """
     Pull a file from a specific device.
     :param filepath: the path of the file on the device
     :param destination: the host path to store the file to
     :param string_out: whether the collected output should be decoded to a regular string
     :param device: the device to run the command on or None to use the one connected device
+    :param timeout: seconds after which the command is killed, None to wait forever
     :return: a tuple of the success flag and the collected log output of the execution
     """
 
-    cmd = 'adb' \
-          + ((' -s ' + device) if device is not None else '') \
-          + ' pull ' \
-          + filepath + ' ' + destination
-    return shell(cmd, string_out=string_out)
+    return execute(adb_argv(device) + ['pull', filepath, destination], string_out=string_out, timeout=timeout)
 
 
-def adb_logcat_clear(device: Union[str, None]=None) -> Tuple[bool, str]:
+def adb_push(filepath: str, destination: str, string_out: bool=True, device: Union[str, None]=None,
+             timeout: Union[float, None]=ADB_TRANSFER_TIMEOUT) -> Tuple[bool, str]:
+    """
+    Push a file to a specific device.
+    :param filepath: the host path of the file
+    :param destination: the path on the device to store the file to
+    :param string_out: whether the collected output should be decoded to a regular string
+    :param device: the device to run the command on or None to use the one connected device
+    :param timeout: seconds after which the command is killed, None to wait forever
+    :return: a tuple of the success flag and the collected log output of the execution
+    """
+
+    return execute(adb_argv(device) + ['push', filepath, destination], string_out=string_out, timeout=timeout)
+
+
+def adb_install_remote(remotePath: str, string_out: bool = True, reinstall: bool = True,
+                       device: Union[str, None] = None,
+                       timeout: Union[float, None]=ADB_TRANSFER_TIMEOUT, touch: bool=False) -> Tuple[bool, str]:
+    """
+    Install an application from an apk file that is already stored on the device.
+    :param remotePath: full path to the android apk package on the device
+    :param string_out: whether the collected output should be decoded to a regular string
+    :param reinstall: whether to force reinstall with the -r flag
+    :param device: the device to run the command on or None to use the one connected device
+    :param timeout: seconds after which the command is killed, None to wait forever
+    :param touch: whether to update the modification time of the apk file in the same shell command, e.g., to keep
+    track of its last use
+    :return: a tuple of the success flag and the collected log output of the execution
+    """
+    command = 'pm install ' + ('-r ' if reinstall else '') + remotePath
+    if touch:
+        # the exit code is the one of pm, no matter whether touching the file worked
+        command = 'touch ' + remotePath + '; ' + command
+    (success, out) = adb_shell(command, string_out=string_out, device=device, timeout=timeout)
+    # older adb versions do not forward the exit code of shell commands, so we check the output as well
+    return success and 'Success' in str(out), out
+
+
+def adb_logcat_clear(device: Union[str, None]=None, timeout: Union[float, None]=ADB_TIMEOUT) -> Tuple[bool, str]:
     """
     Clear logcat.
     :param device: the device to run the command on or None to use the one connected device
+    :param timeout: seconds after which the command is killed, None to wait forever
     :return: a tuple of the success flag and the collected log output of the execution
     """
-    device_str = ' -s ' + device + ' ' if device is not None else ' '
-    return shell('adb' + device_str + 'logcat -c')
+    return execute(adb_argv(device) + ['logcat', '-c'], timeout=timeout)
 
 
-def adb_logcat_dump(device: Union[str, None]=None) -> Tuple[bool, str]:
+def adb_logcat_dump(device: Union[str, None]=None, timeout: Union[float, None]=ADB_TIMEOUT) -> Tuple[bool, str]:
     """
     Dump the current content of logcat since the last clear.
     :param device: the device to run the command on or None to use the one connected device
+    :param timeout: seconds after which the command is killed, None to wait forever
     :return: a tuple of the success flag and the collected log output of the execution
     """
-    device_str = ' -s ' + device + ' ' if device is not None else ' '
-    return shell('adb' + device_str + 'logcat -d')
+    return execute(adb_argv(device) + ['logcat', '-d'], timeout=timeout)
+
+
+def adb_getprop(device: Union[str, None]=None, timeout: Union[float, None]=ADB_TIMEOUT) -> Tuple[bool, Dict[str, str]]:
+    """
+    Read all system properties of a device at once.
+    :param device: the device to run the command on or None to use the one connected device
+    :param timeout: seconds after which the command is killed, None to wait forever
+    :return: a tuple of the success flag and a mapping from property names to values
+    """
+    properties = dict()
+    succ, out = adb_shell('getprop', device=device, timeout=timeout)
+    if not succ:
+        return False, properties
+    # lines look like: [ro.product.cpu.abilist]: [arm64-v8a,armeabi-v7a,armeabi]
+    for line in out.split('\n'):
+        line = line.strip()
+        if not line.startswith('[') or ']: [' not in line or not line.endswith(']'):
+            continue
+        key, value = line[1:-1].split(']: [', 1)
+        properties[key] = value
+    return True, properties
 
 
-def list_devices() -> Union[List[str], None]:
+def list_devices(timeout: Union[float, None]=ADB_TIMEOUT) -> Union[List[str], None]:
     """
     List all devices currently available via adb
+    :param timeout: seconds after which the command is killed, None to wait forever
     :return: list of available device identifiers for success or None for failure
     """
     devices = list()
-    succ, out = shell("adb devices")
+    succ, out = execute(['adb', 'devices'], timeout=timeout)
     if not succ:
         return None
     lines = out.split('\n')[1:]  # ignore first line
@@ -112,19 +221,225 @@ def list_devices() -> Union[List[str], None]:
     return devices
 
 
-def shell(command: str, string_out: bool=True) -> Tuple[bool, str]:
+def adb_argv(device: Union[str, None]=None) -> List[str]:
+    """
+    :param device: the device to run the command on or None to use the one connected device
+    :return: the arguments that start an adb command for the device
     """
-    Executes a shell command.
+    return ['adb'] + (['-s', device] if device is not None else [])
+
+
+def shell(command: str, string_out: bool=True, timeout: Union[float, None]=None) -> Tuple[bool, str]:
+    """
+    Executes a shell command. The command is split into arguments at single spaces, so prefer execute for arguments
+    that might contain spaces.
     :param command: the command to execute
     :param string_out: whether the collected output should be decoded to a regular string
+    :param timeout: seconds after which the command is killed, None to wait forever
     :return: a tuple of the success flag and the collected log output of the execution
     """
     # print('COMMAND: ' + command)
+    return execute(command.split(" "), string_out=string_out, timeout=timeout)
+
+
+def execute(argv: List[str], string_out: bool=True, timeout: Union[float, None]=None) -> Tuple[bool, str]:
+    """
+    Executes a command with the given arguments, without involving a shell.
+    :param argv: the program and its arguments
+    :param string_out: whether the collected output should be decoded to a regular string
+    :param timeout: seconds after which the command is killed, None to wait forever
+    :return: a tuple of the success flag and the collected log output (stdout and stderr) of the execution
+    """
+    result = run(argv, timeout=timeout)
+    return result.succeeded(), result.out if not string_out else result.decode_out()
+
+
+class CommandResult(object):
+    """
+    Outcome and resource usage of an executed command.
+    """
+
+    def __init__(self, argv: List[str]):
+        self.argv = argv
+        # negative if the command was killed by a signal, e.g., after a timeout
+        self.exit_code = None
+        self.timed_out = False
+        # wall clock time in seconds
+        self.duration = 0.0
+        # captured output, limited to the last bytes of each stream. stderr is part of out if it was merged
+        self.out = b''
+        self.err = b''
+        # number of bytes the command wrote, including the ones that were not captured
+        self.out_bytes = 0
+        self.err_bytes = 0
+        # exceptions raised by the output callbacks, which are not called anymore afterwards
+        self.callback_errors = list()
+
+    def succeeded(self) -> bool:
+        return self.exit_code == 0 and not self.timed_out
+
+    def truncated(self) -> bool:
+        return self.out_bytes > len(self.out) or self.err_bytes > len(self.err)
+
+    def decode_out(self) -> str:
+        # truncation might have cut a multi-byte character in half
+        return self.out.decode(errors='replace')
+
+    def decode_err(self) -> str:
+        return self.err.decode(errors='replace')
+
+    def __str__(self):
+        return ' '.join(self.argv) + ': exit code ' + str(self.exit_code) \
+               + (' (timed out)' if self.timed_out else '') \
+               + ', ' + ('%.3f' % self.duration) + 's, ' + str(self.out_bytes) + ' bytes out, ' \
+               + str(self.err_bytes) + ' bytes err' \
+               + ''.join(', callback failed: ' + repr(error) for error in self.callback_errors)
+
+
+# output captured per stream, e.g., logcat dumps
+MAX_OUTPUT = 64 * 1024 * 1024
+# chunk size for reading output
+READ_SIZE = 64 * 1024
+
+# event loop that executes the commands of all workers, see set_command_loop
+command_loop = None
+
+
+def set_command_loop(loop: Union[AbstractEventLoop, None]) -> None:
+    """
+    Executes all following commands on an event loop that runs in another thread, so that many threads can drive
+    devices without a reader thread per command. Commands must not be run from the thread of the loop itself.
+    :param loop: the event loop or None to execute commands in the calling thread again
+    """
+    global command_loop
+    command_loop = loop
+
+
+class OutputCapture(object):
+    """
+    Collects the output of a stream, keeping only the last bytes.
+    """
+
+    def __init__(self, max_output: int, callback: Union[Callable[[bytes], None], None]=None):
+        self.max_output = max_output
+        self.callback = callback
+        self.buffer = bytearray()
+        self.count = 0
+        self.callback_error = None
+
+    def add(self, chunk: bytes) -> None:
+        self.count += len(chunk)
+        if self.callback is not None:
+            try:
+                self.callback(chunk)
+            except Exception as callback_error:
+                # the output is still drained, otherwise the command blocks on a full pipe
+                self.callback_error = callback_error
+                self.callback = None
+        self.buffer.extend(chunk)
+        if len(self.buffer) > self.max_output:
+            del self.buffer[:len(self.buffer) - self.max_output]
+
+
+def finish_result(result: CommandResult, start: float, out: OutputCapture, err: OutputCapture) -> CommandResult:
+    result.duration = monotonic() - start
+    result.out = bytes(out.buffer)
+    result.err = bytes(err.buffer)
+    result.out_bytes = out.count
+    result.err_bytes = err.count
+    result.callback_errors = [capture.callback_error for capture in [out, err] if capture.callback_error is not None]
+    return result
+
+
+def run(argv: List[str], timeout: Union[float, None]=None, merge_err: bool=True,
+        on_out: Union[Callable[[bytes], None], None]=None, on_err: Union[Callable[[bytes], None], None]=None,
+        max_output: int=MAX_OUTPUT, cwd: Union[str, None]=None) -> CommandResult:
+    """
+    Executes a command with the given arguments, without involving a shell, and collects its output while it runs.
+    :param argv: the program and its arguments
+    :param timeout: seconds after which the command is killed, None to wait forever
+    :param merge_err: whether stderr is merged into stdout, keeping the order of both
+    :param on_out: called with every chunk of stdout as soon as it is read, from another thread
+    :param on_err: called with every chunk of stderr as soon as it is read, from another thread. Unused if stderr
+    is merged
+    :param max_output: the number of bytes that are captured per stream, older output is dropped first
+    :param cwd: the working directory of the command
+    :return: the result of the execution
+    """
+    loop = command_loop
+    if loop is not None:
+        return run_coroutine_threadsafe(run_async(argv, timeout, merge_err, on_out, on_err, max_output, cwd),
+                                        loop).result()
+
+    result = CommandResult(argv)
+    start = monotonic()
+    process = Popen(argv, stdin=DEVNULL, stdout=PIPE, stderr=STDOUT if merge_err else PIPE, cwd=cwd)
+    out = OutputCapture(max_output, on_out)
+    err = OutputCapture(max_output, on_err)
+
+    def read(stream, capture: OutputCapture) -> None:
+        while True:
+            chunk = stream.read1(READ_SIZE)
+            if not chunk:
+                break
+            capture.add(chunk)
+        stream.close()
+
+    readers = [Thread(target=read, args=(process.stdout, out), daemon=True)]
+    if not merge_err:
+        readers.append(Thread(target=read, args=(process.stderr, err), daemon=True))
+    for reader in readers:
+        reader.start()
+
+    try:
+        result.exit_code = process.wait(timeout=timeout)
+    except TimeoutExpired:
+        result.timed_out = True
+        process.kill()
+        result.exit_code = process.wait()
+
+    for reader in readers:
+        # processes that were started by the command (e.g., the adb server) might keep the pipes open
+        reader.join(timeout=1.0 if result.timed_out else None)
+
+    return finish_result(result, start, out, err)
+
+
+async def run_async(argv: List[str], timeout: Union[float, None]=None, merge_err: bool=True,
+                    on_out: Union[Callable[[bytes], None], None]=None,
+                    on_err: Union[Callable[[bytes], None], None]=None,
+                    max_output: int=MAX_OUTPUT, cwd: Union[str, None]=None) -> CommandResult:
+    """
+    Coroutine version of run, for commands that are executed on an event loop. Callbacks are called on the loop.
+    """
+    result = CommandResult(argv)
+    start = monotonic()
+    process = await create_subprocess_exec(*argv, stdin=DEVNULL, stdout=PIPE, stderr=STDOUT if merge_err else PIPE,
+                                           cwd=cwd)
+    out = OutputCapture(max_output, on_out)
+    err = OutputCapture(max_output, on_err)
+
+    async def read(stream, capture: OutputCapture) -> None:
+        while True:
+            chunk = await stream.read(READ_SIZE)
+            if not chunk:
+                break
+            capture.add(chunk)
+
+    readers = [ensure_future(read(process.stdout, out))]
+    if not merge_err:
+        readers.append(ensure_future(read(process.stderr, err)))
+
     try:
-        out = check_output(command.split(" "), stderr=STDOUT)
-        resultcode = 0
-    except CalledProcessError as e:
-        out = e.output
-        resultcode = e.returncode
+        result.exit_code = await wait_for(process.wait(), timeout)
+    except AsyncTimeoutError:
+        result.timed_out = True
+        process.kill()
+        result.exit_code = await process.wait()
+
+    # processes that were started by the command (e.g., the adb server) might keep the pipes open
+    done, pending = await wait_futures(readers, timeout=1.0 if result.timed_out else None)
+    for reader in pending:
+        reader.cancel()
 
-    return resultcode == 0, out if not string_out else out.decode()
+    return finish_result(result, start, out, err)
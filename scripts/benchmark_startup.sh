@@ -0,0 +1,27 @@
+#!/usr/bin/env bash
+
+# Measures how long it takes to start the entry points, i.e., to import them without running anything.
+# Usage: ./scripts/benchmark_startup.sh [RUNS]
+
+RUNS=${1:-10}
+
+# the breakdown of the slowest imports requires python 3.7 or later, the timing of the entry points works everywhere
+python3 -c 'import sys; sys.exit(sys.version_info < (3, 7))'
+IMPORTTIME=$?
+
+cd code || exit 1
+for ENTRY in main analyze download; do
+    START=$(date +%s%N)
+    for i in $(seq "$RUNS"); do
+        python3 -c "import $ENTRY" > /dev/null || exit 1
+    done
+    END=$(date +%s%N)
+    echo "$ENTRY.py: $(( (END - START) / RUNS / 1000000 )) ms (average of $RUNS runs)"
+
+    if [ "$IMPORTTIME" -eq 0 ]; then
+        echo 'slowest imports (cumulative us):'
+        python3 -X importtime -c "import $ENTRY" 2>&1 > /dev/null | grep -v 'import time: self' \
+            | sort -t '|' -k 2 -n -r | head -n 5
+    fi
+    echo
+done